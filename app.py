@@ -1,91 +1,151 @@
-from flask import Flask, render_template, Response, jsonify
+from flask import Flask, render_template, Response, jsonify, request, send_file, abort
 import cv2
 import yaml
-import threading
-import queue
-import numpy as np
+import time
 from datetime import datetime
 import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from frame_hub import FrameHub
+from connection_supervisor import supervisor
+from mjpeg_broadcaster import MJPEGBroadcaster, multipart_frame
+from grid_compositor import GridCompositor, MosaicFeed
+from recording_index import RecordingIndex
+from retention import build_retention
+from metrics import metrics
+from recorder import camera_slug
+from passthrough_recorder import render_playback
+from config_loader import load_config, get_setting
+from pipeline_config import PipelineConfig
+from ai_processor import AIProcessor
+from detector_backends import DetectorRouter, NullBackend, dnn_backend
+from event_stream import EventBus, CameraEventSource, sse_stream
+from tracker import IoUTracker
 
 app = Flask(__name__)
 
 # Load configuration
 with open('config.yaml', 'r') as file:
     config = yaml.safe_load(file)
+# Settings shared with src/main.py (connection, recording path and storage)
+defaults = load_config()
+
+metrics.configure(enabled=config['server'].get('metrics', True))
+supervisor.configure(**(get_setting(defaults, 'connection') or {}))
+# Each camera's resolved pipeline, so motion here matches the recorder's
+pipelines = PipelineConfig(defaults, config)
+
+def haar_backend():
+    """Haar/HOG detectors with the same global and per-camera settings as src/main.py"""
+    processor = AIProcessor(
+        motion_settings={key: value for key, value in pipelines.defaults['motion'].items() if key != 'enabled'},
+        detector_settings={stage: pipelines.defaults[stage] for stage in ('faces', 'people', 'motion')}
+    )
+    for cam_config in config['cameras']:
+        processor.configure_camera(cam_config['name'], pipelines.camera(cam_config['url']))
+    return processor
+
+# Cameras only get an object detector if their config asks for one ('dnn'
+# for the ai_settings model, 'haar' for Haar/HOG); motion always runs
+detectors = DetectorRouter(
+    {'none': NullBackend()},
+    {'dnn': lambda: dnn_backend(config['ai_settings']), 'haar': haar_backend},
+    default='none',
+    fallback='none'
+)
+
+# Push stream of detection, track, motion and connection events at /events
+event_settings = config['server'].get('events', {})
+event_bus = EventBus(max_queue=event_settings.get('max_queue', 256),
+                     max_lag=event_settings.get('max_lag', 30))
 
-class CameraStream:
-    def __init__(self, camera_config):
-        self.name = camera_config['name']
-        self.url = camera_config['url']
-        self.enabled = camera_config['enabled']
-        self.frame_queue = queue.Queue(maxsize=10)
-        self.stopped = False
-        
-    def start(self):
-        if self.enabled:
-            threading.Thread(target=self._capture, daemon=True).start()
-        return self
-    
-    def _capture(self):
-        cap = cv2.VideoCapture(self.url)
-        while not self.stopped:
-            ret, frame = cap.read()
-            if ret:
-                if not self.frame_queue.empty():
-                    try:
-                        self.frame_queue.get_nowait()
-                    except queue.Empty:
-                        pass
-                self.frame_queue.put(frame)
-            else:
-                print(f"Failed to read frame from {self.name}")
-                break
-        cap.release()
-    
-    def read(self):
-        return self.frame_queue.get() if not self.frame_queue.empty() else None
-    
-    def stop(self):
-        self.stopped = True
-
-class AIProcessor:
-    def __init__(self, ai_config):
-        self.confidence_threshold = ai_config['confidence_threshold']
-        # Initialize your AI model here
-        # This is a placeholder for actual AI model initialization
-        print("AI Model initialized")
-    
-    def process_frame(self, frame):
-        # Placeholder for AI processing
-        # Add your model inference code here
-        processed_frame = frame.copy()
-        cv2.putText(processed_frame, f"Processed: {datetime.now()}", 
-                    (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        return processed_frame
-
-# Initialize cameras and AI processor
 cameras = {}
+broadcasters = {}
+event_sources = {}
 for cam_config in config['cameras']:
     if cam_config['enabled']:
-        cameras[cam_config['name']] = CameraStream(cam_config).start()
-
-ai_processor = AIProcessor(config['ai_settings'])
-
-def generate_frames(camera_name):
-    while True:
-        camera = cameras.get(camera_name)
-        if camera:
-            frame = camera.read()
-            if frame is not None:
-                # Process frame with AI
-                processed_frame = ai_processor.process_frame(frame)
-                
-                # Convert to jpeg for streaming
-                ret, buffer = cv2.imencode('.jpg', processed_frame)
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        name = cam_config['name']
+        hub = FrameHub(name, cam_config['url']).start()
+        cameras[name] = hub
+        detector = detectors.assign(name, cam_config.get('detector'))
+        pipeline = pipelines.camera(cam_config['url'])
+        # One low-rate analysis per camera feeds both the event stream and
+        # the boxes drawn on the video, so streaming never runs detectors
+        event_sources[name] = CameraEventSource(
+            name,
+            hub,
+            event_bus,
+            None if detector == 'none' else lambda frame, name=name: detectors.analyze_batch([(name, None, frame)])[0],
+            IoUTracker() if event_settings.get('tracking', True) else None,
+            fps=event_settings.get('fps', 5),
+            width=event_settings.get('width', 640),
+            motion_settings={key: value for key, value in pipeline['motion'].items() if key != 'enabled'},
+            exclusion_zones=pipeline['exclusion_zones']
+        ).start()
+        broadcasters[name] = MJPEGBroadcaster(
+            hub,
+            lambda frame, name=name: event_sources[name].overlays(),
+            default_quality=config['server'].get('jpeg_quality', 80)
+        ).start()
+
+# Combined view of every camera, composited once and shared by all viewers
+mosaic_settings = config['server'].get('mosaic', {})
+mosaic_hub = FrameHub('mosaic', None)
+mosaic_feed = MosaicFeed(
+    cameras,
+    mosaic_hub,
+    GridCompositor(cell_size=(mosaic_settings.get('cell_width', 640), mosaic_settings.get('cell_height', 360))),
+    max_fps=mosaic_settings.get('max_fps', 10),
+    overlays=lambda name, packet: event_sources[name].overlays(),
+    # Idle until a /mosaic client connects (threaded or async)
+    active=lambda: mosaic_broadcaster.viewers > 0
+).start()
+mosaic_broadcaster = MJPEGBroadcaster(
+    mosaic_hub,
+    default_quality=config['server'].get('jpeg_quality', 80),
+    max_width=3840,
+    overlays=False
+).start()
+
+recording_dir = Path(get_setting(defaults, 'system.recording_path', 'recordings')).resolve()
+recording_index = RecordingIndex(recording_dir)
+# Read-only here: the surveillance process runs the retention service itself
+storage = build_retention(recording_index, recording_dir, defaults)
+camera_ids = {cam['name']: camera_slug(cam['url']) for cam in config['cameras']}
+
+CLIP_MIMETYPES = {
+    '.avi': 'video/x-msvideo',
+    '.mkv': 'video/x-matroska',
+    '.mp4': 'video/mp4'
+}
+
+def parse_time(value):
+    """Accept unix seconds or an ISO-8601 timestamp"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def time_range_args():
+    camera = request.args.get('camera')
+    try:
+        return (camera_ids.get(camera, camera),
+                parse_time(request.args.get('start')),
+                parse_time(request.args.get('end')))
+    except ValueError:
+        abort(400, 'start and end must be unix seconds or ISO-8601 timestamps')
+
+def generate_frames(camera_name, width=None, quality=None):
+    # AI processing and JPEG encoding run once per source frame and are
+    # shared by every client asking for the same width/quality
+    broadcaster = broadcasters.get(camera_name)
+    if broadcaster is None:
+        return iter(())
+    return broadcaster.stream(width, quality)
 
 @app.route('/')
 def index():
@@ -94,18 +154,154 @@ def index():
 @app.route('/video_feed/<camera_name>')
 def video_feed(camera_name):
     if camera_name in cameras:
-        return Response(generate_frames(camera_name),
+        return Response(generate_frames(camera_name,
+                                        request.args.get('w', type=int),
+                                        request.args.get('q', type=int)),
                        mimetype='multipart/x-mixed-replace; boundary=frame')
     return "Camera not found", 404
 
+@app.route('/snapshot/<camera_name>')
+def snapshot(camera_name):
+    broadcaster = broadcasters.get(camera_name)
+    if broadcaster is None:
+        return "Camera not found", 404
+    data = broadcaster.snapshot(request.args.get('w', type=int), request.args.get('q', type=int))
+    if not data:
+        return "No frame available", 404
+    return Response(data, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/mosaic')
+def mosaic_feed_route():
+    return Response(mosaic_broadcaster.stream(request.args.get('w', type=int),
+                                              request.args.get('q', type=int)),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
 @app.route('/cameras')
 def get_cameras():
-    return jsonify({name: {'enabled': not cam.stopped} 
-                   for name, cam in cameras.items()})
+    states = supervisor.states()
+    return jsonify({name: dict(states.get(name, {'state': cam.state}), enabled=not cam.stopped)
+                    for name, cam in cameras.items()})
+
+@app.route('/events')
+def events():
+    # ?camera= and ?type= may be repeated to narrow the stream
+    subscription = event_bus.subscribe(request.args.getlist('camera') or None,
+                                       request.args.getlist('type') or None)
+    return Response(sse_stream(event_bus, subscription, event_settings.get('keepalive', 15)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/recordings/events')
+def recording_events():
+    camera, start, end = time_range_args()
+    return jsonify(recording_index.query_events(
+        camera, start, end,
+        event_type=request.args.get('type'),
+        label=request.args.get('label'),
+        limit=request.args.get('limit', 1000, type=int)
+    ))
+
+@app.route('/recordings/segments')
+def recording_segments():
+    camera, start, end = time_range_args()
+    return jsonify(recording_index.query_segments(
+        camera, start, end, limit=request.args.get('limit', 1000, type=int)
+    ))
+
+@app.route('/recordings/motion')
+def recording_motion():
+    camera, start, end = time_range_args()
+    if camera is None or start is None or end is None:
+        abort(400, 'camera, start and end are required')
+    return jsonify(recording_index.motion_scores(camera, start, end))
+
+@app.route('/recordings/usage')
+def recording_usage():
+    return jsonify(storage.usage())
+
+@app.route('/recordings/locate')
+def locate_recording():
+    """Find the clip covering a moment and the offset to seek to within it"""
+    camera, _, _ = time_range_args()
+    try:
+        ts = parse_time(request.args.get('ts'))
+    except ValueError:
+        abort(400, 'ts must be unix seconds or an ISO-8601 timestamp')
+    if camera is None or ts is None:
+        abort(400, 'camera and ts are required')
+    segment = recording_index.segment_at(camera, ts)
+    if segment is None:
+        return jsonify({'error': 'No recording at that time'}), 404
+    offset = ts - segment['start_ts']
+    result = {
+        'segment': segment,
+        'offset': offset,
+        'url': f"/recordings/clip/{segment['id']}#t={offset:.1f}"
+    }
+    if segment['mode'] == 'passthrough':
+        result['playback_url'] = f"/recordings/playback/{segment['id']}?t={offset:.1f}"
+    return jsonify(result)
+
+@app.route('/recordings/clip/<int:segment_id>')
+def recording_clip(segment_id):
+    # send_file honours HTTP Range requests, so players can seek anywhere in
+    # the clip and only the requested bytes are read from disk
+    _, path = segment_path(segment_id)
+    return send_file(path, mimetype=CLIP_MIMETYPES.get(path.suffix, 'application/octet-stream'),
+                     conditional=True)
+
+def segment_path(segment_id):
+    segment = recording_index.get_segment(segment_id)
+    if segment is None:
+        abort(404)
+    path = Path(segment['path']).resolve()
+    if recording_dir not in path.parents or not path.exists():
+        abort(404)
+    return segment, path
+
+def generate_playback(path, offset, quality):
+    # Paced to the recording's own timestamps, so it plays at real speed
+    started = last = None
+    for timestamp, frame in render_playback(path, offset=offset):
+        if started is None:
+            started, last = time.time(), timestamp
+        delay = (timestamp - last) - (time.time() - started)
+        if delay > 0:
+            time.sleep(delay)
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            yield multipart_frame(jpeg.tobytes())
+
+@app.route('/recordings/playback/<int:segment_id>')
+def recording_playback(segment_id):
+    """A passthrough segment as MJPEG with its sidecar events drawn on top"""
+    segment, path = segment_path(segment_id)
+    if segment['mode'] != 'passthrough':
+        abort(400, 'Transcoded clips already have overlays; use /recordings/clip')
+    return Response(generate_playback(path, request.args.get('t', 0.0, type=float),
+                                      request.args.get('q', config['server'].get('jpeg_quality', 80), type=int)),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
 if __name__ == '__main__':
-    app.run(
-        host=config['server']['host'],
-        port=config['server']['port'],
-        debug=config['server']['debug']
-    )
+    if config['server'].get('mode', 'threaded') == 'async':
+        # Video, snapshots and events on one event loop; other routes still go to Flask
+        from async_server import AsyncStreamingServer
+        AsyncStreamingServer(
+            app,
+            broadcasters,
+            mosaic_broadcaster,
+            event_bus,
+            keepalive=event_settings.get('keepalive', 15),
+            encode_workers=config['server'].get('encode_workers', 4)
+        ).run(config['server']['host'], config['server']['port'])
+    else:
+        app.run(
+            host=config['server']['host'],
+            port=config['server']['port'],
+            debug=config['server']['debug'],
+            threaded=True
+        )
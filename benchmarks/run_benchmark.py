@@ -0,0 +1,411 @@
+"""Offline benchmarks for the analysis, display and streaming paths.
+
+Frames come from a synthetic generator or from local video files, so no
+camera or network is needed. Each case runs in a fresh subprocess by default
+so CPU time and peak RSS belong to that case alone.
+
+    python benchmarks/run_benchmark.py --resolutions 720p 1080p --cameras 1 4 16
+    python benchmarks/run_benchmark.py --video sample.mp4 --scenarios motion grid
+    python benchmarks/run_benchmark.py --compare benchmarks/results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import resource
+import threading
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'src'))
+
+import cv2
+import numpy as np
+from ai_processor import AIProcessor
+from detections import Detection
+from frame_hub import FrameHub
+from mjpeg_broadcaster import MJPEGBroadcaster
+from grid_compositor import GridCompositor
+from detector_backends import DnnBackend
+from dnn_fixture import write_test_model
+
+RESOLUTIONS = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160)
+}
+SCENARIOS = ('motion', 'analyze', 'dnn', 'grid', 'mjpeg')
+POOL_SIZE = 32
+
+
+class SyntheticSource:
+    """Noisy static background with a few moving boxes, pre-rendered into a frame pool"""
+
+    def __init__(self, size, pool_size=POOL_SIZE, seed=0):
+        width, height = size
+        rng = np.random.default_rng(seed)
+        background = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+        cv2.GaussianBlur(background, (0, 0), 3, dst=background)
+        self.frames = []
+        box = max(16, height // 8)
+        for i in range(pool_size):
+            frame = background.copy()
+            for k in range(3):
+                x = int((i * (7 + 5 * k) * width / 200 + k * width / 3) % (width - box))
+                y = int(height / 4 + k * height / 5)
+                cv2.rectangle(frame, (x, y), (x + box, y + 2 * box), (200, 180, 160), -1)
+            noise = rng.integers(0, 6, frame.shape, dtype=np.uint8)
+            self.frames.append(cv2.add(frame, noise))
+
+
+class FileSource:
+    """Frames decoded ahead of time from local video files and scaled to the case resolution"""
+
+    def __init__(self, paths, size, pool_size=POOL_SIZE):
+        self.frames = []
+        per_file = max(1, pool_size // len(paths))
+        for path in paths:
+            cap = cv2.VideoCapture(str(path))
+            try:
+                while len(self.frames) < pool_size:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    self.frames.append(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+                    if len(self.frames) % per_file == 0:
+                        break
+            finally:
+                cap.release()
+        if not self.frames:
+            raise RuntimeError(f"Could not read frames from {', '.join(map(str, paths))}")
+
+
+class CameraFeeds:
+    """Round-robin over N simulated cameras sharing one frame pool at different offsets"""
+
+    def __init__(self, source, cameras):
+        self.frames = source.frames
+        self.cameras = [f"bench-{i}" for i in range(cameras)]
+        self.offsets = [i * 7 % len(self.frames) for i in range(cameras)]
+        self.seq = 0
+
+    def next(self):
+        """Return (camera, seq, frame) for the next camera in turn"""
+        camera_index = self.seq % len(self.cameras)
+        tick = self.seq // len(self.cameras)
+        frame = self.frames[(self.offsets[camera_index] + tick) % len(self.frames)]
+        self.seq += 1
+        return self.cameras[camera_index], tick, frame
+
+
+def percentiles(samples):
+    if not samples:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    values = sorted(samples)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return {'p50_ms': round(pick(0.5), 3), 'p95_ms': round(pick(0.95), 3),
+            'p99_ms': round(pick(0.99), 3), 'max_ms': round(values[-1] * 1000, 3)}
+
+
+def timed_loop(step, duration, warmup):
+    """Call step() until duration elapses and return per-call latencies"""
+    for _ in range(warmup):
+        step()
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        step()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_motion(feeds, args):
+    processor = AIProcessor()
+
+    def step():
+        camera, seq, frame = feeds.next()
+        processor.detect_motion(frame, camera, seq)
+
+    return {'latencies': timed_loop(step, args.duration, args.warmup * len(feeds.cameras))}
+
+
+def bench_analyze(feeds, args):
+    processor = AIProcessor()
+    detect_faces = 'faces' in args.detectors
+    detect_people = 'people' in args.detectors
+
+    def step():
+        camera, seq, frame = feeds.next()
+        processor.process_frame(frame, camera, seq, detect_faces=detect_faces, detect_people=detect_people)
+
+    return {'latencies': timed_loop(step, args.duration, args.warmup * len(feeds.cameras))}
+
+
+def bench_dnn(feeds, args):
+    """One batched forward pass per step covering a frame from every camera"""
+    if args.model:
+        backend = DnnBackend(args.model, args.model_config, args.labels, input_size=args.input_size)
+    else:
+        settings = write_test_model(tempfile.mkdtemp(prefix='dnn-fixture-'))
+        backend = DnnBackend(settings['model_path'], settings['config_path'], settings['labels_path'],
+                             input_size=settings['input_size'])
+    if not backend.load():
+        raise RuntimeError("DNN model failed to load")
+
+    def step():
+        backend.analyze_batch([feeds.next() for _ in feeds.cameras])
+
+    return {'latencies': timed_loop(step, args.duration, args.warmup)}
+
+
+def bench_grid(feeds, args):
+    # A couple of boxes per tile so overlay drawing is part of the cost
+    overlays = [Detection('Person', (100, 100, 80, 160)), Detection('Motion', (300, 200, 120, 90))]
+    timestamp = time.time()
+    compositor = GridCompositor()
+    compositor.set_cameras(feeds.cameras)
+
+    def step():
+        # Every camera delivers a new frame, so every tile is redrawn
+        for _ in feeds.cameras:
+            camera, seq, frame = feeds.next()
+            compositor.update(camera, frame, overlays, timestamp, seq)
+
+    return {'latencies': timed_loop(step, args.duration, args.warmup)}
+
+
+def bench_mjpeg(feeds, args):
+    """Publish at the source rate and measure publish-to-delivery latency per viewer"""
+    hubs = []
+    broadcasters = []
+    for camera in feeds.cameras:
+        hub = FrameHub(camera, None, buffer_size=max(8, int(args.fps)))
+        hubs.append(hub)
+        broadcasters.append(MJPEGBroadcaster(hub, default_quality=args.quality).start())
+
+    latencies = []
+    delivered = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def view(hub, broadcaster):
+        # Same loop as MJPEGBroadcaster.stream(), but keeping the seq that was
+        # actually encoded, so latency is measured from that frame's publish
+        last_seq = -1
+        broadcaster.add_viewer()
+        try:
+            while not stop.is_set():
+                if not broadcaster.wait(last_seq, timeout=1.0):
+                    continue
+                seq, data = broadcaster.encoded(args.stream_width)
+                last_seq = seq
+                if not data:
+                    continue
+                packet = hub.get(seq)
+                now = time.time()
+                with lock:
+                    delivered[0] += 1
+                    if packet is not None:
+                        latencies.append(now - packet.timestamp)
+        finally:
+            broadcaster.remove_viewer()
+
+    viewers = [threading.Thread(target=view, args=pair, daemon=True)
+               for pair in zip(hubs, broadcasters) for _ in range(args.viewers)]
+    for thread in viewers:
+        thread.start()
+
+    published = 0
+    interval = 1.0 / args.fps
+    start = time.time()
+    next_tick = start
+    while time.time() - start < args.duration:
+        for hub in hubs:
+            _, _, frame = feeds.next()
+            hub.publish(frame)
+            published += 1
+        next_tick += interval
+        time.sleep(max(0.0, next_tick - time.time()))
+
+    stop.set()
+    for broadcaster in broadcasters:
+        broadcaster.stop()
+    for thread in viewers:
+        thread.join(timeout=2)
+
+    # Latencies are delivery times measured by the viewers, not calls
+    return {
+        'latencies': latencies,
+        'operations': delivered[0],
+        'published': published,
+        'delivery_ratio': round(delivered[0] / max(1, published * args.viewers), 4)
+    }
+
+
+BENCHMARKS = {
+    'motion': bench_motion,
+    'analyze': bench_analyze,
+    'dnn': bench_dnn,
+    'grid': bench_grid,
+    'mjpeg': bench_mjpeg
+}
+
+
+def run_case(case, args):
+    size = RESOLUTIONS[case['resolution']]
+    if args.video:
+        source = FileSource(args.video, size)
+    else:
+        source = SyntheticSource(size)
+    feeds = CameraFeeds(source, case['cameras'])
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    wall_start = time.perf_counter()
+    outcome = BENCHMARKS[case['scenario']](feeds, args)
+    wall = time.perf_counter() - wall_start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    latencies = outcome.pop('latencies')
+    operations = outcome.pop('operations', len(latencies))
+    cpu = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+    # Each grid composition and DNN batch covers every camera; everything else is one frame per call
+    frames = operations * case['cameras'] if case['scenario'] in ('grid', 'dnn') else operations
+    result = dict(case)
+    result.update({
+        'source': 'file' if args.video else 'synthetic',
+        'operations': operations,
+        'frames_per_second': round(frames / wall, 2),
+        'per_camera_fps': round(frames / wall / case['cameras'], 2),
+        'latency': percentiles(latencies),
+        'cpu_seconds': round(cpu, 3),
+        'cpu_percent': round(100.0 * cpu / wall, 1),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+        'wall_seconds': round(wall, 3)
+    })
+    result.update(outcome)
+    return result
+
+
+def run_isolated(case, argv):
+    """Run one case in a child process so its RSS and CPU are not mixed with others"""
+    command = [sys.executable, __file__, '--case', json.dumps(case)] + argv
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return dict(case, error=completed.stderr.strip()[-500:])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def environment():
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+
+def case_key(result):
+    return (result['scenario'], result['resolution'], result['cameras'])
+
+
+def compare(results, baseline_path, tolerance):
+    """Print throughput and p95 changes against a saved run; return the regressions"""
+    with open(baseline_path, 'r') as file:
+        baseline = {case_key(r): r for r in json.load(file)['results'] if 'error' not in r}
+
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None or 'error' in result:
+            continue
+        throughput = result['frames_per_second'] / old['frames_per_second'] - 1 if old['frames_per_second'] else 0.0
+        p95 = result['latency']['p95_ms'] / old['latency']['p95_ms'] - 1 if old['latency']['p95_ms'] else 0.0
+        flag = ''
+        if throughput < -tolerance or p95 > tolerance:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        print(f"  {result['scenario']:<8} {result['resolution']:<6} x{result['cameras']:<3} "
+              f"throughput {throughput:+7.1%}  p95 {p95:+7.1%}{flag}")
+    return regressions
+
+
+def print_result(result):
+    label = f"{result['scenario']:<8} {result['resolution']:<6} x{result['cameras']:<3}"
+    if 'error' in result:
+        print(f"{label} FAILED: {result['error']}")
+        return
+    latency = result['latency']
+    print(f"{label} {result['frames_per_second']:9.1f} FPS ({result['per_camera_fps']:7.1f}/camera)  "
+          f"p50 {latency['p50_ms']:8.2f} ms  p95 {latency['p95_ms']:8.2f} ms  p99 {latency['p99_ms']:8.2f} ms  "
+          f"CPU {result['cpu_percent']:6.1f}%  RSS {result['peak_rss_mb']:7.1f} MB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the surveillance pipeline without cameras")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--resolutions', nargs='+', choices=sorted(RESOLUTIONS), default=['720p', '1080p'])
+    parser.add_argument('--cameras', nargs='+', type=int, default=[1, 4, 16])
+    parser.add_argument('--video', nargs='+', help="Local video files to use instead of synthetic frames")
+    parser.add_argument('--duration', type=float, default=5.0, help="Measured seconds per case")
+    parser.add_argument('--warmup', type=int, default=5, help="Unmeasured iterations per camera before timing")
+    parser.add_argument('--detectors', nargs='*', choices=('faces', 'people'), default=['faces', 'people'],
+                        help="Detectors run by the analyze scenario")
+    parser.add_argument('--model', help="Weights for the dnn scenario (default: the built-in test model)")
+    parser.add_argument('--model-config', help="Network config for --model, e.g. a Darknet .cfg")
+    parser.add_argument('--labels', help="Class names for --model")
+    parser.add_argument('--input-size', type=int, default=416, help="Network input size for --model")
+    parser.add_argument('--fps', type=float, default=15.0, help="Source frame rate for the mjpeg scenario")
+    parser.add_argument('--viewers', type=int, default=1, help="Viewers per camera for the mjpeg scenario")
+    parser.add_argument('--stream-width', type=int, default=None, help="Requested MJPEG width")
+    parser.add_argument('--quality', type=int, default=80, help="MJPEG quality")
+    parser.add_argument('--output', help="Results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument('--compare', help="Earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="Allowed fractional throughput drop or p95 increase before flagging")
+    parser.add_argument('--no-isolate', action='store_true', help="Run every case in this process")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case), args)))
+        return 0
+
+    cases = [{'scenario': s, 'resolution': r, 'cameras': c}
+             for s in args.scenarios for r in args.resolutions for c in args.cameras]
+    results = []
+    for case in cases:
+        result = run_case(case, args) if args.no_isolate else run_isolated(case, argv)
+        print_result(result)
+        results.append(result)
+
+    output = Path(args.output) if args.output else \
+        Path(__file__).parent / 'results' / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump({'environment': environment(), 'options': vars(args), 'results': results}, file, indent=2)
+    print(f"\nSaved {len(results)} results to {output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
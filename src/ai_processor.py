@@ -1,16 +1,34 @@
 import cv2
+import threading
 import numpy as np
 from pathlib import Path
 import logging
 import os
+from detections import Detection, FrameAnalysis
+from motion_detector import MotionDetector
+from metrics import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Detector settings used when neither the config nor the camera sets them
+DEFAULT_DETECTOR_SETTINGS = {
+    'faces': {'enabled': True, 'scale_factor': 1.1, 'min_neighbors': 4, 'min_size': 30},
+    'people': {'enabled': True, 'scale': 1.05, 'min_neighbors': 2, 'win_stride': 8},
+    'motion': {'enabled': True}
+}
+
 class AIProcessor:
-    def __init__(self, models_dir='models'):
+    def __init__(self, models_dir='models', motion_settings=None, detector_settings=None):
         self.models_dir = Path(models_dir)
         self.models_loaded = False
+        self.motion_settings = motion_settings or {}
+        self.motion_detectors = {}
+        self.defaults = {stage: dict(settings, **(detector_settings or {}).get(stage, {}))
+                         for stage, settings in DEFAULT_DETECTOR_SETTINGS.items()}
+        self.camera_settings = {}
+        self.face_cascade_path = None
+        self._local = threading.local()
         self.load_models()
         
     def load_models(self):
@@ -22,11 +40,11 @@ class AIProcessor:
                 # If model doesn't exist, use OpenCV's built-in cascades
                 face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
             
-            self.face_cascade = cv2.CascadeClassifier(str(face_cascade_path))
+            self.face_cascade_path = str(face_cascade_path)
             
-            # Load person detection model (HOG descriptor)
-            self.hog = cv2.HOGDescriptor()
-            self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+            # Load this thread's copy now so a missing model fails at startup
+            if self.face_cascade.empty():
+                raise RuntimeError(f"Could not load face cascade {self.face_cascade_path}")
             
             self.models_loaded = True
             logger.info("AI models loaded successfully")
@@ -35,101 +53,131 @@ class AIProcessor:
             logger.error(f"Error loading models: {str(e)}")
             self.models_loaded = False
     
-    def detect_faces(self, frame):
+    def _thread_models(self):
+        """Face cascade and HOG person detector for the calling thread.
+        
+        OpenCV's CascadeClassifier and HOGDescriptor are not safe to share
+        between threads, and the inference scheduler runs batches on several
+        at once, so each thread lazily builds its own.
+        """
+        models = getattr(self._local, 'models', None)
+        if models is None:
+            face_cascade = cv2.CascadeClassifier(self.face_cascade_path)
+            hog = cv2.HOGDescriptor()
+            hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+            models = self._local.models = (face_cascade, hog)
+        return models
+    
+    @property
+    def face_cascade(self):
+        return self._thread_models()[0]
+    
+    @property
+    def hog(self):
+        return self._thread_models()[1]
+    
+    def load(self):
+        """Detector backend interface; the models load on construction"""
+        return self.models_loaded
+    
+    def configure_camera(self, camera, pipeline):
+        """Apply a camera's pipeline: which detectors run, their parameters,
+        and its motion settings and exclusion zones"""
+        self.camera_settings[camera] = {stage: dict(pipeline[stage]) for stage in DEFAULT_DETECTOR_SETTINGS}
+        motion = {key: value for key, value in pipeline['motion'].items() if key != 'enabled'}
+        detector = self.motion_detector(camera)
+        detector.configure(**motion)
+        detector.set_exclusion_zones(pipeline.get('exclusion_zones'))
+    
+    def detector_settings(self, camera=None):
+        """Face, person and motion settings for a camera"""
+        return self.camera_settings.get(camera, self.defaults)
+    
+    def detect_faces(self, frame, camera=None):
         """Detect faces in the frame"""
         if not self.models_loaded:
-            return frame
+            return []
             
         try:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
-            
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (255, 0, 0), 2)
-                cv2.putText(frame, 'Face', (x, y-10), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255, 0, 0), 2)
+            with metrics.timer(camera, 'detect_faces'):
+                return self._detect_faces(frame, self.detector_settings(camera)['faces'])
         except Exception as e:
             logger.error(f"Error in face detection: {str(e)}")
-            
-        return frame
+            return []
     
-    def detect_motion(self, frame, prev_frame):
-        """Detect motion between frames"""
-        if prev_frame is None:
-            return frame, False
-            
-        try:
-            # Convert frames to grayscale
-            gray1 = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
-            gray2 = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            
-            # Calculate difference
-            diff = cv2.absdiff(gray1, gray2)
-            blur = cv2.GaussianBlur(diff, (5, 5), 0)
-            _, thresh = cv2.threshold(blur, 20, 255, cv2.THRESH_BINARY)
-            dilated = cv2.dilate(thresh, None, iterations=3)
-            
-            # Find contours
-            contours, _ = cv2.findContours(dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-            
-            motion_detected = False
-            for contour in contours:
-                if cv2.contourArea(contour) > 1000:
-                    motion_detected = True
-                    (x, y, w, h) = cv2.boundingRect(contour)
-                    cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                    cv2.putText(frame, 'Motion', (x, y-10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-            
-            return frame, motion_detected
-            
-        except Exception as e:
-            logger.error(f"Error in motion detection: {str(e)}")
-            return frame, False
+    def _detect_faces(self, frame, settings):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        min_size = settings['min_size']
+        faces = self.face_cascade.detectMultiScale(gray, settings['scale_factor'], settings['min_neighbors'],
+                                                   minSize=(min_size, min_size))
+        return [Detection('Face', box) for box in faces]
     
-    def detect_people(self, frame):
+    def motion_detector(self, camera=None):
+        """Return the background-model motion detector for a camera"""
+        detector = self.motion_detectors.get(camera)
+        if detector is None:
+            detector = self.motion_detectors.setdefault(camera, MotionDetector(**self.motion_settings))
+        return detector
+    
+    def detect_motion(self, frame, camera=None, seq=None):
+        """Detect motion against the camera's background model"""
+        with metrics.timer(camera, 'detect_motion'):
+            return self.motion_detector(camera).detect(frame, seq)
+    
+    def detect_people(self, frame, camera=None):
         """Detect people in the frame using HOG descriptor"""
         if not self.models_loaded:
-            return frame
+            return []
             
         try:
-            # Detect people
-            boxes, weights = self.hog.detectMultiScale(frame, winStride=(8,8))
-            
-            # Draw boxes around detected people
-            for (x, y, w, h) in boxes:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
-                cv2.putText(frame, 'Person', (x, y-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 255), 2)
+            settings = self.detector_settings(camera)['people']
+            stride = settings['win_stride']
+            with metrics.timer(camera, 'detect_people'):
+                # Positional: hit threshold, stride, padding, scale, grouping threshold
+                boxes, weights = self.hog.detectMultiScale(frame, 0, (stride, stride), (0, 0),
+                                                           settings['scale'], settings['min_neighbors'])
+            return [Detection('Person', box, float(weight))
+                    for box, weight in zip(boxes, np.ravel(weights))]
         except Exception as e:
             logger.error(f"Error in person detection: {str(e)}")
-            
-        return frame
+            return []
+    
+    def analyze(self, frame, camera=None, seq=None, detect_faces=True, detect_people=True):
+        """Run the object detectors enabled for the camera and return their detections"""
+        settings = self.detector_settings(camera)
+        detections = []
+        if detect_faces and settings['faces']['enabled']:
+            detections.extend(self.detect_faces(frame, camera))
+        if detect_people and settings['people']['enabled']:
+            detections.extend(self.detect_people(frame, camera))
+        for detection in detections:
+            detection.camera = camera
+            detection.seq = seq
+        return detections
+    
+    def analyze_batch(self, items, **kwargs):
+        """Analyze a list of (camera, seq, frame) tuples"""
+        return [self.analyze(frame, camera, seq, **kwargs) for camera, seq, frame in items]
     
-    def process_frame(self, frame, prev_frame=None, detect_faces=True, detect_motion=True, detect_people=True):
-        """Process a frame with all available detections"""
+    def process_frame(self, frame, camera=None, seq=None, timestamp=None,
+                      detect_faces=True, detect_motion=True, detect_people=True):
+        """Process a frame with all available detections.
+        
+        The frame is left untouched; use overlay.render_overlays to draw the
+        result on whichever outputs need it.
+        """
         if frame is None:
-            return None, False
+            return None
             
-        processed_frame = frame.copy()
-        motion_detected = False
+        analysis = FrameAnalysis(camera, seq, timestamp)
         
         try:
-            if detect_faces:
-                processed_frame = self.detect_faces(processed_frame)
-            
-            if detect_motion and prev_frame is not None:
-                processed_frame, motion_detected = self.detect_motion(processed_frame, prev_frame)
-            
-            if detect_people:
-                processed_frame = self.detect_people(processed_frame)
+            if detect_motion:
+                analysis.motion = self.detect_motion(frame, camera, seq)
             
-            # Add timestamp
-            cv2.putText(processed_frame, f"Time: {cv2.getTickCount() / cv2.getTickFrequency():.2f}",
-                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 255), 2)
+            analysis.detections = self.analyze(frame, camera, seq, detect_faces, detect_people)
             
         except Exception as e:
             logger.error(f"Error in frame processing: {str(e)}")
-            return frame, False
             
-        return processed_frame, motion_detected
+        return analysis
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote
+from event_stream import sse_format
+from mjpeg_broadcaster import BOUNDARY, multipart_frame
+from metrics import metrics
+
+try:
+    import uvicorn
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:  # Optional: only needed for server.mode 'async'
+    uvicorn = None
+    WsgiToAsgi = None
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSignal:
+    """Wakes every async viewer of one broadcaster when it has a new frame.
+
+    The broadcaster thread resolves the current future through the event
+    loop and a fresh one takes its place, so any number of viewers wait on
+    a single object instead of a thread each.
+    """
+
+    def __init__(self, loop, broadcaster):
+        self.loop = loop
+        self.future = loop.create_future()
+        broadcaster.listeners.append(self.notify)
+
+    def notify(self, seq):
+        self.loop.call_soon_threadsafe(self._fire)
+
+    def _fire(self):
+        if not self.future.done():
+            self.future.set_result(None)
+        self.future = self.loop.create_future()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class AsyncStreamingServer:
+    """ASGI front end for the video, snapshot and event endpoints.
+
+    Video viewers are coroutines that wait for a broadcaster's next frame
+    and send the shared encoded JPEG. Each camera and output setting is
+    encoded at most once per frame, however many viewers there are. A
+    viewer that can't keep up is still sending when newer frames arrive;
+    it skips straight to the newest one, so nothing queues per client.
+    Every other route goes to the Flask app unchanged.
+    """
+
+    def __init__(self, flask_app, broadcasters, mosaic_broadcaster, event_bus, keepalive=15.0,
+                 encode_workers=4, snapshot_workers=4):
+        if uvicorn is None:
+            raise RuntimeError("server.mode 'async' needs uvicorn and asgiref (pip install uvicorn asgiref)")
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.broadcasters = broadcasters
+        self.mosaic_broadcaster = mosaic_broadcaster
+        self.event_bus = event_bus
+        self.keepalive = keepalive
+        self.executor = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix='encode')
+        # Snapshots may wait seconds for a first frame; keep them off the encoders
+        self.snapshot_executor = ThreadPoolExecutor(max_workers=snapshot_workers, thread_name_prefix='snapshot')
+        self._signals = {}
+        self._encodes = {}
+
+    def signal(self, broadcaster):
+        signal = self._signals.get(id(broadcaster))
+        if signal is None:
+            signal = self._signals[id(broadcaster)] = FrameSignal(asyncio.get_running_loop(), broadcaster)
+        return signal
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            path = scope['path']
+            query = parse_qs(scope.get('query_string', b'').decode())
+            if path.startswith('/video_feed/'):
+                return await self.video(self.broadcasters.get(unquote(path[len('/video_feed/'):])),
+                                        query, receive, send)
+            if path == '/mosaic':
+                return await self.video(self.mosaic_broadcaster, query, receive, send)
+            if path.startswith('/snapshot/'):
+                return await self.snapshot(self.broadcasters.get(unquote(path[len('/snapshot/'):])), query, send)
+            if path == '/events':
+                return await self.events(query, receive, send)
+        await self.wsgi(scope, receive, send)
+
+    async def encoded(self, broadcaster, width, quality):
+        """Shared JPEG for the broadcaster's current frame at one setting.
+        Concurrent viewers await the same encode instead of queueing their own."""
+        key = (id(broadcaster),) + broadcaster.normalize_settings(width, quality)
+        seq = broadcaster.seq
+        entry = self._encodes.get(key)
+        if entry is None or entry[0] != seq:
+            loop = asyncio.get_running_loop()
+            entry = (seq, loop.run_in_executor(self.executor, broadcaster.encoded, width, quality))
+            self._encodes[key] = entry
+        return await asyncio.shield(entry[1])
+
+    async def video(self, broadcaster, query, receive, send):
+        if broadcaster is None:
+            return await self.not_found(send, b'Camera not found')
+        width, quality = int_arg(query, 'w'), int_arg(query, 'q')
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'multipart/x-mixed-replace; boundary=' + BOUNDARY),
+            (b'cache-control', b'no-cache')
+        ]})
+
+        async def frames():
+            signal = self.signal(broadcaster)
+            last_seq = -1
+            while not broadcaster.stopped:
+                if broadcaster.seq <= last_seq and not await signal.wait(1.0):
+                    continue
+                seq, data = await self.encoded(broadcaster, width, quality)
+                last_seq = seq
+                if data:
+                    metrics.count(broadcaster.hub.name, 'mjpeg_frames_sent')
+                    # Waits while the client's socket buffer is full
+                    await send({'type': 'http.response.body', 'body': multipart_frame(data), 'more_body': True})
+
+        broadcaster.add_viewer()
+        try:
+            await until_disconnected(frames(), receive, send)
+        finally:
+            broadcaster.remove_viewer()
+
+    async def snapshot(self, broadcaster, query, send):
+        if broadcaster is None:
+            return await self.not_found(send, b'Camera not found')
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self.snapshot_executor, broadcaster.snapshot,
+                                          int_arg(query, 'w'), int_arg(query, 'q'))
+        if not data:
+            return await self.not_found(send, b'No frame available')
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'image/jpeg'),
+            (b'cache-control', b'no-cache')
+        ]})
+        await send({'type': 'http.response.body', 'body': data})
+
+    async def events(self, query, receive, send):
+        subscription = self.event_bus.subscribe(query.get('camera'), query.get('type'))
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        subscription.listener = lambda: loop.call_soon_threadsafe(wake.set)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]})
+
+        async def write(text):
+            await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+        async def stream():
+            await write("retry: 3000\n\n")
+            while not subscription.closed:
+                wake.clear()
+                event = subscription.get(timeout=0)
+                if event is not None:
+                    await write(sse_format(event))
+                    continue
+                try:
+                    await asyncio.wait_for(wake.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    await write(": keepalive\n\n")
+
+        try:
+            await until_disconnected(stream(), receive, send)
+        finally:
+            self.event_bus.unsubscribe(subscription)
+
+    async def not_found(self, send, message):
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': message})
+
+    def run(self, host, port):
+        # One process, one event loop; each viewer costs a coroutine, not a thread
+        uvicorn.run(self, host=host, port=port, log_level='info', lifespan='off')
+
+
+def int_arg(query, name):
+    try:
+        return int(query[name][0]) if name in query else None
+    except ValueError:
+        return None
+
+
+async def until_disconnected(stream, receive, send):
+    """Run a streaming coroutine until it ends or the client goes away"""
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    streaming = asyncio.ensure_future(stream)
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait([streaming, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        streaming.cancel()
+        watcher.cancel()
+    if streaming.done() and not streaming.cancelled() and streaming.exception() is not None:
+        logger.error(f"Error streaming response: {str(streaming.exception())}")
+    if not watcher.done():
+        # The stream ended on our side, e.g. at shutdown; finish the response
+        await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,210 @@
+import cv2
+import threading
+import numpy as np
+from metrics import metrics
+from pipeline_config import runs_detection
+from tracker import IoUTracker
+
+
+class FrameScaler:
+    """Downscale frames to the analysis width into reused buffers.
+
+    Motion detection, the cascade and the object detectors all work on the
+    same scaled copy. Whoever holds a scaled frame last hands it back with
+    release(): the caller, or the inference scheduler for a frame submitted
+    for detection. Only released buffers are reused, so a frame still queued
+    for detection is never overwritten; up to `max_buffers` are kept.
+    """
+
+    def __init__(self, width=640, max_buffers=4):
+        self.width = width
+        self.max_buffers = max_buffers
+        self._buffers = []
+        self._free = []
+        self._lock = threading.Lock()
+
+    def _buffer(self, shape, dtype):
+        with self._lock:
+            for buffer in self._free:
+                if buffer.shape == shape and buffer.dtype == dtype:
+                    self._free.remove(buffer)
+                    return buffer
+            buffer = np.empty(shape, dtype=dtype)
+            if len(self._buffers) >= self.max_buffers and self._free:
+                # The source resolution changed; retire a buffer of the old size
+                stale = self._free.pop(0)
+                self._buffers = [kept for kept in self._buffers if kept is not stale]
+            if len(self._buffers) < self.max_buffers:
+                self._buffers.append(buffer)
+            return buffer
+
+    def release(self, frame):
+        """Hand back a frame returned by scale(); source frames passed through are ignored"""
+        with self._lock:
+            if any(buffer is frame for buffer in self._buffers) and not any(free is frame for free in self._free):
+                self._free.append(frame)
+
+    def scale(self, frame):
+        """Return the analysis-sized frame, or the frame itself if it is already small enough"""
+        height, width = frame.shape[:2]
+        if not self.width or width <= self.width:
+            return frame
+        size = (self.width, max(1, int(round(height * self.width / width))))
+        out = self._buffer((size[1], size[0]) + frame.shape[2:], frame.dtype)
+        cv2.resize(frame, size, dst=out, interpolation=cv2.INTER_AREA)
+        return out
+
+
+class CameraAnalyzer:
+    """Per-camera analysis at a capped rate on a downscaled frame.
+
+    Frames that arrive before the next analysis is due are skipped, and
+    results are mapped back to the coordinates of the stream being shown
+    or recorded. The analysis stream may be a lower-resolution substream.
+
+    With tracking enabled the detectors only run at the full detection rate
+    while there is motion or a tracked object, and at `idle_fps` otherwise.
+    Between detector runs boxes come from the tracker, with persistent IDs.
+    The detection rate also backs off while the inference workers are
+    saturated. All of this comes from the camera's pipeline (see
+    pipeline_config) and can be changed at runtime with apply().
+    """
+
+    def __init__(self, camera, ai_processor, scheduler, pipeline):
+        self.camera = camera
+        self.ai_processor = ai_processor
+        self.scheduler = scheduler
+        self.scaler = FrameScaler(pipeline['analysis']['width'])
+        self.latest = None
+        self.analyzed = 0
+        self.skipped = 0
+        self.tracker = None
+        self._result = None
+        self._next_due = 0.0
+        self._tracked_seq = None
+        self._load_factor = 1.0
+        self._load_checked = 0.0
+        self._rate = None
+        self.apply(pipeline)
+
+    def apply(self, pipeline):
+        """Take on a camera's pipeline settings; called again on config reload
+        while frames keep flowing. Tracks survive unless tracking is switched off."""
+        fps = pipeline['analysis']['fps']
+        self.interval = 1.0 / fps if fps else 0.0
+        if pipeline['analysis']['width'] != self.scaler.width:
+            self.scaler = FrameScaler(pipeline['analysis']['width'])
+        self.motion_enabled = pipeline['motion']['enabled']
+        self.detection_enabled = runs_detection(pipeline)
+        if not self.detection_enabled:
+            self._result = None
+
+        tracking = pipeline['tracking']
+        if not tracking['enabled'] or not self.detection_enabled:
+            self.tracker = None
+        elif self.tracker is None:
+            self.tracker = IoUTracker(tracking['iou_threshold'], tracking['min_hits'], tracking['max_age'])
+        else:
+            self.tracker.iou_threshold = tracking['iou_threshold']
+            self.tracker.min_hits = tracking['min_hits']
+            self.tracker.max_age = tracking['max_age']
+        self.detect_fps = pipeline['detection']['fps']
+        self.idle_fps = min(tracking['idle_fps'], self.detect_fps)
+        self.adaptive = tracking['adaptive']
+        self.max_load = tracking['max_load']
+        # Without a tracker nothing adjusts the rate per frame, so set it here
+        self._rate = None
+        if self.tracker is None:
+            self.scheduler.set_target_fps(self.camera, self.detect_fps)
+
+    def on_detections(self, result):
+        """Inference scheduler callback"""
+        # A batch already in flight when detection was switched off is discarded
+        if self.detection_enabled:
+            self._result = result
+
+    def due(self, timestamp):
+        if timestamp < self._next_due:
+            return False
+        # Catch up after a stall, but never burst to make up for it
+        self._next_due = max(self._next_due + self.interval, timestamp)
+        return True
+
+    def analyze(self, packet, output_size=None):
+        """Analyze a packet if it is due and return the newest analysis.
+
+        `output_size` is the (width, height) that boxes should be reported
+        in; by default the packet's own frame size.
+        """
+        if not self.due(packet.timestamp):
+            self.skipped += 1
+            return self.latest
+
+        frame = packet.frame
+        with metrics.timer(self.camera, 'scale'):
+            small = self.scaler.scale(frame)
+
+        # Motion stays inline since it is cheap; its result is cached by seq
+        # so the detection cascade can reuse it
+        analysis = self.ai_processor.process_frame(
+            small, self.camera, packet.seq, packet.timestamp,
+            detect_faces=False, detect_motion=self.motion_enabled, detect_people=False
+        )
+        if self.tracker is not None:
+            # Without motion detection there is no cheap activity signal, so
+            # only the tracker decides when to detect at full rate
+            self._set_detection_rate(analysis.motion_detected or self.tracker.active, packet.timestamp)
+        # Face and person detection run centrally at the camera's target FPS;
+        # a submitted frame is released by the scheduler once it is done with it
+        submitted = self.detection_enabled and self.scheduler.submit(
+            self.camera, small, packet.seq, packet.timestamp, release=self.scaler.release
+        )
+        if not submitted:
+            self.scaler.release(small)
+        if self.tracker is not None:
+            with metrics.timer(self.camera, 'track'):
+                analysis.detections, analysis.events = self._track(packet.timestamp)
+        elif self._result is not None:
+            analysis.detections = self._result.detections
+
+        width, height = output_size or (frame.shape[1], frame.shape[0])
+        self.latest = analysis.scaled(width / small.shape[1], height / small.shape[0])
+        self.analyzed += 1
+        return self.latest
+
+    def _track(self, timestamp):
+        """Fold in a new detector result, if any, and move tracks to `timestamp`"""
+        events = []
+        result = self._result
+        if result is not None and result.seq != self._tracked_seq:
+            self._tracked_seq = result.seq
+            # Matched against tracks at `timestamp`, the time they have been
+            # predicted to, so velocity and age use one clock
+            events.extend(self.tracker.update(result.detections, timestamp))
+        else:
+            events.extend(self.tracker.predict(timestamp))
+        # Tracked boxes keep the seq of the detector run they came from, so
+        # the event index still records one detection event per run
+        return self.tracker.detections(self.camera, self._tracked_seq), events
+
+    def _set_detection_rate(self, active, timestamp):
+        if self.adaptive and timestamp - self._load_checked >= 1.0:
+            self._load_checked = timestamp
+            load = self.scheduler.load()
+            if load > self.max_load:
+                self._load_factor = max(0.1, self._load_factor * 0.8)
+            elif load < 0.7 * self.max_load:
+                self._load_factor = min(1.0, self._load_factor * 1.1)
+
+        rate = max(self.idle_fps, self.detect_fps * self._load_factor) if active else self.idle_fps
+        if self._rate is None or abs(rate - self._rate) >= 0.1:
+            self._rate = rate
+            self.scheduler.set_target_fps(self.camera, rate)
+            metrics.gauge(self.camera, 'detection_fps', rate)
+
+    def stats(self):
+        stats = {'analyzed': self.analyzed, 'skipped': self.skipped}
+        if self.tracker is not None:
+            stats['tracks'] = sum(1 for track in self.tracker.tracks if track.confirmed)
+            stats['detection_fps'] = round(self._rate or 0.0, 2)
+        return stats
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class CameraInventory:
+    """On-disk list of known-good camera endpoints.
+
+    Loaded at startup so streams can start without scanning the network.
+    Entries are refreshed by background revalidation and scans, and the file
+    is rewritten after every change. An entry is dropped only after
+    `max_failures` failed checks in a row, so a brief outage does not make
+    the system forget a camera.
+    """
+
+    def __init__(self, path='camera_inventory.json', max_failures=10):
+        self.path = Path(path)
+        self.max_failures = max_failures
+        self._cameras = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r') as file:
+                cameras = json.load(file).get('cameras', [])
+            with self._lock:
+                self._cameras = {camera['url']: camera for camera in cameras}
+            logger.info(f"Loaded {len(cameras)} cameras from {self.path}")
+        except Exception as e:
+            logger.error(f"Error loading camera inventory {self.path}: {str(e)}")
+
+    def save(self):
+        # Scan threads save concurrently; one at a time, each with the newest state
+        with self._save_lock:
+            with self._lock:
+                data = {'updated': time.time(), 'cameras': [dict(camera) for camera in self._cameras.values()]}
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # Write then rename so a crash never leaves a truncated inventory
+                tmp_path = self.path.with_name(self.path.name + '.tmp')
+                with open(tmp_path, 'w') as file:
+                    json.dump(data, file, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error(f"Error saving camera inventory {self.path}: {str(e)}")
+
+    def cameras(self):
+        with self._lock:
+            return [dict(camera) for camera in self._cameras.values()]
+
+    def urls(self):
+        with self._lock:
+            return list(self._cameras)
+
+    def get(self, url):
+        with self._lock:
+            camera = self._cameras.get(url)
+            return dict(camera) if camera else None
+
+    def hosts(self):
+        """(ip, port) pairs already known, so scans can skip them"""
+        with self._lock:
+            return {(camera.get('ip'), camera.get('port')) for camera in self._cameras.values()}
+
+    def mark_seen(self, camera, source='scan'):
+        """Record a successful check; returns True if the camera is new"""
+        now = time.time()
+        with self._lock:
+            entry = self._cameras.get(camera['url'])
+            new = entry is None
+            if new:
+                entry = {'url': camera['url'], 'source': source, 'first_seen': now}
+                self._cameras[camera['url']] = entry
+            entry.update({key: value for key, value in camera.items() if key != 'status'})
+            if isinstance(entry.get('resolution'), tuple):
+                entry['resolution'] = list(entry['resolution'])
+            entry.update({'status': 'active', 'last_seen': now, 'last_checked': now, 'failures': 0})
+        self.save()
+        return new
+
+    def mark_failed(self, url):
+        """Record a failed check; returns True if the camera was dropped"""
+        with self._lock:
+            entry = self._cameras.get(url)
+            if entry is None:
+                return False
+            entry['failures'] = entry.get('failures', 0) + 1
+            entry['status'] = 'offline'
+            entry['last_checked'] = time.time()
+            dropped = entry['failures'] >= self.max_failures
+            if dropped:
+                del self._cameras[url]
+        self.save()
+        return dropped
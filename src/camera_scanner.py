@@ -1,74 +1,122 @@
-import cv2
 import socket
 import threading
 from concurrent.futures import ThreadPoolExecutor
 import logging
+from connection_supervisor import open_capture
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_IP_RANGES = ['192.168.1', '192.168.0', '10.0.0', '172.16.0']
+DEFAULT_PORTS = [554, 8000, 8080, 80, 8554, 9000]
+DEFAULT_CREDENTIALS = [
+    ('admin', 'admin'),
+    ('admin', '12345'),
+    ('admin', 'password'),
+    ('', '')  # No credentials
+]
+
+
+def port_open(ip, port, timeout=0.5):
+    """Cheap TCP pre-check before any stream is opened"""
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
 class CameraScanner:
-    def __init__(self):
+    def __init__(self, ip_ranges=None, ports=None, credentials=None, connect_timeout=0.5,
+                 open_timeout=5.0, max_workers=50):
         self.found_cameras = []
-        self.common_credentials = [
-            ('admin', 'admin'),
-            ('admin', '12345'),
-            ('admin', 'password'),
-            ('', '')  # No credentials
-        ]
-        
-    def test_camera_url(self, ip, port):
+        self.ip_ranges = ip_ranges or DEFAULT_IP_RANGES
+        self.ports = ports or DEFAULT_PORTS
+        self.common_credentials = credentials or DEFAULT_CREDENTIALS
+        self.connect_timeout = connect_timeout
+        self.open_timeout = open_timeout
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    def candidate_urls(self, ip, port):
+        urls = []
         for username, password in self.common_credentials:
-            urls = [
+            for url in (
                 f"rtsp://{ip}:{port}/",
                 f"rtsp://{username}:{password}@{ip}:{port}/",
                 f"rtsp://{ip}:{port}/stream1",
                 f"http://{ip}:{port}/video",
                 f"rtsp://{username}:{password}@{ip}:{port}/stream1",
                 f"rtsp://{username}:{password}@{ip}:{port}/cam/realmonitor"
-            ]
-            
-            for url in urls:
-                try:
-                    logger.info(f"Testing camera URL: {url}")
-                    cap = cv2.VideoCapture(url)
-                    if cap.isOpened():
-                        ret, frame = cap.read()
-                        if ret and frame is not None:
-                            self.found_cameras.append({
-                                'url': url,
-                                'ip': ip,
-                                'port': port,
-                                'status': 'active',
-                                'resolution': (int(cap.get(3)), int(cap.get(4)))
-                            })
-                            cap.release()
-                            logger.info(f"Found working camera at {url}")
-                            return True
-                    cap.release()
-                except Exception as e:
-                    logger.debug(f"Failed to connect to {url}: {str(e)}")
-                    continue
-        return False
+            ):
+                if url not in urls:
+                    urls.append(url)
+        return urls
 
-    def scan_network(self, ip_ranges=None):
+    def validate(self, url, ip=None, port=None):
+        """Open a URL and read one frame; returns the camera record or None"""
+        cap = None
+        try:
+            cap = open_capture(url, self.open_timeout)
+            if cap.isOpened():
+                ret, frame = cap.read()
+                if ret and frame is not None:
+                    return {
+                        'url': url,
+                        'ip': ip,
+                        'port': port,
+                        'status': 'active',
+                        'resolution': (int(cap.get(3)), int(cap.get(4)))
+                    }
+        except Exception as e:
+            logger.debug(f"Failed to connect to {url}: {str(e)}")
+        finally:
+            if cap is not None:
+                cap.release()
+        return None
+
+    def test_camera_url(self, ip, port):
+        # Skip the slow stream opens entirely when nothing listens on the port
+        if not port_open(ip, port, self.connect_timeout):
+            return None
+        for url in self.candidate_urls(ip, port):
+            logger.info(f"Testing camera URL: {url}")
+            camera = self.validate(url, ip, port)
+            if camera is not None:
+                with self._lock:
+                    self.found_cameras.append(camera)
+                logger.info(f"Found working camera at {url}")
+                return camera
+        return None
+
+    def scan_network(self, ip_ranges=None, skip=(), on_found=None):
         """
         Scan network for cameras. If no IP ranges provided, try common local networks.
+        (ip, port) pairs in `skip` are not probed. `on_found` is called with each
+        camera as soon as it is found.
         """
         if ip_ranges is None:
-            ip_ranges = ['192.168.1', '192.168.0', '10.0.0', '172.16.0']
-            
-        common_ports = [554, 8000, 8080, 80, 8554, 9000]
+            ip_ranges = self.ip_ranges
+        skip = set(skip)
+
+        with self._lock:
+            self.found_cameras = []
         logger.info("Starting network scan for cameras...")
-        
-        for ip_range in ip_ranges:
-            logger.info(f"Scanning IP range: {ip_range}.0/24")
-            with ThreadPoolExecutor(max_workers=50) as executor:
+
+        def probe(ip, port):
+            camera = self.test_camera_url(ip, port)
+            if camera is not None and on_found is not None:
+                on_found(camera)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for ip_range in ip_ranges:
+                logger.info(f"Scanning IP range: {ip_range}.0/24")
                 for i in range(1, 255):
                     ip = f"{ip_range}.{i}"
-                    for port in common_ports:
-                        executor.submit(self.test_camera_url, ip, port)
-        
+                    for port in self.ports:
+                        if (ip, port) not in skip:
+                            executor.submit(probe, ip, port)
+
         logger.info(f"Scan complete. Found {len(self.found_cameras)} cameras")
         return self.found_cameras
 
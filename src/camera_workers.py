@@ -0,0 +1,487 @@
+import os
+import cv2
+import time
+import queue
+import threading
+import logging
+import multiprocessing
+from ai_processor import AIProcessor
+from config_loader import CAMERA_CONFIG_PATH, DEFAULT_CONFIG_PATH, load_config, get_setting
+from connection_supervisor import supervisor
+from detection_cascade import DetectionCascade
+from detector_backends import DetectorRouter, NullBackend, dnn_backend
+from frame_hub import FrameHubRegistry, FramePacket
+from inference_scheduler import InferenceScheduler
+from pipeline_config import default_pipeline
+from metrics import metrics
+from shared_frames import SharedFrameRing
+from camera_analyzer import CameraAnalyzer
+
+logger = logging.getLogger(__name__)
+
+
+def build_inference(config, workers=None, ai_settings=None):
+    """AI processor, optional motion-gated cascade, per-camera detector router
+    and inference scheduler from config. Detector model paths come from the
+    `ai_settings` section of config.yaml. Global stage settings are the
+    defaults; each camera's pipeline replaces them via configure_camera."""
+    if ai_settings is None:
+        ai_settings = load_config(CAMERA_CONFIG_PATH).get('ai_settings') or {}
+    defaults = default_pipeline(config, ai_settings)
+    ai_processor = AIProcessor(
+        motion_settings={key: value for key, value in defaults['motion'].items() if key != 'enabled'},
+        detector_settings={stage: defaults[stage] for stage in ('faces', 'people', 'motion')}
+    )
+
+    # Optionally gate the expensive detectors behind motion
+    cascade = None
+    detector = ai_processor
+    if get_setting(config, 'ai.cascade.enabled', False):
+        cascade = DetectionCascade(ai_processor, padding=get_setting(config, 'ai.cascade.roi_padding', 0.25))
+        detector = cascade
+
+    # Haar/HOG stays the default; cameras can select the DNN model instead
+    factories = {}
+    if ai_settings.get('model_path'):
+        factories['dnn'] = lambda: dnn_backend(ai_settings)
+    detectors = DetectorRouter(
+        {'haar': detector, 'none': NullBackend()},
+        factories,
+        default=ai_settings.get('backend', 'haar')
+    )
+
+    scheduler = InferenceScheduler(
+        detectors,
+        workers=get_setting(config, 'ai.inference.workers') or workers or None,
+        max_batch=get_setting(config, 'ai.inference.max_batch', 8),
+        default_fps=defaults['detection']['fps']
+    )
+    return ai_processor, cascade, detectors, scheduler
+
+
+def fit_frame(frame, max_shape):
+    """Downscale a frame that is larger than a ring slot, keeping its aspect ratio"""
+    height, width = frame.shape[:2]
+    scale = min(max_shape[0] / height, max_shape[1] / width, 1.0)
+    if scale >= 1.0:
+        return frame
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+
+class CameraWorker:
+    """Capture and analysis for a group of cameras, run inside a worker process.
+
+    Each frame goes into its camera's shared ring. Only a small message
+    (ring seq, timestamp, analysis) is sent to the parent.
+    """
+
+    def __init__(self, worker_id, events, config, inference_workers=None):
+        self.worker_id = worker_id
+        self.events = events
+        self.config = config
+        self.running = True
+        self.hubs = FrameHubRegistry()
+        self.analyzers = {}
+        self.output_sizes = {}
+        self.rings = {}
+        self.substreams = {}
+        self.threads = []
+        self.ai_processor, _, self.detectors, self.scheduler = build_inference(config, inference_workers)
+        self.scheduler.start()
+
+    def add_camera(self, spec):
+        url = spec['url']
+        if url in self.rings:
+            return
+        pipeline = spec['pipeline']
+        analyzer = CameraAnalyzer(url, self.ai_processor, self.scheduler, pipeline)
+        self.analyzers[url] = analyzer
+        self.rings[url] = SharedFrameRing(spec['ring'], spec['slots'], spec['max_shape'])
+        self.hubs.get_or_create(url)
+        self.ai_processor.configure_camera(url, pipeline)
+        self.detectors.assign(url, pipeline['detection']['backend'])
+        self.scheduler.register(url, analyzer.on_detections, pipeline['detection']['fps'])
+        substream = pipeline['substream']
+        if substream:
+            self.substreams[url] = substream
+            self.hubs.get_or_create(substream, decode_fps=pipeline['analysis']['fps'])
+            self._start_thread(self.analyze_substream, (url, substream), f"substream-{url}")
+        self._start_thread(self.process_camera, (url, bool(substream)), f"worker-{url}")
+        logger.info(f"Worker {self.worker_id} processing camera {url}")
+
+    def _start_thread(self, target, args, name):
+        thread = threading.Thread(target=target, args=args, name=name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def remove_camera(self, url):
+        """Stop a camera's stream and threads; its process thread unmaps the ring on exit"""
+        if self.analyzers.pop(url, None) is None:
+            return
+        self.scheduler.unregister(url)
+        self.hubs.remove(url)
+        substream = self.substreams.pop(url, None)
+        if substream:
+            self.hubs.remove(substream)
+        self.output_sizes.pop(url, None)
+        logger.info(f"Worker {self.worker_id} stopped camera {url}")
+
+    def update_camera(self, url, pipeline):
+        """Apply a reloaded pipeline without touching the camera's stream"""
+        analyzer = self.analyzers.get(url)
+        if analyzer is None:
+            return
+        self.ai_processor.configure_camera(url, pipeline)
+        self.detectors.assign(url, pipeline['detection']['backend'])
+        analyzer.apply(pipeline)
+        logger.info(f"Worker {self.worker_id} updated pipeline for {url}")
+
+    def analyze_substream(self, url, substream):
+        analyzer = self.analyzers[url]
+        subscriber = self.hubs.get(substream).subscribe()
+        while self.running and self.analyzers.get(url) is analyzer:
+            try:
+                packet = subscriber.read(timeout=1.0)
+                if packet is not None:
+                    analyzer.analyze(packet, self.output_sizes.get(url))
+            except Exception as e:
+                logger.error(f"Error in worker {self.worker_id} analyzing substream of {url}: {str(e)}")
+                time.sleep(1)
+
+    def process_camera(self, url, substream=False):
+        hub = self.hubs.get(url)
+        ring = self.rings[url]
+        analyzer = self.analyzers[url]
+        subscriber = hub.subscribe()
+        seq = 0
+        resized = False
+        while self.running and self.analyzers.get(url) is analyzer:
+            try:
+                packet = subscriber.read(timeout=1.0)
+                if packet is None:
+                    continue
+                frame = packet.frame
+                if not ring.fits(frame):
+                    frame = fit_frame(frame, ring.max_shape)
+                    if not resized:
+                        logger.warning(f"Frames from {url} exceed the shared ring slot; downscaling to "
+                                       f"{frame.shape[1]}x{frame.shape[0]}")
+                        resized = True
+
+                self.output_sizes[url] = (frame.shape[1], frame.shape[0])
+                if substream:
+                    analysis = analyzer.latest
+                else:
+                    analysis = analyzer.analyze(FramePacket(packet.seq, packet.timestamp, frame))
+
+                ring.write(seq, frame, packet.timestamp)
+                try:
+                    self.events.put_nowait(('frame', url, seq, packet.timestamp, analysis, hub.source_fps))
+                except queue.Full:
+                    metrics.count(url, 'worker_frames_dropped')
+                seq += 1
+            except Exception as e:
+                logger.error(f"Error in worker {self.worker_id} processing {url}: {str(e)}")
+                time.sleep(1)
+        if self.running:
+            # Removed camera; on shutdown stop() closes the rings instead
+            self.rings.pop(url, None)
+            ring.close()
+
+    def stop(self, timeout=5.0):
+        self.running = False
+        self.scheduler.stop()
+        self.hubs.stop_all()
+        # Camera threads notice within a read timeout; only then is it safe
+        # to unmap the rings they write into
+        deadline = time.time() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.time()))
+        if any(thread.is_alive() for thread in self.threads):
+            logger.warning(f"Worker {self.worker_id} camera threads still running; leaving rings mapped")
+            return
+        for ring in self.rings.values():
+            ring.close()
+
+
+def _worker_main(worker_id, cameras, events, commands, parent_pid, config_path, inference_workers):
+    logging.basicConfig(level=logging.INFO,
+                        format=f'%(asctime)s - worker-{worker_id} - %(name)s - %(levelname)s - %(message)s')
+    config = load_config(config_path)
+    metrics.configure(enabled=get_setting(config, 'system.metrics_enabled', True))
+    supervisor.configure(**(get_setting(config, 'connection', {}) or {}))
+
+    # Heartbeats start before the slow model loading so the parent doesn't
+    # mistake a starting worker for a hung one
+    stopped = threading.Event()
+
+    def send_heartbeats():
+        while not stopped.is_set():
+            try:
+                events.put(('heartbeat', worker_id, os.getpid(), supervisor.states()), timeout=1.0)
+            except queue.Full:
+                pass
+            stopped.wait(1.0)
+
+    heartbeat_thread = threading.Thread(target=send_heartbeats, name='heartbeat', daemon=True)
+    heartbeat_thread.start()
+
+    worker = CameraWorker(worker_id, events, config, inference_workers)
+    for spec in cameras:
+        worker.add_camera(spec)
+
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=1.0)
+            except queue.Empty:
+                command = None
+            if os.getppid() != parent_pid:
+                logger.warning("Parent process is gone; stopping worker")
+                break
+            if command is None:
+                continue
+            if command[0] == 'add':
+                worker.add_camera(command[1])
+            elif command[0] == 'update':
+                worker.update_camera(command[1], command[2])
+            elif command[0] == 'remove':
+                worker.remove_camera(command[1])
+            elif command[0] == 'stop':
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopped.set()
+        worker.stop()
+
+
+class WorkerHandle:
+    """Parent-side view of one worker process"""
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.cameras = []
+        self.process = None
+        self.commands = None
+        self.last_heartbeat = 0.0
+        self.started = 0.0
+        self.restarts = 0
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+
+class CameraWorkerPool:
+    """Run capture and analysis for groups of cameras in separate processes.
+
+    Every camera gets a shared-memory ring owned by this (parent) process.
+    Workers write decoded frames into it. A receiver thread publishes
+    read-only views of those frames, with their analysis attached, into
+    local frame hubs, so the recorder, display and any other subscribers
+    work unchanged. A monitor thread restarts workers that exit or stop
+    sending heartbeats.
+    """
+
+    def __init__(self, hubs, processes=None, cameras_per_worker=4, ring_slots=8, max_frame_size=(1920, 1080),
+                 heartbeat_timeout=10.0, restart_delay=2.0, config_path=DEFAULT_CONFIG_PATH, queue_size=1024):
+        self.hubs = hubs
+        self.processes = processes or os.cpu_count() or 1
+        self.cameras_per_worker = cameras_per_worker
+        self.ring_slots = ring_slots
+        self.max_shape = (max_frame_size[1], max_frame_size[0], 3)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.restart_delay = restart_delay
+        self.config_path = config_path
+        self.running = False
+        self._ctx = multiprocessing.get_context('spawn')
+        self._events = self._ctx.Queue(maxsize=queue_size)
+        self._workers = []
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.running = True
+        with self._lock:
+            for worker in self._workers:
+                if worker.cameras and not worker.alive:
+                    self._start_worker(worker)
+        threading.Thread(target=self._receive_loop, name='worker-receiver', daemon=True).start()
+        threading.Thread(target=self._monitor_loop, name='worker-monitor', daemon=True).start()
+        return self
+
+    def add_camera(self, url, pipeline):
+        with self._lock:
+            if url in self._rings:
+                return
+            ring = SharedFrameRing(slots=self.ring_slots, max_shape=self.max_shape, create=True)
+            self._rings[url] = ring
+            hub = self.hubs.get_or_create(url, start=False)
+            # Mirrors the worker's connection state for /cameras and the status command
+            hub.connection = supervisor.register(url)
+            spec = {
+                'url': url,
+                'ring': ring.name,
+                'slots': ring.slots,
+                'max_shape': ring.max_shape,
+                'pipeline': pipeline
+            }
+            worker = self._assign(spec)
+        logger.info(f"Camera {url} assigned to worker {worker.worker_id}")
+
+    def remove_camera(self, url):
+        """Stop a camera in its worker process and release its ring"""
+        with self._lock:
+            ring = self._rings.pop(url, None)
+            for worker in self._workers:
+                spec = next((spec for spec in worker.cameras if spec['url'] == url), None)
+                if spec is not None:
+                    worker.cameras.remove(spec)
+                    if worker.alive:
+                        worker.commands.put(('remove', url))
+                    break
+        if ring is not None:
+            # Received frames are copies, so nothing here still views the ring
+            ring.close()
+        self.hubs.remove(url)
+
+    def update_camera(self, url, pipeline):
+        """Send a camera's reloaded pipeline to its worker. The stored spec is
+        updated too, so a restarted worker comes back with the new settings."""
+        with self._lock:
+            for worker in self._workers:
+                for spec in worker.cameras:
+                    if spec['url'] == url:
+                        spec['pipeline'] = pipeline
+                        if worker.alive:
+                            worker.commands.put(('update', url, pipeline))
+                        return True
+        return False
+
+    def _assign(self, spec):
+        open_workers = [w for w in self._workers if len(w.cameras) < self.cameras_per_worker]
+        if open_workers:
+            worker = min(open_workers, key=lambda w: len(w.cameras))
+        elif len(self._workers) < self.processes:
+            worker = WorkerHandle(len(self._workers))
+            self._workers.append(worker)
+        else:
+            worker = min(self._workers, key=lambda w: len(w.cameras))
+
+        worker.cameras.append(spec)
+        if worker.alive:
+            worker.commands.put(('add', spec))
+        elif self.running:
+            self._start_worker(worker)
+        return worker
+
+    def _start_worker(self, worker):
+        # Share the cores between worker processes instead of each assuming all of them
+        inference_workers = max(1, (os.cpu_count() or 1) // self.processes)
+        worker.commands = self._ctx.Queue()
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.worker_id, list(worker.cameras), self._events, worker.commands,
+                  os.getpid(), self.config_path, inference_workers),
+            name=f"camera-worker-{worker.worker_id}",
+            daemon=True
+        )
+        worker.started = worker.last_heartbeat = time.time()
+        worker.process.start()
+        logger.info(f"Started camera worker {worker.worker_id} (pid {worker.process.pid}) "
+                    f"for {len(worker.cameras)} cameras")
+
+    def _receive_loop(self):
+        while self.running:
+            try:
+                message = self._events.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                if message[0] == 'frame':
+                    _, url, seq, timestamp, analysis, source_fps = message
+                    # Copied out of the ring: the hub, display queue and recorder
+                    # hold frames for longer than the ring's few slots last
+                    with self._lock:
+                        ring = self._rings.get(url)
+                        if ring is None:
+                            # A removed camera's last frames are still in flight
+                            continue
+                        frame = ring.read(seq, copy=True)
+                    if frame is None:
+                        # The worker lapped us; the slot holds (or is being written with) a newer frame
+                        metrics.count(url, 'ring_overruns')
+                        continue
+                    hub = self.hubs.get(url)
+                    hub.source_fps = source_fps
+                    hub.publish(frame, timestamp, meta=analysis)
+                elif message[0] == 'heartbeat':
+                    _, worker_id, pid, states = message
+                    self._workers[worker_id].last_heartbeat = time.time()
+                    for name, state in states.items():
+                        connection = supervisor.register(name)
+                        connection.state = state['state']
+                        connection.failures = state['failures']
+                        connection.reconnects = state['reconnects']
+                        connection.last_error = state['last_error']
+                        if state['last_frame_age'] is not None:
+                            connection.last_frame = time.time() - state['last_frame_age']
+            except Exception as e:
+                logger.error(f"Error handling worker message: {str(e)}")
+
+    def _monitor_loop(self):
+        while self.running:
+            time.sleep(1.0)
+            now = time.time()
+            with self._lock:
+                workers = list(self._workers)
+            for worker in workers:
+                if not self.running or not worker.cameras:
+                    continue
+                if worker.alive and now - worker.last_heartbeat <= self.heartbeat_timeout:
+                    continue
+                reason = 'exited' if not worker.alive else 'stopped sending heartbeats'
+                logger.warning(f"Camera worker {worker.worker_id} {reason}; restarting")
+                self._stop_worker(worker)
+                worker.restarts += 1
+                metrics.count(f"worker-{worker.worker_id}", 'worker_restarts')
+                # Back off when a worker keeps dying right after starting
+                if now - worker.started < 30:
+                    time.sleep(min(60.0, self.restart_delay * 2 ** min(worker.restarts, 5)))
+                with self._lock:
+                    if self.running:
+                        self._start_worker(worker)
+
+    def _stop_worker(self, worker, timeout=5.0):
+        if worker.process is None:
+            return
+        if worker.process.is_alive():
+            try:
+                worker.commands.put(('stop',))
+            except Exception:
+                pass
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join(timeout)
+        worker.process = None
+
+    def stats(self):
+        now = time.time()
+        return [{
+            'worker': worker.worker_id,
+            'pid': worker.process.pid if worker.process is not None else None,
+            'alive': worker.alive,
+            'cameras': [spec['url'] for spec in worker.cameras],
+            'restarts': worker.restarts,
+            'heartbeat_age': round(now - worker.last_heartbeat, 1) if worker.last_heartbeat else None
+        } for worker in self._workers]
+
+    def stop(self):
+        self.running = False
+        for worker in self._workers:
+            self._stop_worker(worker)
+        for ring in self._rings.values():
+            ring.close()
@@ -0,0 +1,29 @@
+import yaml
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_PATH = Path('config') / 'default_config.yaml'
+# Cameras, detector model paths and web server settings
+CAMERA_CONFIG_PATH = Path('config.yaml')
+
+
+def load_config(path=DEFAULT_CONFIG_PATH):
+    """Load a YAML config file, returning an empty dict if it is missing"""
+    path = Path(path)
+    if not path.exists():
+        logger.warning(f"Config file not found: {path}")
+        return {}
+    with open(path, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+
+def get_setting(config, dotted_key, default=None):
+    """Look up a nested setting such as 'ai.inference.workers'"""
+    value = config
+    for key in dotted_key.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return default
+        value = value[key]
+    return value
@@ -0,0 +1,167 @@
+import cv2
+import random
+import threading
+import time
+import logging
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CONNECTING = 'connecting'
+LIVE = 'live'
+STALLED = 'stalled'
+DOWN = 'down'
+STOPPED = 'stopped'
+
+
+def open_capture(url, timeout=5.0, read_timeout=None):
+    """Open a stream with open and read timeouts so a dead host can't block for long"""
+    return cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(timeout * 1000),
+        cv2.CAP_PROP_READ_TIMEOUT_MSEC, int((read_timeout or timeout) * 1000)
+    ])
+
+
+class CameraConnection:
+    """Connection state of one camera, as reported by /cameras and the status command"""
+    __slots__ = ('name', 'state', 'since', 'failures', 'reconnects', 'last_frame', 'last_error')
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CONNECTING
+        self.since = time.time()
+        self.failures = 0
+        self.reconnects = 0
+        self.last_frame = None
+        self.last_error = None
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'state': self.state,
+            'since': self.since,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'last_frame_age': round(now - self.last_frame, 1) if self.last_frame else None,
+            'last_error': self.last_error
+        }
+
+
+class ConnectionSupervisor:
+    """Owns the lifecycle of every camera capture in the process.
+
+    Failed cameras retry with jittered exponential backoff. A semaphore
+    bounds how many captures may be opening at once, so a switch reboot
+    doesn't make every camera reconnect in the same instant. A watchdog
+    marks live cameras as stalled when no frame has arrived for
+    `stall_timeout` seconds. The capture's read timeout has the same
+    value, so a stalled read gives up and the camera is reconnected.
+    """
+
+    def __init__(self, max_concurrent_connects=4, open_timeout=10.0, stall_timeout=10.0,
+                 backoff_base=1.0, backoff_max=60.0):
+        self.open_timeout = open_timeout
+        self.stall_timeout = stall_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._connect_slots = threading.BoundedSemaphore(max_concurrent_connects)
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._watchdog = None
+
+    def configure(self, max_concurrent_connects=None, open_timeout=None, stall_timeout=None,
+                  backoff_base=None, backoff_max=None):
+        """Apply settings from config; call before any camera connects"""
+        if max_concurrent_connects is not None:
+            self._connect_slots = threading.BoundedSemaphore(max_concurrent_connects)
+        if open_timeout is not None:
+            self.open_timeout = open_timeout
+        if stall_timeout is not None:
+            self.stall_timeout = stall_timeout
+        if backoff_base is not None:
+            self.backoff_base = backoff_base
+        if backoff_max is not None:
+            self.backoff_max = backoff_max
+
+    def register(self, name):
+        with self._lock:
+            connection = self._connections.get(name)
+            if connection is None:
+                connection = self._connections[name] = CameraConnection(name)
+            if self._watchdog is None:
+                self._watchdog = threading.Thread(target=self._watch_stalls, name='connection-watchdog', daemon=True)
+                self._watchdog.start()
+        return connection
+
+    def _set_state(self, connection, state):
+        if connection.state != state:
+            logger.info(f"Camera {connection.name}: {connection.state} -> {state}")
+            connection.state = state
+            connection.since = time.time()
+
+    def connect(self, connection, url):
+        """Open a capture for the camera; returns None if it could not be opened"""
+        self._set_state(connection, CONNECTING)
+        cap = None
+        with self._connect_slots:
+            try:
+                cap = open_capture(url, self.open_timeout, self.stall_timeout)
+                if cap.isOpened():
+                    return cap
+                connection.last_error = 'could not open stream'
+            except Exception as e:
+                connection.last_error = str(e)
+        if cap is not None:
+            cap.release()
+        self._mark_down(connection)
+        return None
+
+    def frame_received(self, connection, timestamp):
+        connection.last_frame = timestamp
+        if connection.state != LIVE:
+            if connection.failures:
+                connection.reconnects += 1
+                metrics.count(connection.name, 'reconnects')
+            connection.failures = 0
+            self._set_state(connection, LIVE)
+
+    def disconnect(self, connection, cap, reason):
+        """Release a failed capture; the caller waits backoff() before reconnecting"""
+        try:
+            cap.release()
+        except Exception as e:
+            logger.error(f"Error releasing capture for {connection.name}: {str(e)}")
+        connection.last_error = reason
+        self._mark_down(connection)
+
+    def _mark_down(self, connection):
+        connection.failures += 1
+        self._set_state(connection, DOWN)
+
+    def backoff(self, connection):
+        """Delay before the next attempt: exponential in the failure count, with full jitter"""
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** min(connection.failures - 1, 16))
+        return random.uniform(self.backoff_base, max(self.backoff_base, ceiling))
+
+    def stopped(self, connection):
+        self._set_state(connection, STOPPED)
+
+    def _watch_stalls(self):
+        while True:
+            time.sleep(1.0)
+            now = time.time()
+            with self._lock:
+                connections = list(self._connections.values())
+            for connection in connections:
+                if connection.state == LIVE and connection.last_frame and \
+                        now - connection.last_frame > self.stall_timeout:
+                    connection.last_error = f"no frame for {self.stall_timeout:.0f}s"
+                    self._set_state(connection, STALLED)
+
+    def states(self):
+        with self._lock:
+            return {name: connection.to_dict() for name, connection in self._connections.items()}
+
+
+# Process-wide supervisor shared by every frame hub
+supervisor = ConnectionSupervisor()
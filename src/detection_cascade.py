@@ -0,0 +1,152 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# HOG people detector window; smaller regions are grown to fit it
+MIN_ROI_WIDTH = 64
+MIN_ROI_HEIGHT = 128
+
+
+class CascadeResult:
+    """Outcome of one cascade pass, including the work it avoided"""
+    __slots__ = ('detections', 'motion_regions', 'motion_detected',
+                 'detector_runs', 'detector_runs_skipped', 'pixels_scanned', 'pixels_skipped')
+
+    def __init__(self):
+        self.detections = []
+        self.motion_regions = []
+        self.motion_detected = False
+        self.detector_runs = 0
+        self.detector_runs_skipped = 0
+        self.pixels_scanned = 0
+        self.pixels_skipped = 0
+
+
+def merge_boxes(boxes):
+    """Merge overlapping (x, y, w, h) boxes until none overlap"""
+    boxes = [list(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        while boxes:
+            x, y, w, h = boxes.pop()
+            i = 0
+            while i < len(boxes):
+                bx, by, bw, bh = boxes[i]
+                if bx <= x + w and x <= bx + bw and by <= y + h and y <= by + bh:
+                    nx, ny = min(x, bx), min(y, by)
+                    w, h = max(x + w, bx + bw) - nx, max(y + h, by + bh) - ny
+                    x, y = nx, ny
+                    boxes.pop(i)
+                    merged = True
+                else:
+                    i += 1
+            result.append([x, y, w, h])
+        boxes = result
+    return [tuple(box) for box in boxes]
+
+
+def pad_box(box, padding, frame_width, frame_height):
+    """Grow a box by a fraction of its size, to the HOG window minimum, clipped to the frame"""
+    x, y, w, h = box
+    pad_x, pad_y = int(w * padding), int(h * padding)
+    x, y, w, h = x - pad_x, y - pad_y, w + 2 * pad_x, h + 2 * pad_y
+    if w < MIN_ROI_WIDTH:
+        x -= (MIN_ROI_WIDTH - w) // 2
+        w = MIN_ROI_WIDTH
+    if h < MIN_ROI_HEIGHT:
+        y -= (MIN_ROI_HEIGHT - h) // 2
+        h = MIN_ROI_HEIGHT
+    x, y = max(0, x), max(0, y)
+    w, h = min(w, frame_width - x), min(h, frame_height - y)
+    return x, y, w, h
+
+
+class DetectionCascade:
+    """Run cheap motion detection first and the expensive detectors only where it fires.
+
+    Motion comes from the camera's background-model detector on the
+    AIProcessor, so a frame already checked by the capture thread is not
+    checked twice. Face and person detection then run only inside the
+    merged, padded bounding boxes of the motion regions. A camera whose
+    pipeline has motion switched off is scanned whole.
+    """
+
+    def __init__(self, ai_processor, padding=0.25):
+        self.ai_processor = ai_processor
+        self.padding = padding
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def process(self, frame, camera=None, seq=None, detect_faces=True, detect_people=True):
+        result = CascadeResult()
+        settings = self.ai_processor.detector_settings(camera)
+        detectors = []
+        if detect_faces and settings['faces']['enabled']:
+            detectors.append(self.ai_processor.detect_faces)
+        if detect_people and settings['people']['enabled']:
+            detectors.append(self.ai_processor.detect_people)
+
+        height, width = frame.shape[:2]
+        frame_pixels = width * height
+
+        if settings['motion']['enabled']:
+            motion = self.ai_processor.motion_detector(camera).detect(frame, seq)
+            result.motion_regions = motion.regions
+            result.motion_detected = motion.motion_detected
+            rois = merge_boxes(pad_box(box, self.padding, width, height) for box in result.motion_regions)
+        else:
+            rois = [(0, 0, width, height)]
+        for detector in detectors:
+            if not rois:
+                result.detector_runs_skipped += 1
+                result.pixels_skipped += frame_pixels
+                continue
+            scanned = 0
+            for x, y, w, h in rois:
+                try:
+                    for detection in detector(frame[y:y+h, x:x+w], camera):
+                        dx, dy, dw, dh = detection.box
+                        detection.box = (dx + x, dy + y, dw, dh)
+                        detection.camera = camera
+                        detection.seq = seq
+                        result.detections.append(detection)
+                except Exception as e:
+                    logger.error(f"Error in cascade detector stage: {str(e)}")
+                result.detector_runs += 1
+                scanned += w * h
+            result.pixels_scanned += scanned
+            result.pixels_skipped += max(0, frame_pixels - scanned)
+
+        self._record(camera, result)
+        return result
+
+    def _record(self, camera, result):
+        with self._lock:
+            totals = self._totals.setdefault(camera, {
+                'frames': 0,
+                'motion_frames': 0,
+                'detector_runs': 0,
+                'detector_runs_skipped': 0,
+                'pixels_scanned': 0,
+                'pixels_skipped': 0
+            })
+            totals['frames'] += 1
+            totals['motion_frames'] += int(result.motion_detected)
+            totals['detector_runs'] += result.detector_runs
+            totals['detector_runs_skipped'] += result.detector_runs_skipped
+            totals['pixels_scanned'] += result.pixels_scanned
+            totals['pixels_skipped'] += result.pixels_skipped
+
+    def stats(self):
+        with self._lock:
+            return {camera: dict(totals) for camera, totals in self._totals.items()}
+
+    def analyze(self, frame, camera=None, seq=None, **kwargs):
+        return self.process(frame, camera, seq, **kwargs).detections
+
+    def analyze_batch(self, items, **kwargs):
+        """Same interface as AIProcessor.analyze_batch so the scheduler can use either"""
+        return [self.analyze(frame, camera, seq, **kwargs) for camera, seq, frame in items]
@@ -0,0 +1,77 @@
+import copy
+
+
+def scale_box(box, sx, sy):
+    x, y, w, h = box
+    return (int(round(x * sx)), int(round(y * sy)), int(round(w * sx)), int(round(h * sy)))
+
+
+class Detection:
+    """A single detector hit in source-frame pixel coordinates"""
+    __slots__ = ('label', 'box', 'score', 'camera', 'seq', 'track_id')
+
+    def __init__(self, label, box, score=1.0, camera=None, seq=None, track_id=None):
+        self.label = label
+        self.box = tuple(int(v) for v in box)
+        self.score = float(score)
+        self.camera = camera
+        self.seq = seq
+        self.track_id = track_id
+
+    def to_dict(self):
+        return {
+            'label': self.label,
+            'box': list(self.box),
+            'score': round(self.score, 3),
+            'camera': self.camera,
+            'seq': self.seq,
+            'track_id': self.track_id
+        }
+
+    def scaled(self, sx, sy):
+        """Copy with the box mapped to a differently sized frame"""
+        return Detection(self.label, scale_box(self.box, sx, sy), self.score, self.camera, self.seq,
+                         self.track_id)
+
+    def __repr__(self):
+        return f"Detection({self.label!r}, {self.box}, {self.score:.2f})"
+
+
+class FrameAnalysis:
+    """Everything the detectors found in one frame, kept apart from the pixels"""
+    __slots__ = ('camera', 'seq', 'timestamp', 'motion', 'detections', 'events')
+
+    def __init__(self, camera=None, seq=None, timestamp=None, motion=None, detections=None, events=None):
+        self.camera = camera
+        self.seq = seq
+        self.timestamp = timestamp
+        self.motion = motion
+        self.detections = detections or []
+        # Track enter/exit events raised while producing this analysis
+        self.events = events or []
+
+    @property
+    def motion_detected(self):
+        return self.motion is not None and self.motion.motion_detected
+
+    def scaled(self, sx, sy):
+        """Copy with every box mapped to a differently sized frame, e.g. from the
+        analysis resolution back to the stream being shown or recorded"""
+        if sx == 1 and sy == 1:
+            return self
+        motion = None
+        if self.motion is not None:
+            motion = copy.copy(self.motion)
+            motion.regions = [scale_box(box, sx, sy) for box in self.motion.regions]
+        events = [dict(event, boxes=[list(scale_box(box, sx, sy)) for box in event.get('boxes', [])])
+                  for event in self.events]
+        return FrameAnalysis(self.camera, self.seq, self.timestamp, motion,
+                             [detection.scaled(sx, sy) for detection in self.detections], events)
+
+    def overlays(self):
+        """Detections plus motion regions, ready for rendering"""
+        items = list(self.detections)
+        if self.motion is not None:
+            items.extend(Detection('Motion', box, self.motion.score, self.camera, self.seq)
+                         for box in self.motion.regions)
+        return items
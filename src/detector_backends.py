@@ -0,0 +1,262 @@
+import cv2
+import time
+import threading
+import logging
+import numpy as np
+from abc import ABC, abstractmethod
+from pathlib import Path
+from detections import Detection
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Model class names mapped to the labels the rest of the pipeline uses
+# (overlay colors, recording filters, the event index)
+LABEL_NAMES = {'person': 'Person', 'face': 'Face'}
+
+
+class DetectorBackend(ABC):
+    """Object detector the inference scheduler can hand batches of frames to.
+
+    Backends take a list of (camera, seq, frame) tuples and return one list
+    of detections per frame, in frame coordinates. AIProcessor and
+    DetectionCascade already follow this interface and serve as the Haar/HOG
+    backend.
+    """
+
+    name = None
+
+    def load(self):
+        """Load models once; returns False if the backend can't be used"""
+        return True
+
+    @abstractmethod
+    def analyze_batch(self, items, **kwargs):
+        """One list of detections per (camera, seq, frame) item"""
+
+
+class NullBackend(DetectorBackend):
+    """Detects nothing, for cameras that only need motion or live view"""
+
+    name = 'none'
+
+    def analyze_batch(self, items, **kwargs):
+        return [[] for _ in items]
+
+
+class DnnBackend(DetectorBackend):
+    """cv2.dnn detector for YOLO and SSD-style models.
+
+    YOLO models can be Darknet (.cfg/.weights) or ONNX exports in the
+    YOLOv5 layout (boxes x classes+5, with objectness) or the YOLOv8 layout
+    (classes+4 x boxes, transposed, no objectness). The network is loaded
+    and warmed up once. Frames from several cameras
+    go through a single forward pass via blobFromImages, and results are
+    filtered by the confidence threshold and per-class non-maximum
+    suppression. cv2.dnn networks aren't thread-safe, so forward passes are
+    serialized; OpenCV parallelizes inside each one.
+    """
+
+    name = 'dnn'
+
+    def __init__(self, model_path, config_path=None, labels_path=None, confidence_threshold=0.5,
+                 nms_threshold=0.4, input_size=416, scale=1 / 255.0, swap_rb=True, classes=None,
+                 warmup_runs=2):
+        self.model_path = Path(model_path)
+        self.config_path = Path(config_path) if config_path else None
+        self.labels_path = Path(labels_path) if labels_path else None
+        self.confidence_threshold = confidence_threshold
+        self.nms_threshold = nms_threshold
+        if isinstance(input_size, int):
+            input_size = (input_size, input_size)
+        self.input_size = tuple(input_size)
+        self.scale = scale
+        self.swap_rb = swap_rb
+        self.classes = set(classes) if classes else None
+        self.warmup_runs = warmup_runs
+        # Darknet YOLO layers output normalized boxes; ONNX exports use input pixels
+        self.darknet = self.model_path.suffix == '.weights' or (
+            self.config_path is not None and self.config_path.suffix == '.cfg')
+        self.labels = []
+        self.net = None
+        self.output_names = []
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            if not self.model_path.exists():
+                logger.error(f"DNN model not found: {self.model_path}")
+                return False
+            net = cv2.dnn.readNet(str(self.model_path), str(self.config_path) if self.config_path else '')
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            if self.labels_path is not None and self.labels_path.exists():
+                self.labels = [line.strip() for line in self.labels_path.read_text().splitlines() if line.strip()]
+            self.net = net
+            self.output_names = net.getUnconnectedOutLayersNames()
+            self.warmup()
+            logger.info(f"DNN model loaded: {self.model_path} ({len(self.labels)} labels)")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading DNN model {self.model_path}: {str(e)}")
+            self.net = None
+            return False
+
+    def warmup(self):
+        """Run a few blank frames so the first real batch doesn't pay for lazy initialization"""
+        width, height = self.input_size
+        blob = np.zeros((1, 3, height, width), dtype=np.float32)
+        started = time.perf_counter()
+        with self._lock:
+            for _ in range(self.warmup_runs):
+                self.net.setInput(blob)
+                self.net.forward(self.output_names)
+        logger.info(f"DNN warmup took {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def class_name(self, class_id):
+        return self.labels[class_id] if class_id < len(self.labels) else str(class_id)
+
+    def analyze_batch(self, items, **kwargs):
+        if self.net is None or not items:
+            return [[] for _ in items]
+        frames = [frame for _, _, frame in items]
+        with metrics.timer('scheduler', 'detect_dnn'):
+            blob = cv2.dnn.blobFromImages(frames, self.scale, self.input_size, swapRB=self.swap_rb, crop=False)
+            with self._lock:
+                self.net.setInput(blob)
+                outputs = self.net.forward(self.output_names)
+
+        results = []
+        for i, (camera, seq, frame) in enumerate(items):
+            height, width = frame.shape[:2]
+            candidates = []
+            for output in outputs:
+                if output.ndim == 4 and output.shape[-1] == 7:
+                    candidates.extend(self._ssd_candidates(output, i, width, height))
+                else:
+                    boxes, scores = self._yolo_rows(output, len(frames), i)
+                    candidates.extend(self._yolo_candidates(boxes, scores, width, height))
+            results.append(self._suppress(candidates, camera, seq))
+        return results
+
+    def _yolo_rows(self, output, batch_size, index):
+        """One image's YOLO boxes as normalized [cx, cy, w, h] plus per-class scores"""
+        if self.darknet:
+            # Rows are [cx, cy, w, h, objectness, class scores...] with the
+            # objectness already folded into the class scores; a batch of one
+            # comes back without the batch axis
+            rows = output.reshape(batch_size, -1, output.shape[-1])[index]
+            return rows[:, :4], rows[:, 5:]
+
+        rows = output.reshape(batch_size, output.shape[-2], output.shape[-1])[index]
+        if rows.shape[0] < rows.shape[1]:
+            # YOLOv8 layout: (4 + classes) x boxes, no objectness column
+            rows = rows.T
+            boxes, scores = rows[:, :4], rows[:, 4:]
+        else:
+            # YOLOv5 layout: boxes x (5 + classes), scores still need objectness
+            boxes, scores = rows[:, :4], rows[:, 5:] * rows[:, 4:5]
+        input_width, input_height = self.input_size
+        return boxes / np.array([input_width, input_height, input_width, input_height], dtype=np.float32), scores
+
+    def _yolo_candidates(self, boxes, scores, width, height):
+        if scores.shape[1] == 0:
+            return []
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(boxes)), class_ids]
+        for row in np.flatnonzero(confidences > self.confidence_threshold):
+            cx, cy, w, h = boxes[row]
+            box = (int((cx - w / 2) * width), int((cy - h / 2) * height), int(w * width), int(h * height))
+            yield int(class_ids[row]), float(confidences[row]), box
+
+    def _ssd_candidates(self, output, index, width, height):
+        # DetectionOutput rows are [image, class, confidence, x1, y1, x2, y2]
+        for image, class_id, confidence, x1, y1, x2, y2 in output.reshape(-1, 7):
+            if int(image) != index or confidence <= self.confidence_threshold:
+                continue
+            box = (int(x1 * width), int(y1 * height), int((x2 - x1) * width), int((y2 - y1) * height))
+            yield int(class_id), float(confidence), box
+
+    def _suppress(self, candidates, camera, seq):
+        by_class = {}
+        for class_id, confidence, box in candidates:
+            by_class.setdefault(class_id, ([], []))
+            by_class[class_id][0].append(box)
+            by_class[class_id][1].append(confidence)
+
+        detections = []
+        for class_id, (boxes, confidences) in by_class.items():
+            name = self.class_name(class_id)
+            if self.classes is not None and name not in self.classes:
+                continue
+            label = LABEL_NAMES.get(name, name)
+            keep = cv2.dnn.NMSBoxes(boxes, confidences, self.confidence_threshold, self.nms_threshold)
+            for k in np.ravel(keep):
+                detections.append(Detection(label, boxes[k], confidences[k], camera, seq))
+        return detections
+
+
+class DetectorRouter:
+    """Route each camera's frames to its selected backend.
+
+    Frames in one scheduler batch are grouped by backend, so every backend
+    still sees a multi-camera batch. Backends built from `factories` are
+    loaded the first time a camera selects them. A camera whose backend is
+    unknown or fails to load uses the fallback backend instead.
+    """
+
+    def __init__(self, backends, factories=None, default='haar', fallback='haar'):
+        self.backends = dict(backends)
+        self.factories = factories or {}
+        self.default = default
+        self.fallback = fallback
+        self._cameras = {}
+        self._lock = threading.Lock()
+
+    def backend(self, name):
+        with self._lock:
+            if name not in self.backends:
+                factory = self.factories.get(name)
+                backend = factory() if factory is not None else None
+                if backend is not None and not backend.load():
+                    backend = None
+                self.backends[name] = backend
+            return self.backends[name]
+
+    def assign(self, camera, name=None):
+        """Select a camera's backend; returns the name actually in use"""
+        name = name or self.default
+        if self.backend(name) is None:
+            logger.warning(f"Detector backend {name} unavailable for {camera}, using {self.fallback}")
+            name = self.fallback
+        self._cameras[camera] = name
+        return name
+
+    def assigned(self, camera):
+        return self._cameras.get(camera)
+
+    def analyze_batch(self, items, **kwargs):
+        groups = {}
+        for i, item in enumerate(items):
+            name = self._cameras.get(item[0]) or self.assign(item[0])
+            groups.setdefault(name, []).append(i)
+
+        results = [[] for _ in items]
+        for name, indices in groups.items():
+            backend = self.backends[name]
+            for i, detections in zip(indices, backend.analyze_batch([items[i] for i in indices], **kwargs)):
+                results[i] = detections
+        return results
+
+
+def dnn_backend(ai_settings):
+    """DnnBackend from the `ai_settings` section of config.yaml"""
+    return DnnBackend(
+        ai_settings['model_path'],
+        ai_settings.get('config_path'),
+        ai_settings.get('labels_path'),
+        confidence_threshold=ai_settings.get('confidence_threshold', 0.5),
+        nms_threshold=ai_settings.get('nms_threshold', 0.4),
+        input_size=ai_settings.get('input_size', 416),
+        classes=ai_settings.get('classes')
+    )
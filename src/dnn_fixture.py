@@ -0,0 +1,72 @@
+"""Tiny Darknet YOLO model for exercising the DNN backend offline on CPU.
+
+    python src/dnn_fixture.py models/test
+
+The network is a single 1x1 convolution feeding a YOLO head, with weights
+set so that bright pixels score as an 'object'. A white square on a dark
+frame therefore gives a predictable detection without downloading a real
+model.
+"""
+import sys
+import struct
+from pathlib import Path
+
+INPUT_SIZE = 32
+ANCHOR = 8
+
+CFG = f"""[net]
+batch=1
+width={INPUT_SIZE}
+height={INPUT_SIZE}
+channels=3
+
+[convolutional]
+filters=6
+size=1
+stride=1
+pad=0
+activation=linear
+
+[yolo]
+mask=0
+anchors={ANCHOR},{ANCHOR}
+classes=1
+num=1
+"""
+
+
+def write_test_model(directory):
+    """Write the cfg, weights and labels files and return matching `ai_settings`"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    config_path = directory / 'test_model.cfg'
+    model_path = directory / 'test_model.weights'
+    labels_path = directory / 'test_model.names'
+
+    config_path.write_text(CFG)
+    labels_path.write_text('object\n')
+
+    # Outputs per cell: tx, ty, tw, th, objectness, class. Box offsets and
+    # sizes stay at the anchor; objectness is 4 * (r + g + b) - 6, so white
+    # (inputs scaled to 0..1) scores sigmoid(6) and black sigmoid(-6).
+    biases = [0.0, 0.0, 0.0, 0.0, -6.0, 10.0]
+    weights = [0.0] * 12 + [4.0, 4.0, 4.0] + [0.0] * 3
+    with open(model_path, 'wb') as file:
+        # Header: major, minor, revision, then a 64-bit images-seen count
+        file.write(struct.pack('<iiiq', 0, 2, 0, 0))
+        file.write(struct.pack(f'<{len(biases)}f', *biases))
+        file.write(struct.pack(f'<{len(weights)}f', *weights))
+
+    return {
+        'model_path': str(model_path),
+        'config_path': str(config_path),
+        'labels_path': str(labels_path),
+        'input_size': INPUT_SIZE,
+        'confidence_threshold': 0.5
+    }
+
+
+if __name__ == '__main__':
+    settings = write_test_model(sys.argv[1] if len(sys.argv) > 1 else 'models/test')
+    for key, value in settings.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,275 @@
+import json
+import time
+import threading
+import logging
+from collections import deque
+from camera_analyzer import FrameScaler
+from detections import FrameAnalysis
+from metrics import metrics
+from motion_detector import MotionDetector
+from recording_index import EventTracker
+
+logger = logging.getLogger(__name__)
+
+# Events that describe current state: an undelivered one is replaced by a
+# newer one for the same camera rather than queued behind it
+COALESCED_TYPES = {'frame', 'detection', 'motion_score'}
+# The newest event of these types is replayed to every new client
+STICKY_TYPES = {'connection'}
+
+
+def frame_event(analysis, size):
+    """Compact per-analysis event: boxes with track IDs and the motion score"""
+    return {
+        'camera': analysis.camera,
+        'ts': analysis.timestamp,
+        'type': 'frame',
+        'seq': analysis.seq,
+        'size': list(size),
+        'motion': round(analysis.motion.score, 4) if analysis.motion is not None else 0.0,
+        'boxes': [{'label': d.label, 'box': list(d.box), 'score': round(d.score, 3), 'id': d.track_id}
+                  for d in analysis.overlays()]
+    }
+
+
+class EventSubscription:
+    """One client's bounded queue of events.
+
+    Coalesced event types replace any undelivered event of the same type
+    for the same camera, so a slow client sees the newest state instead of
+    a backlog. Other events queue up to `max_queue`. Beyond that the oldest
+    are dropped and the client gets a 'dropped' event with the count it
+    missed. A client that stays backed up for `max_lag` seconds is closed.
+    """
+
+    def __init__(self, cameras=None, types=None, max_queue=256, max_lag=30.0):
+        self.cameras = set(cameras) if cameras else None
+        self.types = set(types) if types else None
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+        self._unreported = 0
+        self._queue = deque()
+        self._coalesced = {}
+        self._backed_up_since = None
+        self._cond = threading.Condition()
+        # Called after each queued event, e.g. to wake an async writer
+        self.listener = None
+
+    def wants(self, event):
+        return ((self.cameras is None or event.get('camera') in self.cameras) and
+                (self.types is None or event['type'] in self.types))
+
+    def offer(self, event):
+        """Queue an event; returns False once the subscription is closed"""
+        with self._cond:
+            if self.closed:
+                return False
+            key = None
+            if event['type'] in COALESCED_TYPES:
+                key = (event.get('camera'), event['type'])
+                if key in self._coalesced:
+                    self._coalesced[key] = event
+                    return True
+
+            if len(self._queue) >= self.max_queue:
+                now = time.time()
+                if self._backed_up_since is None:
+                    self._backed_up_since = now
+                elif now - self._backed_up_since > self.max_lag:
+                    self.closed = True
+                    self._cond.notify_all()
+                    return False
+                oldest = self._queue.popleft()
+                if isinstance(oldest, tuple):
+                    self._coalesced.pop(oldest, None)
+                self.dropped += 1
+                self._unreported += 1
+            else:
+                self._backed_up_since = None
+
+            if key is not None:
+                self._coalesced[key] = event
+                self._queue.append(key)
+            else:
+                self._queue.append(event)
+            self._cond.notify()
+        if self.listener is not None:
+            self.listener()
+        return True
+
+    def get(self, timeout=None):
+        """Next event, a 'dropped' summary, or None on timeout or close"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queue or self.closed, timeout=timeout):
+                return None
+            if self._unreported:
+                count, self._unreported = self._unreported, 0
+                return {'ts': time.time(), 'type': 'dropped', 'count': count}
+            if not self._queue:
+                return None
+            item = self._queue.popleft()
+            self.delivered += 1
+            return self._coalesced.pop(item) if isinstance(item, tuple) else item
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        if self.listener is not None:
+            self.listener()
+
+
+class EventBus:
+    """Fan out camera events to any number of push clients without ever blocking publishers"""
+
+    def __init__(self, max_queue=256, max_lag=30.0):
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self._subscriptions = []
+        self._sticky = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, cameras=None, types=None):
+        subscription = EventSubscription(cameras, types, self.max_queue, self.max_lag)
+        with self._lock:
+            for event in self._sticky.values():
+                if subscription.wants(event):
+                    subscription.offer(event)
+            self._subscriptions.append(subscription)
+        metrics.gauge('events', 'event_clients', len(self._subscriptions))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+        metrics.gauge('events', 'event_clients', len(self._subscriptions))
+
+    def publish(self, event):
+        with self._lock:
+            if event['type'] in STICKY_TYPES:
+                self._sticky[(event.get('camera'), event['type'])] = event
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event) and not subscription.offer(event):
+                logger.warning(f"Dropping event client that fell {subscription.max_lag:.0f}s behind")
+                metrics.count('events', 'event_clients_dropped')
+                self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return [{'cameras': sorted(s.cameras) if s.cameras else None,
+                     'delivered': s.delivered,
+                     'dropped': s.dropped}
+                    for s in self._subscriptions]
+
+
+def sse_format(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+def sse_stream(bus, subscription, keepalive=15.0):
+    """Server-sent events for one subscription, with comment keepalives"""
+    try:
+        yield "retry: 3000\n\n"
+        while not subscription.closed:
+            event = subscription.get(timeout=keepalive)
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_format(event)
+    finally:
+        bus.unsubscribe(subscription)
+
+
+class CameraEventSource:
+    """Analyze one camera at a low rate and publish its events.
+
+    Motion detection, the camera's detector and an optional tracker run on
+    the newest frame up to `fps` times a second, whether or not anyone is
+    watching the video. Each analysis publishes a coalesced 'frame' event,
+    plus discrete motion, track and connection events as they happen.
+    """
+
+    def __init__(self, name, hub, bus, detect=None, tracker=None, fps=5.0, width=640, motion_settings=None,
+                 exclusion_zones=None):
+        self.name = name
+        self.hub = hub
+        self.bus = bus
+        self.detect = detect
+        self.tracker = tracker
+        self.fps = fps
+        self.scaler = FrameScaler(width)
+        self.motion_detector = MotionDetector(**(motion_settings or {}))
+        self.motion_detector.set_exclusion_zones(exclusion_zones)
+        self.latest = None
+        self.stopped = False
+        self._events = EventTracker()
+        self._state = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._analyze_loop, name=f"events-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    def overlays(self):
+        """Boxes from the newest analysis, for drawing on the video"""
+        latest = self.latest
+        return latest.overlays() if latest is not None else ()
+
+    def _analyze_loop(self):
+        interval = 1.0 / self.fps
+        last_seq = None
+        while not self.stopped:
+            started = time.time()
+            try:
+                self._publish_state()
+                packet = self.hub.latest()
+                if packet is not None and packet.seq != last_seq:
+                    last_seq = packet.seq
+                    with metrics.timer(self.name, 'events'):
+                        self.analyze(packet)
+            except Exception as e:
+                logger.error(f"Error publishing events for {self.name}: {str(e)}")
+            time.sleep(max(0.0, interval - (time.time() - started)))
+
+    def _publish_state(self):
+        state = self.hub.state
+        if state != self._state:
+            self._state = state
+            self.bus.publish({'camera': self.name, 'ts': time.time(), 'type': 'connection', 'state': state})
+
+    def analyze(self, packet):
+        small = self.scaler.scale(packet.frame)
+        analysis = FrameAnalysis(self.name, packet.seq, packet.timestamp)
+        try:
+            analysis.motion = self.motion_detector.detect(small, packet.seq)
+            detections = self.detect(small) if self.detect else []
+        finally:
+            self.scaler.release(small)
+
+        for detection in detections:
+            detection.camera = self.name
+            detection.seq = packet.seq
+        if self.tracker is not None:
+            analysis.events = self.tracker.update(detections, packet.timestamp)
+            analysis.detections = self.tracker.detections(self.name, packet.seq)
+        else:
+            analysis.detections = detections
+
+        height, width = packet.frame.shape[:2]
+        analysis = analysis.scaled(width / small.shape[1], height / small.shape[0])
+        self.latest = analysis
+        for event in self._events.update(analysis, packet.timestamp):
+            event['camera'] = self.name
+            self.bus.publish(event)
+        self.bus.publish(frame_event(analysis, (width, height)))
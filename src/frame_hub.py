@@ -0,0 +1,236 @@
+import threading
+import time
+import logging
+from metrics import metrics
+from connection_supervisor import supervisor as default_supervisor
+
+logger = logging.getLogger(__name__)
+
+
+class FramePacket:
+    """A decoded frame tagged with its position in the hub's stream.
+
+    `meta` carries anything the producer computed alongside the frame, such
+    as the analysis from a camera worker process.
+    """
+    __slots__ = ('seq', 'timestamp', 'frame', 'meta')
+
+    def __init__(self, seq, timestamp, frame, meta=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.frame = frame
+        self.meta = meta
+
+
+class FrameSubscriber:
+    """Read cursor over a hub. Every subscriber sees the newest frame
+    without taking it away from the others."""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.last_seq = -1
+        self.skipped = 0
+
+    def read(self, timeout=1.0):
+        """Block until a frame newer than the last one read is available"""
+        packet = self.hub.wait(self.last_seq, timeout)
+        if packet is not None:
+            if self.last_seq >= 0:
+                self.skipped += packet.seq - self.last_seq - 1
+            self.last_seq = packet.seq
+        return packet
+
+
+class FrameHub:
+    """Decode a camera stream once and share its frames with any number of subscribers.
+
+    Frames are kept by reference in a small ring buffer, so consumers must
+    treat them as read-only and copy before drawing on them. Opening,
+    reconnecting and stall detection are handled by the connection supervisor.
+
+    With `decode_fps` set, packets that arrive before the next frame is due
+    are only grabbed, never retrieved, so they cost no decoding or color
+    conversion. Use it for hubs that only feed analysis.
+    """
+
+    def __init__(self, name, url, buffer_size=8, supervisor=None, decode_fps=None):
+        self.name = name
+        self.url = url
+        self.buffer_size = buffer_size
+        self.decode_interval = 1.0 / decode_fps if decode_fps else 0.0
+        self.supervisor = supervisor or default_supervisor
+        self.connection = None
+        self.stopped = False
+        self.source_fps = 0.0
+        self._ring = [None] * buffer_size
+        self._seq = -1
+        self._cond = threading.Condition()
+        self._thread = None
+        self._last_frame_time = None
+
+    @property
+    def state(self):
+        return self.connection.state if self.connection is not None else 'stopped'
+
+    def start(self):
+        if self._thread is None:
+            self.connection = self.supervisor.register(self.name)
+            self._thread = threading.Thread(
+                target=self._decode_loop,
+                name=f"hub-{self.name}",
+                daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self, frame, timestamp=None, meta=None):
+        """Append a frame to the ring and wake every waiting subscriber"""
+        with self._cond:
+            self._seq += 1
+            packet = FramePacket(self._seq, timestamp or time.time(), frame, meta)
+            self._ring[self._seq % self.buffer_size] = packet
+            self._cond.notify_all()
+        return packet
+
+    def latest(self):
+        with self._cond:
+            if self._seq < 0:
+                return None
+            return self._ring[self._seq % self.buffer_size]
+
+    def get(self, seq):
+        """Return the frame with the given sequence number if it is still buffered"""
+        with self._cond:
+            if seq < 0 or seq > self._seq:
+                return None
+            packet = self._ring[seq % self.buffer_size]
+            return packet if packet is not None and packet.seq == seq else None
+
+    def wait(self, after_seq=-1, timeout=None):
+        """Wait for a frame newer than after_seq and return the newest one"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self.stopped, timeout)
+            if self._seq <= after_seq:
+                return None
+            return self._ring[self._seq % self.buffer_size]
+
+    def subscribe(self):
+        return FrameSubscriber(self)
+
+    def _update_fps(self, now):
+        if self._last_frame_time is not None:
+            interval = now - self._last_frame_time
+            if interval > 0:
+                fps = 1.0 / interval
+                self.source_fps = fps if self.source_fps == 0 else 0.9 * self.source_fps + 0.1 * fps
+        self._last_frame_time = now
+
+    def _sleep(self, seconds):
+        """Backoff wait that returns early when the hub is stopped"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.stopped, seconds)
+
+    def _decode_loop(self):
+        cap = None
+        connection = self.connection
+        next_decode = 0.0
+        logger.info(f"Started frame hub for {self.name}")
+
+        while not self.stopped:
+            try:
+                if cap is None:
+                    cap = self.supervisor.connect(connection, self.url)
+                    if cap is None:
+                        self._sleep(self.supervisor.backoff(connection))
+                        continue
+
+                with metrics.timer(self.name, 'capture'):
+                    ret = cap.grab()
+                if ret and self.decode_interval:
+                    now = time.time()
+                    if now < next_decode:
+                        # Keep the stream draining but skip the decode
+                        self.supervisor.frame_received(connection, now)
+                        metrics.count(self.name, 'decode_skipped')
+                        continue
+                    next_decode = max(next_decode + self.decode_interval, now)
+                if ret:
+                    with metrics.timer(self.name, 'decode'):
+                        ret, frame = cap.retrieve()
+                if not ret:
+                    logger.warning(f"Failed to read frame from {self.name}")
+                    self.supervisor.disconnect(connection, cap, 'read failed')
+                    cap = None
+                    self._last_frame_time = None
+                    self._sleep(self.supervisor.backoff(connection))
+                    continue
+
+                now = time.time()
+                self.supervisor.frame_received(connection, now)
+                self._update_fps(now)
+                metrics.gauge(self.name, 'source_fps', round(self.source_fps, 2))
+                self.publish(frame, now)
+
+            except Exception as e:
+                logger.error(f"Error in frame hub {self.name}: {str(e)}")
+                # Never drop a capture without releasing it
+                if cap is not None:
+                    self.supervisor.disconnect(connection, cap, str(e))
+                    cap = None
+                    self._last_frame_time = None
+                self._sleep(self.supervisor.backoff(connection))
+
+        if cap is not None:
+            cap.release()
+        self.supervisor.stopped(connection)
+        logger.info(f"Stopped frame hub for {self.name}")
+
+
+class FrameHubRegistry:
+    """One hub per stream URL, shared by every consumer in the process"""
+
+    def __init__(self, buffer_size=8, supervisor=None):
+        self.buffer_size = buffer_size
+        self.supervisor = supervisor or default_supervisor
+        self._hubs = {}
+        self._lock = threading.Lock()
+
+    def get_or_create(self, url, name=None, start=True, decode_fps=None):
+        """Return the hub for a URL. With start=False it doesn't capture by itself
+        and is fed through publish(), e.g. from a camera worker process."""
+        with self._lock:
+            hub = self._hubs.get(url)
+            if hub is None:
+                hub = FrameHub(name or url, url, buffer_size=self.buffer_size, supervisor=self.supervisor,
+                               decode_fps=decode_fps)
+                self._hubs[url] = hub
+            return hub.start() if start else hub
+
+    def get(self, url):
+        return self._hubs.get(url)
+
+    def items(self):
+        with self._lock:
+            return list(self._hubs.items())
+
+    def remove(self, url):
+        """Stop a URL's hub and forget it; returns the hub, if there was one"""
+        with self._lock:
+            hub = self._hubs.pop(url, None)
+        if hub is not None:
+            hub.stop()
+        return hub
+
+    def stop_all(self):
+        with self._lock:
+            for hub in self._hubs.values():
+                hub.stop()
@@ -0,0 +1,147 @@
+import cv2
+import math
+import time
+import threading
+import logging
+import numpy as np
+from overlay import draw_overlays
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class GridCompositor:
+    """Mosaic of camera tiles on a canvas that is allocated once per layout.
+
+    Each camera keeps its tile slot for as long as it is part of the grid,
+    so tiles don't jump around when one camera has no new frame. Frames are
+    resized straight into their tile's view of the canvas and overlays are
+    drawn there, and a tile is only redrawn when its camera delivers a new
+    frame.
+    """
+
+    def __init__(self, cell_size=(640, 480), draw_boxes=True, draw_timestamps=True):
+        self.cell_width, self.cell_height = cell_size
+        self.draw_boxes = draw_boxes
+        self.draw_timestamps = draw_timestamps
+        self.canvas = None
+        self.version = 0
+        self._slots = {}
+        self._cols = 0
+        self._rows = 0
+        self._seqs = {}
+        self._lock = threading.Lock()
+
+    def set_cameras(self, cameras):
+        """Keep existing slots, append new cameras and free removed ones.
+        The canvas is only reallocated when the grid dimensions change."""
+        cameras = list(cameras)
+        with self._lock:
+            if set(cameras) == set(self._slots) and self.canvas is not None:
+                return False
+            n = max(1, len(cameras))
+            cols = int(math.ceil(math.sqrt(n)))
+            rows = int(math.ceil(n / cols))
+            capacity = cols * rows
+
+            slots = {camera: slot for camera, slot in self._slots.items()
+                     if camera in cameras and slot < capacity}
+            used = set(slots.values())
+            free = iter([slot for slot in range(capacity) if slot not in used])
+            for camera in cameras:
+                if camera not in slots:
+                    slots[camera] = next(free)
+
+            if self.canvas is None or (cols, rows) != (self._cols, self._rows):
+                self.canvas = np.zeros((self.cell_height * rows, self.cell_width * cols, 3), dtype=np.uint8)
+                self._cols, self._rows = cols, rows
+                self._seqs = {}
+            else:
+                # Same grid: blank the slots of cameras that left
+                for camera, slot in self._slots.items():
+                    if camera not in slots or slots[camera] != slot:
+                        self._tile(slot)[:] = 0
+                        self._seqs.pop(camera, None)
+            self._slots = slots
+            self.version += 1
+        return True
+
+    def _tile(self, slot):
+        i, j = divmod(slot, self._cols)
+        return self.canvas[i * self.cell_height:(i + 1) * self.cell_height,
+                           j * self.cell_width:(j + 1) * self.cell_width]
+
+    def update(self, camera, frame, overlays=(), timestamp=None, seq=None):
+        """Draw a camera's frame into its tile. Returns False if the tile was
+        already showing this seq (or the camera isn't in the grid)."""
+        with self._lock:
+            slot = self._slots.get(camera)
+            if slot is None or frame is None:
+                return False
+            if seq is not None and self._seqs.get(camera) == seq:
+                return False
+            self._seqs[camera] = seq
+
+            with metrics.timer(camera, 'overlay'):
+                tile = self._tile(slot)
+                height, width = frame.shape[:2]
+                cv2.resize(frame, (self.cell_width, self.cell_height), dst=tile, interpolation=cv2.INTER_AREA)
+                draw_overlays(
+                    tile,
+                    overlays if self.draw_boxes else (),
+                    timestamp if self.draw_timestamps else None,
+                    (self.cell_width / width, self.cell_height / height)
+                )
+            self.version += 1
+        return True
+
+
+class MosaicFeed:
+    """Composite several frame hubs into one mosaic hub at a capped rate.
+
+    The output hub can feed an MJPEGBroadcaster to serve the combined view
+    over HTTP. A snapshot of the canvas is published only when a tile
+    changed, so encoders never see a canvas that is half redrawn. While
+    `active` returns False (e.g. nobody is watching) nothing is composed.
+    """
+
+    def __init__(self, sources, output_hub, compositor=None, max_fps=10.0, overlays=None, active=None):
+        self.sources = sources
+        self.output_hub = output_hub
+        self.compositor = compositor or GridCompositor()
+        self.max_fps = max_fps
+        self.overlays = overlays
+        self.active = active
+        self.stopped = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._compose_loop, name='mosaic', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    def _compose_loop(self):
+        interval = 1.0 / self.max_fps
+        while not self.stopped:
+            started = time.time()
+            if self.active is not None and not self.active():
+                time.sleep(interval)
+                continue
+            try:
+                sources = list(self.sources.items())
+                changed = self.compositor.set_cameras([name for name, _ in sources])
+                for name, hub in sources:
+                    packet = hub.latest()
+                    if packet is None:
+                        continue
+                    overlays = self.overlays(name, packet) if self.overlays else ()
+                    changed |= self.compositor.update(name, packet.frame, overlays, packet.timestamp, packet.seq)
+                if changed:
+                    self.output_hub.publish(self.compositor.canvas.copy())
+            except Exception as e:
+                logger.error(f"Error composing mosaic: {str(e)}")
+            time.sleep(max(0.0, interval - (time.time() - started)))
@@ -0,0 +1,190 @@
+import os
+import math
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceResult:
+    """Detections for one camera frame, delivered back to that camera's pipeline"""
+    __slots__ = ('camera', 'seq', 'timestamp', 'detections', 'latency')
+
+    def __init__(self, camera, seq, timestamp, detections, latency):
+        self.camera = camera
+        self.seq = seq
+        self.timestamp = timestamp
+        self.detections = detections
+        self.latency = latency
+
+
+class CameraSchedule:
+    """Per-camera scheduling state: the single pending frame plus rate limiting"""
+
+    def __init__(self, camera, callback, target_fps):
+        self.camera = camera
+        self.callback = callback
+        self.target_fps = target_fps
+        self.pending = None
+        self.in_flight = False
+        self.next_due = 0.0
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+
+
+class InferenceScheduler:
+    """Central detection scheduler shared by every camera.
+
+    Each camera holds at most one pending frame. A newer frame replaces an
+    older one that has not been picked up yet, so when the system falls
+    behind frames are dropped instead of queuing up latency. Ready frames are
+    grouped into batches sized to keep every worker busy.
+    """
+
+    def __init__(self, ai_processor, workers=None, max_batch=8, default_fps=5.0, **analyze_options):
+        self.ai_processor = ai_processor
+        self.workers = workers or os.cpu_count() or 1
+        self.max_batch = max_batch
+        self.default_fps = default_fps
+        self.analyze_options = analyze_options
+        self.running = False
+        self._cameras = {}
+        self._busy_workers = 0
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.running = True
+            self._thread = threading.Thread(target=self._dispatch_loop, name='inference-dispatch', daemon=True)
+            self._thread.start()
+            logger.info(f"Inference scheduler started with {self.workers} workers")
+        return self
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        self._executor.shutdown(wait=False)
+
+    def register(self, camera, callback, target_fps=None):
+        with self._cond:
+            self._cameras[camera] = CameraSchedule(camera, callback, target_fps or self.default_fps)
+
+    def unregister(self, camera):
+        with self._cond:
+            self._cameras.pop(camera, None)
+
+    def set_target_fps(self, camera, target_fps):
+        with self._cond:
+            schedule = self._cameras.get(camera)
+            if schedule is not None:
+                schedule.target_fps = target_fps
+                # A raised rate takes effect now rather than after the old interval
+                schedule.next_due = min(schedule.next_due, time.time() + 1.0 / target_fps)
+
+    def load(self):
+        """Busy workers plus frames waiting for one, as a fraction of the
+        worker count. Above 1.0 the detectors cannot keep up."""
+        with self._cond:
+            return (self._busy_workers + len(self._ready())) / self.workers
+
+    def submit(self, camera, frame, seq, timestamp=None, release=None):
+        """Offer a frame for detection. Returns False if it was rate limited.
+
+        Once an accepted frame has been analyzed or replaced by a newer one,
+        `release(frame)` is called so the caller can reuse its buffer.
+        """
+        now = time.time()
+        replaced = None
+        with self._cond:
+            schedule = self._cameras.get(camera)
+            if schedule is None or now < schedule.next_due:
+                return False
+            if schedule.pending is not None:
+                schedule.dropped += 1
+                metrics.count(camera, 'inference_dropped')
+                replaced = schedule.pending
+            schedule.pending = (seq, timestamp or now, frame, release)
+            schedule.next_due = now + 1.0 / schedule.target_fps
+            schedule.submitted += 1
+            self._cond.notify_all()
+        if replaced is not None and replaced[3] is not None:
+            replaced[3](replaced[2])
+        return True
+
+    def _ready(self):
+        return [s for s in self._cameras.values() if s.pending is not None and not s.in_flight]
+
+    def _dispatch_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: not self.running or (self._ready() and self._busy_workers < self.workers)
+                )
+                if not self.running:
+                    break
+
+                # Oldest frames first, split so every idle worker gets a share
+                ready = sorted(self._ready(), key=lambda s: s.pending[1])
+                idle = self.workers - self._busy_workers
+                batch_size = min(self.max_batch, math.ceil(len(ready) / idle))
+                batches = []
+                for start in range(0, min(len(ready), idle * batch_size), batch_size):
+                    batch = []
+                    for schedule in ready[start:start + batch_size]:
+                        seq, timestamp, frame, release = schedule.pending
+                        schedule.pending = None
+                        schedule.in_flight = True
+                        batch.append((schedule, seq, timestamp, frame, release))
+                    batches.append(batch)
+                self._busy_workers += len(batches)
+                metrics.gauge('scheduler', 'inference_busy_workers', self._busy_workers)
+                metrics.gauge('scheduler', 'inference_pending', len(ready) - sum(len(b) for b in batches))
+
+            for batch in batches:
+                self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            items = [(schedule.camera, seq, frame) for schedule, seq, _, frame, _ in batch]
+            results = self.ai_processor.analyze_batch(items, **self.analyze_options)
+        except Exception as e:
+            logger.error(f"Error in batched inference: {str(e)}")
+            results = [[] for _ in batch]
+
+        done = time.time()
+        for (schedule, seq, timestamp, _, _), detections in zip(batch, results):
+            metrics.observe(schedule.camera, 'inference_latency', done - timestamp)
+            try:
+                schedule.callback(InferenceResult(schedule.camera, seq, timestamp, detections, done - timestamp))
+            except Exception as e:
+                logger.error(f"Error delivering detections for {schedule.camera}: {str(e)}")
+
+        for _, _, _, frame, release in batch:
+            if release is not None:
+                release(frame)
+
+        with self._cond:
+            for schedule, _, _, _, _ in batch:
+                schedule.in_flight = False
+                schedule.processed += 1
+            self._busy_workers -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                camera: {
+                    'target_fps': s.target_fps,
+                    'submitted': s.submitted,
+                    'processed': s.processed,
+                    'dropped': s.dropped
+                }
+                for camera, s in self._cameras.items()
+            }
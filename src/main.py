@@ -1,5 +1,4 @@
 import cv2
-import numpy as np
 import threading
 import queue
 import time
@@ -7,8 +6,23 @@ import logging
 import os
 import sys
 from pathlib import Path
-from camera_scanner import CameraScanner
-from ai_processor import AIProcessor
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from camera_scanner import CameraScanner, port_open
+from camera_inventory import CameraInventory
+from camera_workers import CameraWorkerPool, build_inference
+from camera_analyzer import CameraAnalyzer
+from detections import FrameAnalysis
+from frame_hub import FrameHubRegistry
+from connection_supervisor import supervisor
+from grid_compositor import GridCompositor
+from recorder import MotionRecorder, camera_slug
+from recording_index import RecordingIndex, EventTracker
+from retention import build_retention, GB
+from metrics import metrics
+from passthrough_recorder import PassthroughRecorder
+from pipeline_config import PipelineConfig, PipelineConfigError, describe
+from config_loader import CAMERA_CONFIG_PATH, DEFAULT_CONFIG_PATH, load_config, get_setting
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,42 +37,108 @@ logger = logging.getLogger(__name__)
 
 class SurveillanceSystem:
     def __init__(self):
-        self.scanner = CameraScanner()
-        self.ai_processor = AIProcessor()
+        self.config = load_config()
+        metrics.configure(enabled=get_setting(self.config, 'system.metrics_enabled', True))
+        camera_config = load_config(CAMERA_CONFIG_PATH)
+        self.camera_settings = {
+            camera['url']: camera for camera in camera_config.get('cameras') or []
+        }
+        # Validated once here; a bad reload later keeps the running pipelines
+        self.pipelines = PipelineConfig(self.config, camera_config)
+        self.camera_pipelines = {}
+        self._pipeline_lock = threading.Lock()
+        self.scanner = CameraScanner(
+            ip_ranges=get_setting(self.config, 'camera_scan.ip_ranges'),
+            ports=get_setting(self.config, 'camera_scan.ports'),
+            credentials=[(c.get('username', ''), c.get('password', ''))
+                         for c in get_setting(self.config, 'camera_scan.credentials', [])] or None,
+            connect_timeout=get_setting(self.config, 'camera_scan.connect_timeout', 0.5),
+            open_timeout=get_setting(self.config, 'camera_scan.open_timeout', 5.0),
+            max_workers=get_setting(self.config, 'camera_scan.max_workers', 50)
+        )
+        self.inventory = CameraInventory(
+            get_setting(self.config, 'camera_scan.inventory_path', 'camera_inventory.json'),
+            max_failures=get_setting(self.config, 'camera_scan.max_failures', 10)
+        )
+        self._camera_lock = threading.Lock()
+        self._discovery_lock = threading.Lock()
+        supervisor.configure(
+            max_concurrent_connects=get_setting(self.config, 'connection.max_concurrent_connects', 4),
+            open_timeout=get_setting(self.config, 'connection.open_timeout', 10),
+            stall_timeout=get_setting(self.config, 'connection.stall_timeout', 10),
+            backoff_base=get_setting(self.config, 'connection.backoff_base', 1),
+            backoff_max=get_setting(self.config, 'connection.backoff_max', 60)
+        )
+        self.hubs = FrameHubRegistry(supervisor=supervisor)
+        
+        # In process mode capture and analysis run in worker processes and
+        # frames arrive through shared memory; otherwise everything is threads
+        self.worker_pool = None
+        self.ai_processor = self.cascade = self.detectors = self.scheduler = None
+        if get_setting(self.config, 'workers.mode', 'threads') == 'processes':
+            self.worker_pool = CameraWorkerPool(
+                self.hubs,
+                processes=get_setting(self.config, 'workers.processes') or None,
+                cameras_per_worker=get_setting(self.config, 'workers.cameras_per_worker', 4),
+                ring_slots=get_setting(self.config, 'workers.ring_slots', 8),
+                max_frame_size=(get_setting(self.config, 'workers.max_frame_width', 1920),
+                                get_setting(self.config, 'workers.max_frame_height', 1080)),
+                heartbeat_timeout=get_setting(self.config, 'workers.heartbeat_timeout', 10)
+            )
+        else:
+            # Workers load their own detectors; only thread mode needs them here
+            self.ai_processor, self.cascade, self.detectors, self.scheduler = build_inference(
+                self.config, ai_settings=camera_config.get('ai_settings') or {}
+            )
         self.cameras = {}
         self.frame_queues = {}
-        self.prev_frames = {}
+        self.analyzers = {}
         self.running = True
-        self.recording_dir = Path('recordings')
+        self.recording_enabled = get_setting(self.config, 'system.recording_enabled', True)
+        self.recording_mode = get_setting(self.config, 'ai.recording.mode', 'transcode')
+        self.recorders = {}
+        self.passthrough_recorders = {}
+        self.show_timestamps = get_setting(self.config, 'display.show_timestamps', True)
+        self.show_detection_boxes = get_setting(self.config, 'display.show_detection_boxes', True)
+        self.recording_dir = Path(get_setting(self.config, 'system.recording_path', 'recordings'))
         self.recording_dir.mkdir(exist_ok=True)
+        self.index = RecordingIndex(self.recording_dir).start() if self.recording_enabled else None
+        if self.index is not None:
+            self.index.finish_stale_segments()
+        
+        self.retention = None
+        if self.index is not None:
+            self.retention = build_retention(self.index, self.recording_dir, self.config)
         
     def start(self):
         try:
             logger.info("Starting surveillance system...")
             
-            # Scan for cameras
-            found_cameras = self.scanner.scan_network()
+            if self.worker_pool is not None:
+                self.worker_pool.start()
+            else:
+                self.scheduler.start()
+            if self.retention is not None:
+                self.retention.start()
             
-            if not found_cameras:
-                logger.warning("No cameras found! Please check network connectivity.")
-                return
+            # Configured and previously discovered cameras start right away;
+            # nothing waits on the network
+            for url in self.known_camera_urls():
+                self.add_camera(url)
+                logger.info(f"Started processing for camera: {url}")
             
-            logger.info(f"Found {len(found_cameras)} cameras")
+            scan_on_startup = get_setting(self.config, 'camera_scan.scan_on_startup', 'auto')
+            full_scan = scan_on_startup is True or (scan_on_startup == 'auto' and not self.frame_queues)
+            if not self.frame_queues:
+                logger.warning("No known cameras yet; scanning the network in the background")
+            threading.Thread(
+                target=self.maintain_inventory,
+                args=(full_scan,),
+                name='camera-discovery',
+                daemon=True
+            ).start()
             
-            # Setup processing for each camera
-            for camera in found_cameras:
-                self.frame_queues[camera['url']] = queue.Queue(maxsize=10)
-                self.prev_frames[camera['url']] = None
-                
-                # Start camera processing thread
-                thread = threading.Thread(
-                    target=self.process_camera,
-                    args=(camera['url'],),
-                    daemon=True
-                )
-                thread.start()
-                
-                logger.info(f"Started processing for camera: {camera['url']}")
+            threading.Thread(target=self.watch_config, name='config-watcher', daemon=True).start()
             
             # Start display thread
             display_thread = threading.Thread(target=self.display_feeds, daemon=True)
@@ -78,11 +158,14 @@ class SurveillanceSystem:
                     h - Help
                     s - System status
                     r - Rescan for cameras
+                    c - Reload configuration
                     """)
                 elif cmd == 's':
                     self.print_status()
                 elif cmd == 'r':
                     self.rescan_cameras()
+                elif cmd == 'c':
+                    self.reload_config()
                     
         except KeyboardInterrupt:
             logger.info("Received shutdown signal")
@@ -91,100 +174,386 @@ class SurveillanceSystem:
         finally:
             self.cleanup()
     
+    def known_camera_urls(self):
+        """Enabled cameras from config.yaml followed by the saved inventory"""
+        urls = [url for url, settings in self.camera_settings.items() if settings.get('enabled', True)]
+        urls += [url for url in self.inventory.urls() if url not in self.camera_settings]
+        return urls
+    
+    def known_hosts(self):
+        """(ip, port) pairs a network scan doesn't need to probe again"""
+        hosts = self.inventory.hosts()
+        for url in self.camera_settings:
+            parts = urlsplit(url)
+            hosts.add((parts.hostname, parts.port or (554 if parts.scheme == 'rtsp' else 80)))
+        return hosts
+    
+    def add_camera(self, camera_url):
+        """Set up the hub, detection schedule and processing thread for a camera"""
+        with self._camera_lock:
+            if camera_url in self.frame_queues:
+                return False
+            self.frame_queues[camera_url] = queue.Queue(maxsize=10)
+        with self._pipeline_lock:
+            pipeline = self.pipelines.resolve(list(self.camera_pipelines) + [camera_url])[camera_url]
+            self.camera_pipelines[camera_url] = pipeline
+        if self.worker_pool is not None:
+            self.worker_pool.add_camera(camera_url, pipeline)
+        else:
+            analyzer = CameraAnalyzer(camera_url, self.ai_processor, self.scheduler, pipeline)
+            self.analyzers[camera_url] = analyzer
+            self.hubs.get_or_create(camera_url)
+            self.ai_processor.configure_camera(camera_url, pipeline)
+            self.detectors.assign(camera_url, pipeline['detection']['backend'])
+            self.scheduler.register(camera_url, analyzer.on_detections, pipeline['detection']['fps'])
+            if pipeline['substream']:
+                # Analysis reads the substream, decoding only the frames it uses
+                self.hubs.get_or_create(pipeline['substream'], decode_fps=pipeline['analysis']['fps'])
+                threading.Thread(
+                    target=self.analyze_substream,
+                    args=(camera_url, pipeline['substream']),
+                    daemon=True
+                ).start()
+        
+        recording = pipeline['recording']['enabled']
+        if self.recording_enabled and self.recording_mode == 'passthrough':
+            if recording:
+                self.passthrough_recorders[camera_url] = self.start_passthrough(camera_url)
+        elif self.recording_enabled:
+            self.recorders[camera_url] = MotionRecorder(
+                camera_url,
+                self.recording_dir,
+                pre_roll=get_setting(self.config, 'ai.recording.pre_roll_seconds', 2.0),
+                post_roll=get_setting(self.config, 'ai.recording.post_roll_seconds', 5.0),
+                default_fps=get_setting(self.config, 'ai.recording.fps', 20),
+                max_queue=get_setting(self.config, 'ai.recording.queue_size', 64),
+                extension=get_setting(self.config, 'ai.recording.format', 'avi'),
+                overlays=get_setting(self.config, 'ai.recording.overlays', True),
+                index=self.index,
+                enabled=recording
+            )
+        
+        thread = threading.Thread(
+            target=self.process_camera,
+            args=(camera_url,),
+            daemon=True
+        )
+        thread.start()
+        if self.pipelines.limits.get('total_detection_fps'):
+            # The new camera takes its share of the detection budget from the others
+            self.apply_pipelines()
+        return True
+    
+    def remove_camera(self, camera_url):
+        """Stop a camera's hub, analysis and recording; its processing thread exits on its own"""
+        with self._camera_lock:
+            if self.frame_queues.pop(camera_url, None) is None:
+                return False
+        with self._pipeline_lock:
+            pipeline = self.camera_pipelines.pop(camera_url, None)
+        if self.worker_pool is not None:
+            self.worker_pool.remove_camera(camera_url)
+        else:
+            self.scheduler.unregister(camera_url)
+            self.analyzers.pop(camera_url, None)
+            self.hubs.remove(camera_url)
+            if pipeline is not None and pipeline['substream']:
+                self.hubs.remove(pipeline['substream'])
+        passthrough = self.passthrough_recorders.pop(camera_url, None)
+        if passthrough is not None:
+            passthrough.stop()
+        if self.pipelines.limits.get('total_detection_fps'):
+            # Its share of the detection budget goes back to the other cameras
+            self.apply_pipelines()
+        logger.info(f"Stopped camera {camera_url}")
+        return True
+    
+    def start_passthrough(self, camera_url):
+        return PassthroughRecorder(
+            camera_url,
+            camera_url,
+            self.recording_dir,
+            segment_seconds=get_setting(self.config, 'ai.recording.segment_seconds', 60),
+            container=get_setting(self.config, 'ai.recording.container', 'mkv'),
+            index=self.index
+        ).start()
+    
+    def apply_pipelines(self):
+        """Push the current pipelines to every running camera that they change"""
+        with self._pipeline_lock:
+            for url, pipeline in self.pipelines.resolve(list(self.camera_pipelines)).items():
+                if pipeline != self.camera_pipelines.get(url):
+                    self.apply_pipeline(url, pipeline)
+    
+    def apply_pipeline(self, camera_url, pipeline):
+        """Switch a running camera to a new pipeline without restarting its stream"""
+        previous = self.camera_pipelines.get(camera_url)
+        if previous is not None and previous['substream'] != pipeline['substream']:
+            logger.warning(f"Substream change for {camera_url} takes effect after a restart")
+            pipeline['substream'] = previous['substream']
+        self.camera_pipelines[camera_url] = pipeline
+        
+        if self.worker_pool is not None:
+            self.worker_pool.update_camera(camera_url, pipeline)
+        else:
+            self.ai_processor.configure_camera(camera_url, pipeline)
+            self.detectors.assign(camera_url, pipeline['detection']['backend'])
+            analyzer = self.analyzers.get(camera_url)
+            if analyzer is not None:
+                analyzer.apply(pipeline)
+        
+        recording = pipeline['recording']['enabled']
+        recorder = self.recorders.get(camera_url)
+        if recorder is not None:
+            recorder.enabled = recording
+        if self.recording_enabled and self.recording_mode == 'passthrough':
+            if recording and camera_url not in self.passthrough_recorders:
+                self.passthrough_recorders[camera_url] = self.start_passthrough(camera_url)
+            elif not recording and camera_url in self.passthrough_recorders:
+                self.passthrough_recorders.pop(camera_url).stop()
+        logger.info(f"Pipeline for {camera_url}: {describe(pipeline)}")
+    
+    def reload_config(self):
+        """Re-read both config files and apply pipeline changes to running cameras.
+        An invalid configuration is rejected as a whole and the current one kept."""
+        try:
+            config = load_config()
+            camera_config = load_config(CAMERA_CONFIG_PATH)
+            pipelines = PipelineConfig(config, camera_config)
+        except PipelineConfigError as e:
+            logger.error(f"Keeping the current configuration: {str(e)}")
+            return False
+        except Exception as e:
+            logger.error(f"Error reloading configuration: {str(e)}")
+            return False
+        
+        self.config = config
+        self.camera_settings = {
+            camera['url']: camera for camera in camera_config.get('cameras') or []
+        }
+        self.pipelines = pipelines
+        self.apply_pipelines()
+        for url in self.known_camera_urls():
+            if self.add_camera(url):
+                logger.info(f"Started camera added to the configuration: {url}")
+        logger.info("Configuration reloaded")
+        return True
+    
+    def watch_config(self):
+        """Reload the configuration whenever either config file changes"""
+        interval = get_setting(self.config, 'pipeline.reload_interval', 5)
+        paths = [DEFAULT_CONFIG_PATH, CAMERA_CONFIG_PATH]
+        
+        def modified():
+            return [path.stat().st_mtime if path.exists() else None for path in paths]
+        
+        last = modified()
+        while interval and self.running:
+            time.sleep(interval)
+            try:
+                current = modified()
+                if current != last:
+                    last = current
+                    logger.info("Configuration changed; reloading")
+                    self.reload_config()
+            except Exception as e:
+                logger.error(f"Error watching configuration: {str(e)}")
+    
+    def on_camera_found(self, camera):
+        """Start streaming a camera as soon as a scan finds it"""
+        self.inventory.mark_seen(camera)
+        if self.add_camera(camera['url']):
+            logger.info(f"Added new camera: {camera['url']}")
+    
+    def revalidate_cameras(self):
+        """Re-check inventory cameras with bounded concurrency; returns (active, offline) URLs"""
+        def check(camera):
+            # A running hub is already connecting to the camera, so a new frame
+            # from it is the check; don't open a second connection
+            hub = self.hubs.get(camera['url'])
+            if hub is not None:
+                return camera if hub.wait(hub.seq, timeout=self.scanner.open_timeout) else None
+            if camera.get('ip') and camera.get('port') and \
+                    not port_open(camera['ip'], camera['port'], self.scanner.connect_timeout):
+                return None
+            return self.scanner.validate(camera['url'], camera.get('ip'), camera.get('port'))
+        
+        active, offline = [], []
+        cameras = self.inventory.cameras()
+        workers = get_setting(self.config, 'camera_scan.revalidate_concurrency', 8)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for camera, result in zip(cameras, executor.map(check, cameras)):
+                if result is not None:
+                    self.inventory.mark_seen(result)
+                    active.append(camera['url'])
+                else:
+                    offline.append(camera['url'])
+                    if self.inventory.mark_failed(camera['url']):
+                        logger.warning(f"Dropped camera from inventory after repeated failures: {camera['url']}")
+                        # Cameras listed in config.yaml keep running regardless
+                        if camera['url'] not in self.camera_settings:
+                            self.remove_camera(camera['url'])
+        return active, offline
+    
+    def discover_cameras(self, full_scan=False):
+        """Revalidate the inventory and optionally scan for cameras it doesn't know yet"""
+        if not self._discovery_lock.acquire(blocking=False):
+            logger.info("Camera discovery already running")
+            return
+        try:
+            known = set(self.inventory.urls())
+            active, offline = self.revalidate_cameras()
+            found = []
+            if full_scan:
+                found = self.scanner.scan_network(skip=self.known_hosts(), on_found=self.on_camera_found)
+            new = [camera['url'] for camera in found if camera['url'] not in known]
+            logger.info(f"Camera inventory: {len(new)} new, {len(active)} active, {len(offline)} offline")
+            for url in offline:
+                logger.warning(f"Camera not responding: {url}")
+        except Exception as e:
+            logger.error(f"Error discovering cameras: {str(e)}")
+        finally:
+            self._discovery_lock.release()
+    
+    def maintain_inventory(self, full_scan=False):
+        """Background discovery at startup, then periodic revalidation"""
+        self.discover_cameras(full_scan)
+        interval = get_setting(self.config, 'camera_scan.revalidate_interval', 300)
+        while interval and self.running:
+            time.sleep(interval)
+            if self.running:
+                self.discover_cameras()
+    
+    def analyze_substream(self, camera_url, substream_url):
+        """Analyze a camera's substream, reporting boxes in main-stream coordinates"""
+        analyzer = self.analyzers[camera_url]
+        main_hub = self.hubs.get(camera_url)
+        subscriber = self.hubs.get(substream_url).subscribe()
+        logger.info(f"Analyzing {camera_url} from substream {substream_url}")
+        
+        while self.running and self.analyzers.get(camera_url) is analyzer:
+            try:
+                packet = subscriber.read(timeout=1.0)
+                if packet is None:
+                    continue
+                main = main_hub.latest()
+                size = (main.frame.shape[1], main.frame.shape[0]) if main is not None else None
+                analyzer.analyze(packet, size)
+            except Exception as e:
+                logger.error(f"Error analyzing substream for {camera_url}: {str(e)}")
+                time.sleep(1)
+    
     def process_camera(self, camera_url):
         """Process video feed from a single camera"""
-        cap = cv2.VideoCapture(camera_url)
+        hub = self.hubs.get(camera_url)
+        subscriber = hub.subscribe()
+        analyzer = self.analyzers.get(camera_url)
+        substream = self.camera_pipelines[camera_url]['substream']
+        recorder = self.recorders.get(camera_url)
+        frames = self.frame_queues[camera_url]
+        camera_id = camera_slug(camera_url)
+        tracker = EventTracker()
+        skipped = 0
         logger.info(f"Started camera processing: {camera_url}")
         
-        # Setup video writer for recording
-        fourcc = cv2.VideoWriter_fourcc(*'XVID')
-        out = None
-        recording = False
-        
-        while self.running:
+        # Runs until shutdown or until remove_camera drops this camera's queue
+        while self.running and self.frame_queues.get(camera_url) is frames:
             try:
-                ret, frame = cap.read()
-                if ret:
-                    # Process frame with AI
-                    processed_frame, motion_detected = self.ai_processor.process_frame(
-                        frame,
-                        self.prev_frames[camera_url]
-                    )
+                packet = subscriber.read(timeout=1.0)
+                if packet is not None:
+                    frame = packet.frame
+                    if subscriber.skipped != skipped:
+                        metrics.count(camera_url, 'frames_dropped', subscriber.skipped - skipped)
+                        skipped = subscriber.skipped
                     
-                    self.prev_frames[camera_url] = frame.copy()
+                    # Frames from a worker process arrive already analyzed.
+                    # Otherwise analysis runs at its own rate and resolution,
+                    # and frames in between reuse the newest result
+                    analysis = packet.meta
+                    if analysis is None and analyzer is not None:
+                        analysis = analyzer.latest if substream else analyzer.analyze(packet)
+                    if analysis is None:
+                        analysis = FrameAnalysis(camera_url, packet.seq, packet.timestamp)
+                    motion_detected = analysis.motion_detected
+                    overlays = analysis.overlays()
                     
-                    # Handle recording if motion is detected
-                    if motion_detected and not recording:
-                        recording = True
-                        timestamp = time.strftime("%Y%m%d-%H%M%S")
-                        video_path = self.recording_dir / f"motion_{timestamp}.avi"
-                        out = cv2.VideoWriter(str(video_path), fourcc, 20.0, 
-                                           (frame.shape[1], frame.shape[0]))
-                        logger.info(f"Started recording: {video_path}")
+                    # Recording runs on its own writer thread; this only
+                    # buffers references and enqueues frames
+                    if recorder is not None:
+                        recorder.update(frame, overlays, packet.timestamp,
+                                        motion_detected, hub.source_fps)
                     
-                    if recording:
-                        out.write(processed_frame)
-                        if not motion_detected:
-                            recording = False
-                            out.release()
-                            out = None
-                            logger.info("Stopped recording")
+                    # Sparse events (motion transitions, detection sets,
+                    # per-second motion) feed the index and sidecar
+                    if self.index is not None:
+                        events = tracker.update(analysis, packet.timestamp)
+                        self.index.add_events(camera_id, events)
+                        # Looked up per frame: a reload can start or stop it
+                        passthrough = self.passthrough_recorders.get(camera_url)
+                        if passthrough is not None:
+                            passthrough.log_events(events)
                     
-                    # Update frame queue
-                    if not self.frame_queues[camera_url].full():
-                        self.frame_queues[camera_url].put(processed_frame)
-                else:
-                    logger.warning(f"Failed to read frame from {camera_url}")
-                    time.sleep(1)
-                    cap = cv2.VideoCapture(camera_url)
+                    # Hand the clean frame and its overlays to the display,
+                    # which draws them after downscaling
+                    if not frames.full():
+                        frames.put((frame, overlays, packet.timestamp))
+                    metrics.gauge(camera_url, 'display_queue_depth', frames.qsize())
                     
             except Exception as e:
                 logger.error(f"Error processing camera {camera_url}: {str(e)}")
                 time.sleep(1)
                 
         # Cleanup
-        cap.release()
-        if out is not None:
-            out.release()
+        if recorder is not None:
+            recorder.stop()
+            if self.recorders.get(camera_url) is recorder:
+                del self.recorders[camera_url]
+        if not self.running:
+            # A removed camera's passthrough recorder was stopped by remove_camera
+            passthrough = self.passthrough_recorders.get(camera_url)
+            if passthrough is not None:
+                passthrough.stop()
     
     def display_feeds(self):
         """Display all camera feeds in a grid"""
         window_name = 'Surveillance System'
         cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
+        compositor = GridCompositor(
+            cell_size=(get_setting(self.config, 'display.cell_width', 640),
+                       get_setting(self.config, 'display.cell_height', 480)),
+            draw_boxes=self.show_detection_boxes,
+            draw_timestamps=self.show_timestamps
+        )
+        interval = 1.0 / get_setting(self.config, 'display.max_fps', 15)
+        latest = {}
         
         while self.running:
             try:
-                frames = []
-                for url, q in self.frame_queues.items():
-                    if not q.empty():
-                        frames.append(q.get())
+                started = time.time()
+                cameras = list(self.frame_queues.items())
+                relayout = compositor.set_cameras(url for url, _ in cameras)
+                changed = relayout
                 
-                if frames:
-                    # Calculate grid dimensions
-                    n = len(frames)
-                    cols = int(np.ceil(np.sqrt(n)))
-                    rows = int(np.ceil(n / cols))
-                    
-                    # Create grid of frames
-                    cell_height = 480
-                    cell_width = 640
-                    
-                    grid = np.zeros((cell_height * rows, cell_width * cols, 3), dtype=np.uint8)
-                    
-                    for idx, frame in enumerate(frames):
-                        i = idx // cols
-                        j = idx % cols
-                        
-                        # Resize frame to fit cell
-                        resized = cv2.resize(frame, (cell_width, cell_height))
-                        
-                        # Place frame in grid
-                        grid[i*cell_height:(i+1)*cell_height,
-                             j*cell_width:(j+1)*cell_width] = resized
-                    
-                    cv2.imshow(window_name, grid)
-                    
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                for url, q in cameras:
+                    # Only the newest queued frame is worth drawing
+                    item = None
+                    while True:
+                        try:
+                            item = q.get_nowait()
+                        except queue.Empty:
+                            break
+                    if item is not None:
+                        latest[url] = item
+                        changed |= compositor.update(url, *item)
+                    elif relayout and url in latest:
+                        changed |= compositor.update(url, *latest[url])
+                
+                if changed:
+                    cv2.imshow(window_name, compositor.canvas)
+                
+                # waitKey doubles as the frame pacing sleep
+                delay = max(1, int((interval - (time.time() - started)) * 1000))
+                if cv2.waitKey(delay) & 0xFF == ord('q'):
                     self.running = False
                     break
                     
@@ -200,34 +569,100 @@ class SurveillanceSystem:
         print(f"Running: {self.running}")
         print(f"Active Cameras: {len(self.frame_queues)}")
         print(f"Recording Directory: {self.recording_dir}")
+        if self.retention is not None:
+            usage = self.retention.usage()
+            time_to_full = usage['time_to_full_seconds']
+            projection = f"{time_to_full / 3600:.1f} h" if time_to_full is not None else "n/a"
+            print(f"Storage: {usage['used_bytes'] / GB:.2f} GB used, "
+                  f"{usage['available_bytes'] / GB:.2f} GB available, full in {projection}")
         print("\nCamera Details:")
-        for url in self.frame_queues.keys():
-            print(f"- {url}")
+        inference_stats = self.scheduler.stats() if self.scheduler is not None else {}
+        for url in list(self.frame_queues):
+            stats = inference_stats.get(url, {})
+            analyzer = self.analyzers.get(url)
+            hub = self.hubs.get(url)
+            source = 'config' if url in self.camera_settings else 'inventory'
+            state = hub.state if hub is not None else 'stopped'
+            print(f"- {url} [{source}, {state}] (detections: {stats.get('processed', 0)} processed, "
+                  f"{stats.get('dropped', 0)} dropped at {stats.get('target_fps', 0)} FPS)")
+            pipeline = self.camera_pipelines.get(url)
+            if pipeline is not None:
+                print(f"    pipeline: {describe(pipeline)}")
+            if analyzer is not None:
+                print(f"    analysis: {analyzer.analyzed} frames analyzed, {analyzer.skipped} skipped, "
+                      f"detector {self.detectors.assigned(url)}")
+                if analyzer.tracker is not None:
+                    analyzer_stats = analyzer.stats()
+                    print(f"    tracking: {analyzer_stats['tracks']} objects, "
+                          f"detecting at {analyzer_stats['detection_fps']} FPS")
+            recorder = self.recorders.get(url)
+            if recorder is not None:
+                print(f"    recording: {'yes' if recorder.recording else 'no'}, "
+                      f"{recorder.clips} clips, {recorder.dropped} frames dropped, "
+                      f"writer queue {recorder.writer.queue_depth}")
+        
+        if self.worker_pool is not None:
+            print("\nCamera Workers:")
+            for worker in self.worker_pool.stats():
+                print(f"- worker {worker['worker']} (pid {worker['pid']}, "
+                      f"{'alive' if worker['alive'] else 'down'}, {worker['restarts']} restarts, "
+                      f"heartbeat {worker['heartbeat_age']}s ago): {len(worker['cameras'])} cameras")
+        
+        if self.cascade is not None:
+            print("\nDetection Cascade:")
+            for url, totals in self.cascade.stats().items():
+                print(f"- {url}: {totals['motion_frames']}/{totals['frames']} frames with motion, "
+                      f"{totals['detector_runs_skipped']} detector runs skipped, "
+                      f"{totals['pixels_skipped'] / 1e6:.1f} MPx skipped")
+        
+        if metrics.enabled:
+            print("\nPipeline Timings (ms p50/p95/p99, achieved FPS):")
+            for camera, data in metrics.snapshot().items():
+                gauges = data.get('gauges', {})
+                counters = data.get('counters', {})
+                header = f"- {camera}"
+                if 'source_fps' in gauges:
+                    header += f" (source {gauges['source_fps']} FPS)"
+                print(header)
+                for stage, stats in sorted(data.get('stages', {}).items()):
+                    print(f"    {stage:<18} {stats['p50'] * 1000:7.1f} {stats['p95'] * 1000:7.1f} "
+                          f"{stats['p99'] * 1000:7.1f}  {stats['fps']:5.1f} FPS")
+                for name, value in sorted(counters.items()):
+                    print(f"    {name:<18} {value}")
+                for name, value in sorted(gauges.items()):
+                    if name != 'source_fps':
+                        print(f"    {name:<18} {value}")
     
     def rescan_cameras(self):
-        """Rescan network for new cameras"""
+        """Rescan in the background, probing only hosts the inventory doesn't know"""
         logger.info("Rescanning for cameras...")
-        new_cameras = self.scanner.scan_network()
-        
-        for camera in new_cameras:
-            if camera['url'] not in self.frame_queues:
-                self.frame_queues[camera['url']] = queue.Queue(maxsize=10)
-                self.prev_frames[camera['url']] = None
-                thread = threading.Thread(
-                    target=self.process_camera,
-                    args=(camera['url'],),
-                    daemon=True
-                )
-                thread.start()
-                logger.info(f"Added new camera: {camera['url']}")
+        threading.Thread(
+            target=self.discover_cameras,
+            args=(True,),
+            name='camera-rescan',
+            daemon=True
+        ).start()
     
     def cleanup(self):
         """Cleanup resources"""
         logger.info("Cleaning up...")
         self.running = False
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
+        if self.retention is not None:
+            self.retention.stop()
+        self.hubs.stop_all()
+        if self.index is not None:
+            self.index.stop()
         cv2.destroyAllWindows()
         logger.info("Cleanup complete")
 
 if __name__ == "__main__":
-    system = SurveillanceSystem()
+    try:
+        system = SurveillanceSystem()
+    except PipelineConfigError as e:
+        logger.error(str(e))
+        sys.exit(1)
     system.start()
@@ -0,0 +1,202 @@
+import time
+import threading
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit
+
+
+class _NullTimer:
+    """Shared do-nothing timer handed out while metrics are disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'camera', 'stage', 'start')
+
+    def __init__(self, metrics, camera, stage):
+        self.metrics = metrics
+        self.camera = camera
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.camera, self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class RollingHistogram:
+    """Durations of the most recent observations of one stage, with their end times"""
+    __slots__ = ('samples', 'count', 'total', 'lock')
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        # Stages are observed from capture and inference threads while /metrics reads
+        self.lock = threading.Lock()
+
+    def add(self, seconds, now):
+        with self.lock:
+            self.samples.append((now, seconds))
+            self.count += 1
+            self.total += seconds
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        with self.lock:
+            samples = list(self.samples)
+        values = sorted(seconds for _, seconds in samples)
+        if not values:
+            return {q: 0.0 for q in quantiles}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+    def rate(self):
+        """Observations per second across the window"""
+        with self.lock:
+            if len(self.samples) < 2:
+                return 0.0
+            span = self.samples[-1][0] - self.samples[0][0]
+            return (len(self.samples) - 1) / span if span > 0 else 0.0
+
+
+class PipelineMetrics:
+    """Per-camera stage timings, counters and gauges.
+
+    Wrap a stage with `with metrics.timer(camera, 'detect_faces'):`. While
+    disabled, timer() returns a shared no-op object and counters and gauges
+    return immediately, so the hooks can stay in the hot path.
+    """
+
+    def __init__(self, enabled=True, window=512):
+        self.enabled = enabled
+        self.window = window
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def configure(self, enabled=None, window=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if window is not None:
+            self.window = window
+
+    def timer(self, camera, stage):
+        if not self.enabled:
+            return NULL_TIMER
+        return _StageTimer(self, camera, stage)
+
+    def observe(self, camera, stage, seconds):
+        if not self.enabled:
+            return
+        key = (camera, stage)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, RollingHistogram(self.window))
+        histogram.add(seconds, time.time())
+
+    def count(self, camera, name, n=1):
+        if not self.enabled:
+            return
+        key = (camera, name)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def gauge(self, camera, name, value):
+        if not self.enabled:
+            return
+        self._gauges[(camera, name)] = value
+
+    def snapshot(self):
+        """Plain-dict view of everything collected, grouped by camera"""
+        cameras = {}
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        for (camera, stage), histogram in histograms:
+            p = histogram.percentiles()
+            cameras.setdefault(camera, {}).setdefault('stages', {})[stage] = {
+                'p50': p[0.5],
+                'p95': p[0.95],
+                'p99': p[0.99],
+                'count': histogram.count,
+                'fps': histogram.rate()
+            }
+        for (camera, name), value in counters.items():
+            cameras.setdefault(camera, {}).setdefault('counters', {})[name] = value
+        for (camera, name), value in gauges.items():
+            cameras.setdefault(camera, {}).setdefault('gauges', {})[name] = value
+        return cameras
+
+    def render_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = [
+            '# HELP surveillance_stage_seconds Pipeline stage duration over the recent window',
+            '# TYPE surveillance_stage_seconds summary'
+        ]
+        rates = []
+        counters = []
+        gauges = []
+        for camera, data in sorted(self.snapshot().items(), key=lambda item: str(item[0])):
+            label = _escape(_camera_label(camera))
+            for stage, stats in sorted(data.get('stages', {}).items()):
+                labels = f'camera="{label}",stage="{_escape(stage)}"'
+                for q, key in ((0.5, 'p50'), (0.95, 'p95'), (0.99, 'p99')):
+                    lines.append(f'surveillance_stage_seconds{{{labels},quantile="{q}"}} {stats[key]:.6f}')
+                lines.append(f'surveillance_stage_seconds_count{{{labels}}} {stats["count"]}')
+                rates.append(f'surveillance_stage_fps{{{labels}}} {stats["fps"]:.3f}')
+            for name, value in sorted(data.get('counters', {}).items()):
+                counters.append(f'surveillance_{_escape(name)}_total{{camera="{label}"}} {value}')
+            for name, value in sorted(data.get('gauges', {}).items()):
+                gauges.append(f'surveillance_{_escape(name)}{{camera="{label}"}} {value}')
+
+        lines += ['# HELP surveillance_stage_fps Achieved rate of each pipeline stage',
+                  '# TYPE surveillance_stage_fps gauge'] + rates
+        lines += _typed(counters, 'counter') + _typed(gauges, 'gauge')
+        return '\n'.join(lines) + '\n'
+
+
+def _typed(samples, kind):
+    """Group samples by metric name, each preceded by its TYPE line"""
+    lines = []
+    seen = set()
+    for sample in sorted(samples):
+        name = sample.split('{', 1)[0]
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} {kind}')
+        lines.append(sample)
+    return lines
+
+
+def _camera_label(camera):
+    # Camera keys may be stream URLs; never expose their credentials
+    camera = str(camera)
+    if '://' not in camera:
+        return camera
+    parts = urlsplit(camera)
+    netloc = parts.hostname or ''
+    if parts.port:
+        netloc += f":{parts.port}"
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide instance used by the pipeline hooks
+metrics = PipelineMetrics()
@@ -0,0 +1,191 @@
+import cv2
+import threading
+import logging
+from overlay import render_overlays
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = b'frame'
+
+
+def multipart_frame(data):
+    return b'--' + BOUNDARY + b'\r\nContent-Type: image/jpeg\r\n\r\n' + data + b'\r\n'
+
+
+class EncodedFrame:
+    """JPEG bytes for one frame at one output setting, filled in by the first reader"""
+    __slots__ = ('ready', 'data')
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.data = None
+
+
+class MJPEGBroadcaster:
+    """Process and JPEG-encode each source frame once for every connected viewer.
+
+    A single worker pulls frames from the camera hub and runs the optional
+    processing step, which returns detections rather than a drawn frame.
+    Encodes are cached per (width, quality) for the current frame, so viewers
+    that ask for the same setting share one encode. Overlays are drawn after
+    downscaling, on the output copy only.
+    """
+
+    def __init__(self, hub, process=None, default_quality=80, max_width=1920, overlays=True):
+        self.hub = hub
+        self.process = process
+        self.overlays = overlays
+        self.default_quality = default_quality
+        self.max_width = max_width
+        self.stopped = False
+        self.viewers = 0
+        # Called with the seq of every newly processed frame, e.g. to wake
+        # async viewers without a thread each
+        self.listeners = []
+        self._cond = threading.Condition()
+        self._seq = -1
+        self._frame = None
+        self._detections = ()
+        self._timestamp = None
+        self._cache = {}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._process_loop,
+                name=f"mjpeg-{self.hub.name}",
+                daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def _process_loop(self):
+        subscriber = self.hub.subscribe()
+        while not self.stopped:
+            try:
+                # Don't spend CPU on processing nobody is watching
+                with self._cond:
+                    if not self._cond.wait_for(lambda: self.viewers > 0 or self.stopped, timeout=1.0):
+                        continue
+                if self.stopped:
+                    break
+
+                packet = subscriber.read(timeout=1.0)
+                if packet is None:
+                    continue
+
+                with metrics.timer(self.hub.name, 'process'):
+                    detections = self.process(packet.frame) if self.process else ()
+
+                with self._cond:
+                    self._seq = packet.seq
+                    self._frame = packet.frame
+                    self._detections = detections
+                    self._timestamp = packet.timestamp
+                    self._cache = {}
+                    self._cond.notify_all()
+                for listener in self.listeners:
+                    listener(packet.seq)
+
+            except Exception as e:
+                logger.error(f"Error in broadcaster for {self.hub.name}: {str(e)}")
+
+    def normalize_settings(self, width=None, quality=None):
+        """Snap client settings to a small set of values so the cache stays bounded"""
+        if width is not None:
+            width = max(64, min(int(width), self.max_width)) // 16 * 16
+        if quality is None:
+            quality = self.default_quality
+        quality = max(10, min(int(quality), 95)) // 5 * 5
+        return width, quality
+
+    def encoded(self, width=None, quality=None):
+        """Return (seq, jpeg bytes) for the newest processed frame"""
+        key = self.normalize_settings(width, quality)
+        with self._cond:
+            seq, frame = self._seq, self._frame
+            detections, timestamp = self._detections, self._timestamp
+            if frame is None:
+                return seq, None
+            entry = self._cache.get(key)
+            owner = entry is None
+            if owner:
+                entry = EncodedFrame()
+                self._cache[key] = entry
+
+        if owner:
+            try:
+                entry.data = self._encode(frame, detections, timestamp, *key)
+            finally:
+                entry.ready.set()
+        else:
+            entry.ready.wait()
+        return seq, entry.data
+
+    def _encode(self, frame, detections, timestamp, width, quality):
+        size = None
+        if width is not None and width < frame.shape[1]:
+            size = (width, int(round(frame.shape[0] * width / frame.shape[1])))
+        with metrics.timer(self.hub.name, 'overlay'):
+            if self.overlays:
+                frame = render_overlays(frame, detections, timestamp, size)
+            elif size is not None:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        with metrics.timer(self.hub.name, 'encode'):
+            ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if ret else None
+
+    def wait(self, after_seq, timeout=1.0):
+        """Block until a frame newer than after_seq has been processed"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self.stopped, timeout)
+            return self._seq > after_seq
+
+    def add_viewer(self):
+        with self._cond:
+            self.viewers += 1
+            metrics.gauge(self.hub.name, 'viewers', self.viewers)
+            self._cond.notify_all()
+
+    def remove_viewer(self):
+        with self._cond:
+            self.viewers -= 1
+            metrics.gauge(self.hub.name, 'viewers', self.viewers)
+
+    def snapshot(self, width=None, quality=None, timeout=2.0):
+        """JPEG bytes of the newest frame, processing one if nobody is watching"""
+        self.add_viewer()
+        try:
+            latest = self.hub.latest()
+            if latest is not None and latest.seq > self._seq:
+                self.wait(latest.seq - 1, timeout)
+            return self.encoded(width, quality)[1]
+        finally:
+            self.remove_viewer()
+
+    def stream(self, width=None, quality=None):
+        """Multipart MJPEG generator for one viewer"""
+        self.add_viewer()
+        try:
+            last_seq = -1
+            while not self.stopped:
+                if not self.wait(last_seq, timeout=1.0):
+                    continue
+                seq, data = self.encoded(width, quality)
+                last_seq = seq
+                if data:
+                    metrics.count(self.hub.name, 'mjpeg_frames_sent')
+                    yield multipart_frame(data)
+        finally:
+            self.remove_viewer()
@@ -0,0 +1,150 @@
+import cv2
+import numpy as np
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MotionResult:
+    """Motion found in one frame: overall score plus regions in source pixels"""
+    __slots__ = ('seq', 'motion_detected', 'score', 'regions')
+
+    def __init__(self, seq=None, motion_detected=False, score=0.0, regions=None):
+        self.seq = seq
+        self.motion_detected = motion_detected
+        self.score = score
+        self.regions = regions or []
+
+
+class MotionDetector:
+    """Stateful motion detection for one camera against a background model.
+
+    Only a small downscaled grayscale state is kept, and every intermediate
+    buffer is allocated once and reused in place. `method` is either
+    'average' (running average, cheapest) or 'mog2' (OpenCV's Gaussian
+    mixture model, more robust to lighting flicker).
+    """
+
+    def __init__(self, width=320, threshold=20, min_area=1000, learning_rate=0.05, method='average'):
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.method = method
+        self.exclusion_zones = []
+        self.last_result = MotionResult()
+        self._lock = threading.Lock()
+        self._source_shape = None
+        self._subtractor = None
+
+    def set_exclusion_zones(self, zones):
+        """Zones are fractions of the frame: [x, y, width, height]"""
+        zones = [tuple(zone) for zone in zones or []]
+        with self._lock:
+            if zones != self.exclusion_zones:
+                self.exclusion_zones = zones
+                self._source_shape = None
+
+    def configure(self, width=None, threshold=None, min_area=None, learning_rate=None, method=None):
+        """Change settings in place. The background model is only rebuilt
+        when the new settings invalidate it (size, method, mog2 threshold)."""
+        with self._lock:
+            rebuild = ((width is not None and width != self.width) or
+                       (method is not None and method != self.method) or
+                       (threshold is not None and threshold != self.threshold and
+                        (method or self.method) == 'mog2'))
+            for name, value in (('width', width), ('threshold', threshold), ('min_area', min_area),
+                                ('learning_rate', learning_rate), ('method', method)):
+                if value is not None:
+                    setattr(self, name, value)
+            if rebuild:
+                self._source_shape = None
+
+    def reset(self):
+        with self._lock:
+            self._source_shape = None
+            self.last_result = MotionResult()
+
+    def _allocate(self, frame):
+        height, width = frame.shape[:2]
+        self._scale = min(1.0, self.width / width)
+        size = (max(1, int(height * self._scale)), max(1, int(width * self._scale)))
+        self._small = np.empty(size + (3,), dtype=np.uint8)
+        self._gray = np.empty(size, dtype=np.uint8)
+        self._diff = np.empty(size, dtype=np.uint8)
+        self._mask = np.empty(size, dtype=np.uint8)
+        self._background = None
+        self._exclusion = None
+        if self.exclusion_zones:
+            self._exclusion = np.full(size, 255, dtype=np.uint8)
+            for zx, zy, zw, zh in self.exclusion_zones:
+                x0, y0 = int(zx * size[1]), int(zy * size[0])
+                x1, y1 = int((zx + zw) * size[1]), int((zy + zh) * size[0])
+                self._exclusion[y0:y1, x0:x1] = 0
+        if self.method == 'mog2':
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(
+                varThreshold=self.threshold, detectShadows=False
+            )
+        self._source_shape = frame.shape
+
+    def detect(self, frame, seq=None):
+        """Update the background model with a frame and return its motion.
+
+        Calling again with the same seq returns the cached result, so several
+        consumers of one frame share a single update. So does a frame older
+        than the last one analyzed (e.g. from the inference thread, which
+        lags the capture thread): feeding it to the background model would
+        rewind it, and the newer result is the better answer anyway.
+        """
+        with self._lock:
+            last_seq = self.last_result.seq
+            if seq is not None and last_seq is not None and seq <= last_seq:
+                return self.last_result
+            try:
+                result = self._detect(frame, seq)
+            except Exception as e:
+                logger.error(f"Error in motion detection: {str(e)}")
+                result = MotionResult(seq)
+            self.last_result = result
+            return result
+
+    def _detect(self, frame, seq):
+        if self._source_shape != frame.shape:
+            self._allocate(frame)
+
+        cv2.resize(frame, (self._small.shape[1], self._small.shape[0]), dst=self._small,
+                   interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        cv2.GaussianBlur(self._gray, (5, 5), 0, dst=self._gray)
+
+        if self.method == 'mog2':
+            self._subtractor.apply(self._gray, self._mask, self.learning_rate)
+        else:
+            if self._background is None:
+                self._background = self._gray.astype(np.float32)
+                return MotionResult(seq)
+            cv2.convertScaleAbs(self._background, dst=self._diff)
+            cv2.absdiff(self._gray, self._diff, dst=self._diff)
+            cv2.accumulateWeighted(self._gray, self._background, self.learning_rate)
+            cv2.threshold(self._diff, self.threshold, 255, cv2.THRESH_BINARY, dst=self._mask)
+
+        if self._exclusion is not None:
+            cv2.bitwise_and(self._mask, self._exclusion, dst=self._mask)
+
+        score = cv2.countNonZero(self._mask) / self._mask.size
+        if score == 0:
+            return MotionResult(seq)
+
+        cv2.dilate(self._mask, None, dst=self._mask, iterations=3)
+        contours, _ = cv2.findContours(self._mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        scale = self._scale
+        min_area = self.min_area * scale * scale
+        regions = []
+        for contour in contours:
+            if cv2.contourArea(contour) > min_area:
+                x, y, w, h = cv2.boundingRect(contour)
+                regions.append((int(x / scale), int(y / scale), int(w / scale), int(h / scale)))
+
+        return MotionResult(seq, bool(regions), score, regions)
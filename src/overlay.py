@@ -0,0 +1,56 @@
+import cv2
+import time
+
+DETECTION_COLORS = {
+    'Face': (255, 0, 0),
+    'Motion': (0, 255, 0),
+    'Person': (0, 0, 255)
+}
+TIMESTAMP_COLOR = (0, 255, 255)
+
+
+def render_overlays(frame, detections=(), timestamp=None, size=None):
+    """Draw detections and a timestamp on an output copy of the frame in one pass.
+
+    When an output size is given the frame is resized first and boxes are
+    scaled to it, so drawing happens on the small output rather than the
+    full-resolution source. The source frame is never modified. With nothing
+    to draw and no resize, the source frame itself is returned.
+    """
+    height, width = frame.shape[:2]
+    if size is not None and (size[0], size[1]) != (width, height):
+        out = cv2.resize(frame, (size[0], size[1]), interpolation=cv2.INTER_AREA)
+    elif detections or timestamp is not None:
+        out = frame.copy()
+    else:
+        return frame
+
+    draw_overlays(out, detections, timestamp, (out.shape[1] / width, out.shape[0] / height))
+    return out
+
+
+def draw_overlays(out, detections=(), timestamp=None, scale=(1.0, 1.0)):
+    """Draw detections and a timestamp onto an already sized output image in place.
+
+    `scale` maps source-frame box coordinates onto the output.
+    """
+    out_height, out_width = out.shape[:2]
+    sx, sy = scale
+    font_scale = max(0.4, 0.9 * out_width / 1280)
+    thickness = 1 if out_width < 960 else 2
+
+    for detection in detections:
+        x, y, w, h = detection.box
+        x, y, w, h = int(x * sx), int(y * sy), int(w * sx), int(h * sy)
+        color = DETECTION_COLORS.get(detection.label, (255, 255, 255))
+        cv2.rectangle(out, (x, y), (x + w, y + h), color, thickness)
+        # Motion boxes and playback overlays carry no track ID
+        track_id = getattr(detection, 'track_id', None)
+        label = detection.label if track_id is None else f"{detection.label} #{track_id}"
+        cv2.putText(out, label, (x, max(10, y - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
+
+    if timestamp is not None:
+        cv2.putText(out, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)),
+                    (10, int(30 * out_height / 720) + 10), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, TIMESTAMP_COLOR, thickness)
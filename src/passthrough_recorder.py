@@ -0,0 +1,327 @@
+import cv2
+import os
+import json
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import logging
+from datetime import datetime
+from pathlib import Path
+from overlay import render_overlays
+from recorder import camera_slug
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'seg_'
+SEGMENT_TIME_FORMAT = '%Y%m%d-%H%M%S'
+EVENTS_FILE = 'events.jsonl'
+SEGMENT_LIST_FILE = 'segments.csv'
+
+# Sidecars with a live writer, so compaction can go through that writer
+_open_logs = {}
+
+
+def segment_start_time(path):
+    """Wall-clock start time of a segment, parsed from its filename"""
+    stem = Path(path).stem
+    if not stem.startswith(SEGMENT_PREFIX):
+        return None
+    try:
+        return datetime.strptime(stem[len(SEGMENT_PREFIX):], SEGMENT_TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+class EventLog:
+    """Append-only JSON-lines sidecar of motion and detection events.
+
+    Lines are written by a background thread so the capture thread never
+    waits on the disk. Compaction runs on the same thread, between writes.
+    """
+
+    def __init__(self, path, max_queue=1024):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._write_loop, name=f"events-{self.path.parent.name}", daemon=True)
+        self._thread.start()
+        _open_logs[self.path.resolve()] = self
+
+    def append(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def compact(self, before):
+        """Queue removal of events older than `before`; skipped if the queue is full"""
+        try:
+            self._queue.put_nowait(('compact', before))
+        except queue.Full:
+            pass
+
+    def stop(self):
+        _open_logs.pop(self.path.resolve(), None)
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _write_loop(self):
+        file = open(self.path, 'a')
+        try:
+            while True:
+                event = self._queue.get()
+                if event is None:
+                    break
+                try:
+                    if isinstance(event, tuple):
+                        file.close()
+                        try:
+                            rewrite_events(self.path, event[1])
+                        finally:
+                            file = open(self.path, 'a')
+                        continue
+                    file.write(json.dumps(event) + '\n')
+                    if self._queue.empty():
+                        file.flush()
+                except Exception as e:
+                    logger.error(f"Error writing event log {self.path}: {str(e)}")
+        finally:
+            file.close()
+
+
+def rewrite_events(path, before):
+    """Rewrite a sidecar without the events older than `before`; returns how many were dropped"""
+    path = Path(path)
+    if not path.exists():
+        return 0
+    temp_path = path.with_name(path.name + '.tmp')
+    dropped = 0
+    with open(path, 'r') as source, open(temp_path, 'w') as target:
+        for line in source:
+            try:
+                keep = json.loads(line)['ts'] >= before
+            except (ValueError, KeyError, TypeError):
+                keep = False
+            if keep:
+                target.write(line)
+            else:
+                dropped += 1
+    if dropped:
+        os.replace(temp_path, path)
+    else:
+        temp_path.unlink()
+    return dropped
+
+
+def compact_events(path, before):
+    """Drop sidecar events older than `before`, through the live writer if there is one"""
+    log = _open_logs.get(Path(path).resolve())
+    if log is not None:
+        log.compact(before)
+    else:
+        rewrite_events(path, before)
+
+
+def read_events(path, start=None, end=None):
+    """Load sidecar events, optionally limited to a time range"""
+    events = []
+    path = Path(path)
+    if not path.exists():
+        return events
+    with open(path, 'r') as file:
+        for line in file:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if start is not None and event['ts'] < start:
+                continue
+            if end is not None and event['ts'] > end:
+                continue
+            events.append(event)
+    return events
+
+
+class PassthroughRecorder:
+    """Store a camera's native compressed stream without decoding or re-encoding.
+
+    ffmpeg copies the packets into fixed-length segments. The segment muxer
+    only cuts on keyframes, so every file starts cleanly. Motion and
+    detection events go to a sidecar log next to the segments, and overlays
+    are drawn only at playback time (see render_playback).
+
+    The URL may also be a local video file, which is read at its native rate
+    and looped. That makes it possible to try the recorder without a camera.
+    """
+
+    def __init__(self, camera, url, recording_dir, segment_seconds=60, container='mkv',
+                 ffmpeg='ffmpeg', restart_delay=5.0, index=None):
+        self.camera = camera
+        self.camera_id = camera_slug(camera)
+        self.index = index
+        self.url = url
+        self.directory = Path(recording_dir) / self.camera_id
+        self.segment_seconds = segment_seconds
+        self.container = container
+        self.ffmpeg = shutil.which(ffmpeg)
+        self.restart_delay = restart_delay
+        self.running = False
+        self.events = None
+        self._process = None
+        self._thread = None
+
+    def command(self):
+        cmd = [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin']
+        if self.url.startswith('rtsp://'):
+            cmd += ['-rtsp_transport', 'tcp']
+        elif '://' not in self.url:
+            # Local file stand-in: read in real time and loop forever
+            cmd += ['-re', '-stream_loop', '-1']
+        cmd += [
+            '-i', self.url,
+            '-map', '0:v', '-map', '0:a?',
+            '-c', 'copy',
+            '-f', 'segment',
+            '-segment_time', str(self.segment_seconds),
+            '-segment_format', self.container,
+            '-segment_list', str(self.directory / SEGMENT_LIST_FILE),
+            '-segment_list_type', 'csv',
+            '-reset_timestamps', '1',
+            '-strftime', '1',
+            str(self.directory / f"{SEGMENT_PREFIX}{SEGMENT_TIME_FORMAT}.{self.container}")
+        ]
+        return cmd
+
+    def start(self):
+        if self.ffmpeg is None:
+            logger.error("ffmpeg not found; passthrough recording is disabled")
+            return self
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.events = EventLog(self.directory / EVENTS_FILE)
+        self.running = True
+        self._thread = threading.Thread(target=self._supervise, name=f"passthrough-{self.camera_id}", daemon=True)
+        self._thread.start()
+        if self.index is not None:
+            threading.Thread(target=self._watch_segments, name=f"segments-{self.camera_id}", daemon=True).start()
+        return self
+
+    def _supervise(self):
+        while self.running:
+            try:
+                logger.info(f"Starting passthrough recording for {self.camera_id}")
+                self._process = subprocess.Popen(self.command(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                _, stderr = self._process.communicate()
+                if self.running:
+                    logger.warning(f"Passthrough recorder for {self.camera_id} exited "
+                                   f"({self._process.returncode}): {stderr.decode(errors='replace').strip()[-200:]}")
+            except Exception as e:
+                logger.error(f"Error in passthrough recorder: {str(e)}")
+            if self.running:
+                time.sleep(self.restart_delay)
+
+    def log_events(self, events):
+        """Append events produced by recording_index.EventTracker to the sidecar"""
+        if self.events is not None:
+            for event in events:
+                self.events.append(event)
+
+    def _watch_segments(self):
+        """Tail ffmpeg's segment list and index each segment once it is complete.
+
+        ffmpeg truncates the list whenever it (re)starts, so a list shorter than
+        what has been read means it is read again from the top. Re-indexing a
+        segment is harmless; the list is also read in full at startup.
+        """
+        list_path = self.directory / SEGMENT_LIST_FILE
+        offset = 0
+        while self.running:
+            try:
+                if list_path.exists():
+                    if list_path.stat().st_size < offset:
+                        offset = 0
+                    with open(list_path, 'r') as file:
+                        file.seek(offset)
+                        lines = file.readlines()
+                        if lines and not lines[-1].endswith('\n'):
+                            lines.pop()
+                        offset += sum(len(line) for line in lines)
+                    for line in lines:
+                        name, start, end = line.strip().rsplit(',', 2)
+                        path = self.directory / Path(name.strip('"')).name
+                        start_ts = segment_start_time(path)
+                        # Already removed by retention
+                        if start_ts is None or not path.exists():
+                            continue
+                        self.index.add_segment(self.camera_id, path, start_ts, 'passthrough')
+                        self.index.finish_segment(path, start_ts + float(end) - float(start))
+            except Exception as e:
+                logger.error(f"Error indexing passthrough segments: {str(e)}")
+            time.sleep(2)
+
+    def stop(self):
+        self.running = False
+        if self._process is not None and self._process.poll() is None:
+            # 'q' is ignored with -nostdin, so terminate lets ffmpeg close the segment
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self.events is not None:
+            self.events.stop()
+
+
+class _EventOverlay:
+    """Minimal detection-like record rebuilt from a sidecar event"""
+    __slots__ = ('label', 'box')
+
+    def __init__(self, label, box):
+        self.label = label
+        self.box = tuple(box)
+
+
+def render_playback(segment_path, events_path=None, hold=1.0, offset=0.0):
+    """Yield (timestamp, frame) from a passthrough segment with overlays drawn from the sidecar.
+
+    Each event's boxes stay on screen for `hold` seconds, or until a newer
+    event replaces them. Playback starts `offset` seconds into the segment.
+    """
+    segment_path = Path(segment_path)
+    if events_path is None:
+        events_path = segment_path.parent / EVENTS_FILE
+    start = segment_start_time(segment_path) or 0.0
+
+    cap = cv2.VideoCapture(str(segment_path))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps if fps > 0 else None
+    events = read_events(events_path, start + offset - hold, start + duration if duration else None)
+    if offset > 0:
+        cap.set(cv2.CAP_PROP_POS_MSEC, offset * 1000.0)
+    index = 0
+    active = []
+    active_until = 0.0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            timestamp = start + cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+            while index < len(events) and events[index]['ts'] <= timestamp:
+                event = events[index]
+                index += 1
+                if event['type'] == 'detection':
+                    active = [_EventOverlay(d['label'], d['box']) for d in event['detections']]
+                elif event['type'] == 'motion_start':
+                    active = [_EventOverlay('Motion', box) for box in event['boxes']]
+                else:
+                    continue
+                active_until = event['ts'] + hold
+
+            overlays = active if timestamp <= active_until else ()
+            yield timestamp, render_overlays(frame, overlays, timestamp)
+    finally:
+        cap.release()
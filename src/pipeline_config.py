@@ -0,0 +1,283 @@
+import copy
+import logging
+from config_loader import get_setting
+
+logger = logging.getLogger(__name__)
+
+
+def number(low=None, high=None, integer=False):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+            return 'must be an integer' if integer else 'must be a number'
+        if low is not None and value < low:
+            return f'must be at least {low}'
+        if high is not None and value > high:
+            return f'must be at most {high}'
+        return None
+    return check
+
+
+def choice(*options):
+    def check(value):
+        return None if value in options else f"must be one of {', '.join(options)}"
+    return check
+
+
+def boolean(value):
+    return None if isinstance(value, bool) else 'must be true or false'
+
+
+# Settings each pipeline stage accepts, with a check that returns an error
+SCHEMA = {
+    'analysis': {'fps': number(0), 'width': number(0, integer=True)},
+    'motion': {'enabled': boolean, 'width': number(16, integer=True), 'threshold': number(1, 255),
+               'min_area': number(0), 'method': choice('average', 'mog2'), 'learning_rate': number(0, 1)},
+    'faces': {'enabled': boolean, 'scale_factor': number(1.01), 'min_neighbors': number(0, integer=True),
+              'min_size': number(1, integer=True)},
+    'people': {'enabled': boolean, 'scale': number(1.01), 'min_neighbors': number(0, integer=True),
+               'win_stride': number(1, integer=True)},
+    'detection': {'fps': number(0.01), 'backend': choice('haar', 'dnn', 'none')},
+    'tracking': {'enabled': boolean, 'idle_fps': number(0.01), 'iou_threshold': number(0, 1),
+                 'min_hits': number(1, integer=True), 'max_age': number(0), 'adaptive': boolean,
+                 'max_load': number(0.1)},
+    'recording': {'enabled': boolean}
+}
+
+LIMITS = {
+    'max_analysis_fps': number(0),
+    'max_analysis_width': number(0, integer=True),
+    'max_detection_fps': number(0),
+    'total_detection_fps': number(0)
+}
+
+# Flat camera keys that predate the `pipeline` block, and where they land
+LEGACY_KEYS = {
+    'analysis_fps': ('analysis', 'fps'),
+    'analysis_width': ('analysis', 'width'),
+    'detector': ('detection', 'backend')
+}
+CAMERA_KEYS = {'name', 'url', 'enabled', 'exclusion_zones', 'substream', 'pipeline'} | set(LEGACY_KEYS)
+
+
+class PipelineConfigError(ValueError):
+    """Every problem found in the pipeline configuration, so it can be fixed in one pass"""
+
+
+def default_pipeline(config, ai_settings=None):
+    """Global stage settings from default_config.yaml, used by every camera unless overridden"""
+    ai_settings = ai_settings or {}
+    return {
+        'analysis': {
+            'fps': get_setting(config, 'ai.analysis.fps', 10),
+            'width': get_setting(config, 'ai.analysis.width', 640)
+        },
+        'motion': {
+            'enabled': get_setting(config, 'ai.motion_detection.enabled', True),
+            'width': get_setting(config, 'ai.motion_detection.width', 320),
+            'threshold': get_setting(config, 'ai.motion_detection.threshold', 20),
+            'min_area': get_setting(config, 'ai.motion_detection.min_area', 1000),
+            'method': get_setting(config, 'ai.motion_detection.method', 'average'),
+            'learning_rate': get_setting(config, 'ai.motion_detection.learning_rate', 0.05)
+        },
+        'faces': {
+            'enabled': get_setting(config, 'ai.face_detection.enabled', True),
+            'scale_factor': get_setting(config, 'ai.face_detection.scale_factor', 1.1),
+            'min_neighbors': get_setting(config, 'ai.face_detection.min_neighbors', 4),
+            'min_size': get_setting(config, 'ai.face_detection.min_size', 30)
+        },
+        'people': {
+            'enabled': get_setting(config, 'ai.person_detection.enabled', True),
+            'scale': get_setting(config, 'ai.person_detection.scale', 1.05),
+            'min_neighbors': get_setting(config, 'ai.person_detection.min_neighbors', 2),
+            'win_stride': get_setting(config, 'ai.person_detection.win_stride', 8)
+        },
+        'detection': {
+            'fps': get_setting(config, 'ai.inference.target_fps', 5),
+            'backend': ai_settings.get('backend', 'haar')
+        },
+        'tracking': {
+            'enabled': get_setting(config, 'ai.tracking.enabled', False),
+            'idle_fps': get_setting(config, 'ai.tracking.idle_fps', 1.0),
+            'iou_threshold': get_setting(config, 'ai.tracking.iou_threshold', 0.3),
+            'min_hits': get_setting(config, 'ai.tracking.min_hits', 2),
+            'max_age': get_setting(config, 'ai.tracking.max_age', 2.0),
+            'adaptive': get_setting(config, 'ai.tracking.adaptive', True),
+            'max_load': get_setting(config, 'ai.tracking.max_load', 1.0)
+        },
+        'recording': {
+            'enabled': get_setting(config, 'system.recording_enabled', True)
+        }
+    }
+
+
+def runs_detection(pipeline):
+    """Whether any object detector is enabled for a camera's pipeline"""
+    backend = pipeline['detection']['backend']
+    if backend == 'none':
+        return False
+    return backend == 'dnn' or pipeline['faces']['enabled'] or pipeline['people']['enabled']
+
+
+def describe(pipeline):
+    """Short list of a pipeline's running stages, for status output"""
+    stages = [f"analysis {pipeline['analysis']['fps'] or 'all'} FPS @ {pipeline['analysis']['width']}px"]
+    if pipeline['motion']['enabled']:
+        stages.append('motion')
+    if runs_detection(pipeline):
+        if pipeline['detection']['backend'] == 'dnn':
+            detectors = 'dnn'
+        else:
+            detectors = '+'.join(name for name in ('faces', 'people') if pipeline[name]['enabled'])
+        stages.append(f"{detectors} {pipeline['detection']['fps']:.3g} FPS")
+    if pipeline['tracking']['enabled']:
+        stages.append('tracking')
+    if pipeline['recording']['enabled']:
+        stages.append('recording')
+    return ', '.join(stages)
+
+
+class PipelineConfig:
+    """Per-camera pipelines resolved from both config files.
+
+    Each camera starts from the global stage settings in default_config.yaml,
+    then applies its flat keys (analysis_fps, detector, ...) and its
+    `pipeline` block from config.yaml. A stage can be given as a mapping of
+    settings or just true/false. Global limits in `pipeline.limits` cap
+    rates and resolution, and share a total detection budget between
+    cameras. The whole configuration is validated on construction.
+    """
+
+    def __init__(self, config, camera_config):
+        self.ai_settings = camera_config.get('ai_settings') or {}
+        self.defaults = default_pipeline(config, self.ai_settings)
+        self.limits = get_setting(config, 'pipeline.limits', {}) or {}
+        self.camera_fps = get_setting(config, 'ai.inference.camera_fps', {}) or {}
+        self.camera_entries = camera_config.get('cameras') or []
+        self.cameras = {camera['url']: camera for camera in self.camera_entries
+                        if isinstance(camera, dict) and camera.get('url')}
+        errors = self.validate()
+        if errors:
+            raise PipelineConfigError("Invalid pipeline configuration:\n  " + "\n  ".join(errors))
+
+    def validate(self):
+        errors = []
+        for stage, settings in self.defaults.items():
+            errors.extend(check_stage('defaults', stage, settings))
+        if not isinstance(self.limits, dict):
+            errors.append("pipeline.limits must be a mapping")
+        else:
+            for key, value in self.limits.items():
+                check = LIMITS.get(key)
+                problem = check(value) if check else 'is not a known limit'
+                if problem:
+                    errors.append(f"pipeline.limits.{key} {problem}")
+        if not isinstance(self.camera_fps, dict):
+            errors.append("ai.inference.camera_fps must be a mapping of camera URL to FPS")
+            self.camera_fps = {}
+        else:
+            for url, fps in self.camera_fps.items():
+                problem = SCHEMA['detection']['fps'](fps)
+                if problem:
+                    errors.append(f"ai.inference.camera_fps[{url}] {problem}")
+
+        for position, camera in enumerate(self.camera_entries, 1):
+            if not isinstance(camera, dict) or not camera.get('url'):
+                errors.append(f"camera {position}: needs a url")
+                continue
+            label = f"camera {camera.get('name') or position}"
+            # The merged pipeline is only checked once every part of it is valid
+            found = len(errors)
+            for key in sorted(set(camera) - CAMERA_KEYS):
+                errors.append(f"{label}: unknown setting {key}")
+            for key, (stage, setting) in LEGACY_KEYS.items():
+                if key in camera:
+                    problem = SCHEMA[stage][setting](camera[key])
+                    if problem:
+                        errors.append(f"{label}: {key} {problem}")
+
+            block = camera.get('pipeline') or {}
+            if not isinstance(block, dict):
+                errors.append(f"{label}: pipeline must be a mapping of stages")
+                continue
+            for stage, value in block.items():
+                if stage not in SCHEMA:
+                    errors.append(f"{label}: unknown pipeline stage {stage}")
+                elif isinstance(value, bool):
+                    if 'enabled' not in SCHEMA[stage]:
+                        errors.append(f"{label}: pipeline stage {stage} can't be switched off")
+                elif not isinstance(value, dict):
+                    errors.append(f"{label}: pipeline.{stage} must be true, false or a mapping")
+                else:
+                    errors.extend(check_stage(label, f"pipeline.{stage}", value, SCHEMA[stage]))
+            if len(errors) > found:
+                continue
+
+            try:
+                pipeline = self._merge(camera['url'])
+            except PipelineConfigError as e:
+                errors.append(f"{label}: {str(e)}")
+                continue
+            if pipeline['detection']['backend'] == 'dnn' and not self.ai_settings.get('model_path'):
+                errors.append(f"{label}: uses the dnn detector but ai_settings.model_path is not set")
+        return errors
+
+    def _merge(self, url):
+        pipeline = copy.deepcopy(self.defaults)
+        camera = self.cameras.get(url, {})
+        if url in self.camera_fps:
+            pipeline['detection']['fps'] = self.camera_fps[url]
+        for key, (stage, setting) in LEGACY_KEYS.items():
+            if key in camera:
+                pipeline[stage][setting] = camera[key]
+        block = camera.get('pipeline') or {}
+        if not isinstance(block, dict):
+            raise PipelineConfigError("pipeline must be a mapping of stages")
+        for stage, value in block.items():
+            if stage not in SCHEMA:
+                raise PipelineConfigError(f"unknown pipeline stage {stage}")
+            if isinstance(value, bool):
+                pipeline[stage]['enabled'] = value
+            elif isinstance(value, dict):
+                pipeline[stage].update(value)
+            else:
+                raise PipelineConfigError(f"pipeline.{stage} must be true, false or a mapping")
+        pipeline['substream'] = camera.get('substream')
+        pipeline['exclusion_zones'] = camera.get('exclusion_zones') or []
+        return pipeline
+
+    def camera(self, url):
+        """Resolved pipeline for one camera, with the per-camera limits applied"""
+        pipeline = self._merge(url)
+        analysis, detection = pipeline['analysis'], pipeline['detection']
+        max_fps = self.limits.get('max_analysis_fps')
+        if max_fps:
+            analysis['fps'] = min(analysis['fps'] or max_fps, max_fps)
+        max_width = self.limits.get('max_analysis_width')
+        if max_width:
+            analysis['width'] = min(analysis['width'] or max_width, max_width)
+        max_detection_fps = self.limits.get('max_detection_fps')
+        if max_detection_fps:
+            detection['fps'] = min(detection['fps'], max_detection_fps)
+        return pipeline
+
+    def resolve(self, urls):
+        """Pipelines for a set of running cameras, sharing the total detection budget"""
+        pipelines = {url: self.camera(url) for url in urls}
+        budget = self.limits.get('total_detection_fps')
+        detecting = [pipeline for pipeline in pipelines.values() if runs_detection(pipeline)]
+        total = sum(pipeline['detection']['fps'] for pipeline in detecting)
+        if budget and total > budget:
+            for pipeline in detecting:
+                pipeline['detection']['fps'] *= budget / total
+        return pipelines
+
+
+def check_stage(label, name, settings, schema=None):
+    schema = schema or SCHEMA[name]
+    errors = []
+    for key, value in settings.items():
+        check = schema.get(key)
+        problem = check(value) if check else 'is not a known setting'
+        if problem:
+            errors.append(f"{label}: {name}.{key} {problem}")
+    return errors
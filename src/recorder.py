@@ -0,0 +1,218 @@
+import cv2
+import re
+import time
+import queue
+import threading
+import logging
+from collections import deque
+from pathlib import Path
+from urllib.parse import urlsplit
+from overlay import render_overlays
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def camera_slug(url):
+    """Filesystem-safe camera identifier derived from its URL, without credentials"""
+    parts = urlsplit(url)
+    name = parts.hostname or url
+    if parts.port:
+        name += f"_{parts.port}"
+    name += parts.path
+    return re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') or 'camera'
+
+
+class RecordingWriter:
+    """Dedicated thread that owns a camera's VideoWriter, fed through a bounded queue.
+
+    The capture thread never touches the disk. At most `max_queue` frames
+    wait for the writer; beyond that frames are dropped and counted instead
+    of stalling capture. Open and close commands don't count towards that
+    limit, so they never block either, and still arrive in order.
+    `on_close(path, last_timestamp)` runs when a clip is closed and when one
+    fails to open; `last_timestamp` is None if no frame was written.
+    """
+
+    def __init__(self, name, max_queue=64, fourcc='XVID', overlays=True, on_close=None, camera=None):
+        self.name = name
+        self.camera = camera or name
+        self.on_close = on_close
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.overlays = overlays
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue()
+        self._frame_slots = threading.Semaphore(max_queue)
+        self._thread = threading.Thread(target=self._write_loop, name=f"writer-{name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def open(self, path, fps, size):
+        self._queue.put(('open', (path, fps, size)))
+
+    def write(self, frame, overlays=(), timestamp=None):
+        if not self._frame_slots.acquire(blocking=False):
+            self.dropped += 1
+            metrics.count(self.camera, 'record_dropped')
+            return False
+        self._queue.put(('write', (frame, overlays, timestamp)))
+        return True
+
+    def close(self):
+        self._queue.put(('close', None))
+
+    def stop(self):
+        self._queue.put(('stop', None))
+        self._thread.join(timeout=5)
+
+    def _write_loop(self):
+        out = None
+        path = None
+        last_timestamp = None
+        while True:
+            command, args = self._queue.get()
+            try:
+                if command == 'open':
+                    if out is not None:
+                        out.release()
+                    path, fps, size = args
+                    last_timestamp = None
+                    Path(path).parent.mkdir(parents=True, exist_ok=True)
+                    out = cv2.VideoWriter(str(path), self.fourcc, fps, size)
+                    if not out.isOpened():
+                        logger.error(f"Could not open recording {path}")
+                        out = None
+                        if self.on_close is not None:
+                            self.on_close(path, None)
+                    else:
+                        logger.info(f"Started recording: {path} at {fps:.1f} FPS")
+                elif command == 'write':
+                    self._frame_slots.release()
+                    if out is not None:
+                        frame, overlays, timestamp = args
+                        last_timestamp = timestamp
+                        if self.overlays:
+                            with metrics.timer(self.camera, 'overlay'):
+                                frame = render_overlays(frame, overlays, timestamp)
+                        with metrics.timer(self.camera, 'record'):
+                            out.write(frame)
+                        self.written += 1
+                        metrics.gauge(self.camera, 'record_queue_depth', self._queue.qsize())
+                elif command == 'close':
+                    if out is not None:
+                        out.release()
+                        out = None
+                        logger.info(f"Stopped recording: {path}")
+                        if self.on_close is not None:
+                            self.on_close(path, last_timestamp)
+                elif command == 'stop':
+                    break
+            except Exception as e:
+                logger.error(f"Error writing recording for {self.name}: {str(e)}")
+
+        if out is not None:
+            out.release()
+
+
+class MotionRecorder:
+    """Per-camera motion recording with pre-roll and post-roll hysteresis.
+
+    The last `pre_roll` seconds of frames are held by reference in a bounded
+    buffer and flushed into the clip when motion starts. The clip stays open
+    until no motion has been seen for `post_roll` seconds, so brief pauses
+    don't split an event into many small files.
+    """
+
+    def __init__(self, camera, recording_dir, pre_roll=2.0, post_roll=5.0, default_fps=20.0,
+                 max_fps=60, max_queue=64, fourcc='XVID', extension='avi', overlays=True, index=None,
+                 copy_frames=False, enabled=True):
+        self.camera = camera
+        self.copy_frames = copy_frames
+        # Switched by the camera's pipeline; while off no frames are buffered
+        self.enabled = enabled
+        self.camera_id = camera_slug(camera)
+        self.index = index
+        self.recording_dir = Path(recording_dir) / self.camera_id
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.default_fps = default_fps
+        self.extension = extension
+        self.recording = False
+        self.clip_path = None
+        self.clips = 0
+        self._buffer = deque(maxlen=max(1, int(pre_roll * max_fps)))
+        self._last_motion = 0.0
+        # The whole pre-roll is queued at once when a clip starts, so leave
+        # room for it on top of the normal backlog allowance
+        self.writer = RecordingWriter(self.camera_id, max_queue + self._buffer.maxlen, fourcc, overlays,
+                                      on_close=self._on_clip_closed if index is not None else None,
+                                      camera=camera)
+
+    @property
+    def dropped(self):
+        return self.writer.dropped
+
+    def _measured_fps(self, source_fps):
+        if source_fps and source_fps > 0:
+            return source_fps
+        if len(self._buffer) > 1:
+            span = self._buffer[-1][2] - self._buffer[0][2]
+            if span > 0:
+                return (len(self._buffer) - 1) / span
+        return self.default_fps
+
+    def update(self, frame, overlays, timestamp, motion_detected, source_fps=None):
+        """Feed one frame; starts, extends or ends the current clip"""
+        if not self.enabled:
+            if self.recording:
+                self._stop()
+            self._buffer.clear()
+            return
+        if self.copy_frames:
+            frame = frame.copy()
+        if motion_detected:
+            self._last_motion = timestamp
+            if not self.recording:
+                self._start(frame, timestamp, source_fps)
+
+        if not self.recording:
+            self._buffer.append((frame, overlays, timestamp))
+            while self._buffer and timestamp - self._buffer[0][2] > self.pre_roll:
+                self._buffer.popleft()
+            return
+
+        self.writer.write(frame, overlays, timestamp)
+        if timestamp - self._last_motion > self.post_roll:
+            self._stop()
+
+    def _start(self, frame, timestamp, source_fps):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(timestamp))
+        self.clip_path = self.recording_dir / f"motion_{stamp}.{self.extension}"
+        fps = self._measured_fps(source_fps)
+        self.writer.open(self.clip_path, fps, (frame.shape[1], frame.shape[0]))
+        if self.index is not None:
+            start = self._buffer[0][2] if self._buffer else timestamp
+            self.index.add_segment(self.camera_id, self.clip_path, start, 'transcode')
+        for buffered in self._buffer:
+            self.writer.write(*buffered)
+        self._buffer.clear()
+        self.recording = True
+        self.clips += 1
+
+    def _on_clip_closed(self, path, end_timestamp):
+        # A clip that failed to open or got no frames still needs an end, or
+        # retention never sees its row
+        self.index.finish_segment(path, end_timestamp or time.time())
+
+    def _stop(self):
+        self.writer.close()
+        self.recording = False
+
+    def stop(self):
+        if self.recording:
+            self._stop()
+        self.writer.stop()
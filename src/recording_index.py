@@ -0,0 +1,371 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE,
+    mode TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    detections INTEGER NOT NULL DEFAULT 0,
+    has_person INTEGER NOT NULL DEFAULT 0,
+    has_face INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS segments_camera_time ON segments (camera, start_ts);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    camera TEXT NOT NULL,
+    ts REAL NOT NULL,
+    type TEXT NOT NULL,
+    label TEXT,
+    score REAL,
+    boxes TEXT
+);
+CREATE INDEX IF NOT EXISTS events_camera_time ON events (camera, ts);
+
+CREATE TABLE IF NOT EXISTS motion (
+    camera TEXT NOT NULL,
+    second INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (camera, second)
+);
+"""
+
+
+class EventTracker:
+    """Turn a camera's stream of per-frame analyses into sparse index events.
+
+    Emits motion start/end transitions, one event per new detection set
+    (detections arrive at the scheduler's rate, not per frame), track
+    enter/exit events, and the peak motion score for each second.
+    """
+
+    def __init__(self):
+        self._motion = False
+        self._last_detection_seq = None
+        self._last_event_seq = None
+        self._second = None
+        self._second_score = 0.0
+
+    def update(self, analysis, timestamp):
+        events = []
+
+        motion = analysis.motion_detected
+        score = analysis.motion.score if analysis.motion is not None else 0.0
+        if motion != self._motion:
+            self._motion = motion
+            events.append({
+                'ts': timestamp,
+                'type': 'motion_start' if motion else 'motion_end',
+                'score': round(score, 4),
+                'boxes': [list(box) for box in analysis.motion.regions] if motion else []
+            })
+
+        second = int(timestamp)
+        if second != self._second:
+            if self._second is not None and self._second_score > 0:
+                events.append({'ts': float(self._second), 'type': 'motion_score',
+                               'score': round(self._second_score, 4)})
+            self._second = second
+            self._second_score = 0.0
+        self._second_score = max(self._second_score, score)
+
+        detections = analysis.detections
+        if detections and detections[0].seq != self._last_detection_seq:
+            self._last_detection_seq = detections[0].seq
+            events.append({
+                'ts': timestamp,
+                'type': 'detection',
+                'detections': [{'label': d.label, 'box': list(d.box), 'score': round(d.score, 3)}
+                               for d in detections]
+            })
+
+        # The same analysis is handed out for skipped frames, so only take
+        # its track events once
+        if analysis.events and analysis.seq != self._last_event_seq:
+            self._last_event_seq = analysis.seq
+            events.extend(analysis.events)
+
+        return events
+
+
+class RecordingIndex:
+    """Embedded SQLite index of recorded segments, events and per-second motion.
+
+    Writes are queued and committed in batches by a background thread, so
+    recorders and capture threads never wait on the database. Reads use a
+    connection per thread; WAL mode lets the web server query while the
+    recorder writes.
+    """
+
+    def __init__(self, recording_dir, max_queue=10000):
+        self.path = Path(recording_dir) / INDEX_FILE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dropped = 0
+        self._local = threading.local()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._writer = None
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # Writes
+
+    def start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name='recording-index', daemon=True)
+            self._writer.start()
+        return self
+
+    def stop(self):
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=10)
+            self._writer = None
+
+    def _submit(self, operation, *args):
+        try:
+            self._queue.put_nowait((operation, args))
+        except queue.Full:
+            self.dropped += 1
+
+    def add_segment(self, camera, path, start_ts, mode):
+        self._submit(self._add_segment, camera, str(path), start_ts, mode)
+
+    def finish_segment(self, path, end_ts, size=None):
+        self._submit(self._finish_segment, str(path), end_ts, size)
+
+    def add_events(self, camera, events):
+        if events:
+            self._submit(self._add_events, camera, events)
+
+    def finish_stale_segments(self):
+        """Close segments left open by a crash, ending them at the file's mtime.
+
+        Call at startup, before any recorder opens a clip. Retention only
+        considers finished segments, so these would otherwise be kept forever.
+        """
+        rows = self._connect().execute("SELECT path, start_ts FROM segments WHERE end_ts IS NULL").fetchall()
+        for row in rows:
+            try:
+                end_ts = max(os.path.getmtime(row['path']), row['start_ts'])
+            except OSError:
+                end_ts = row['start_ts']
+            self.finish_segment(row['path'], end_ts)
+        if rows:
+            logger.info(f"Closed {len(rows)} segments left open by an earlier run")
+        return len(rows)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Group whatever else is waiting into the same transaction
+            while len(batch) < 500:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                with conn:
+                    for operation, args in batch:
+                        operation(conn, *args)
+            except Exception as e:
+                logger.error(f"Error writing recording index: {str(e)}")
+
+    def _add_segment(self, conn, camera, path, start_ts, mode):
+        conn.execute(
+            "INSERT OR IGNORE INTO segments (camera, path, mode, start_ts) VALUES (?, ?, ?, ?)",
+            (camera, path, mode, start_ts)
+        )
+
+    def _finish_segment(self, conn, path, end_ts, size):
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+        conn.execute("UPDATE segments SET end_ts = ?, bytes = ? WHERE path = ?", (end_ts, size, path))
+        # Summarize the detections that fall inside the segment
+        conn.execute("""
+            UPDATE segments SET
+                detections = (SELECT COUNT(*) FROM events e
+                              WHERE e.camera = segments.camera AND e.type = 'detection'
+                                AND e.ts BETWEEN segments.start_ts AND segments.end_ts),
+                has_person = EXISTS (SELECT 1 FROM events e
+                              WHERE e.camera = segments.camera AND e.label = 'Person'
+                                AND e.ts BETWEEN segments.start_ts AND segments.end_ts),
+                has_face = EXISTS (SELECT 1 FROM events e
+                              WHERE e.camera = segments.camera AND e.label = 'Face'
+                                AND e.ts BETWEEN segments.start_ts AND segments.end_ts)
+            WHERE path = ?
+        """, (path,))
+
+    def _add_events(self, conn, camera, events):
+        for event in events:
+            if event['type'] == 'motion_score':
+                conn.execute(
+                    "INSERT INTO motion (camera, second, score) VALUES (?, ?, ?) "
+                    "ON CONFLICT (camera, second) DO UPDATE SET score = MAX(score, excluded.score)",
+                    (camera, int(event['ts']), event['score'])
+                )
+            elif event['type'] == 'detection':
+                conn.executemany(
+                    "INSERT INTO events (camera, ts, type, label, score, boxes) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(camera, event['ts'], 'detection', d['label'], d['score'], json.dumps([d['box']]))
+                     for d in event['detections']]
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO events (camera, ts, type, label, score, boxes) VALUES (?, ?, ?, ?, ?, ?)",
+                    (camera, event['ts'], event['type'], event.get('label', 'Motion'), event.get('score'),
+                     json.dumps(event.get('boxes', [])))
+                )
+
+    # Reads
+
+    def query_events(self, camera=None, start=None, end=None, event_type=None, label=None, limit=1000):
+        sql = "SELECT camera, ts, type, label, score, boxes FROM events WHERE 1=1"
+        params = []
+        if camera is not None:
+            sql += " AND camera = ?"
+            params.append(camera)
+        if start is not None:
+            sql += " AND ts >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND ts <= ?"
+            params.append(end)
+        if event_type is not None:
+            sql += " AND type = ?"
+            params.append(event_type)
+        if label is not None:
+            sql += " AND label = ?"
+            params.append(label)
+        sql += " ORDER BY ts LIMIT ?"
+        params.append(limit)
+        return [dict(row, boxes=json.loads(row['boxes'] or '[]'))
+                for row in self._connect().execute(sql, params)]
+
+    def query_segments(self, camera=None, start=None, end=None, limit=1000):
+        sql = "SELECT * FROM segments WHERE 1=1"
+        params = []
+        if camera is not None:
+            sql += " AND camera = ?"
+            params.append(camera)
+        if start is not None:
+            sql += " AND COALESCE(end_ts, start_ts) >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND start_ts <= ?"
+            params.append(end)
+        sql += " ORDER BY start_ts LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def get_segment(self, segment_id):
+        row = self._connect().execute("SELECT * FROM segments WHERE id = ?", (segment_id,)).fetchone()
+        return dict(row) if row else None
+
+    def segment_at(self, camera, ts):
+        """Find the segment covering a moment, for seeking to an event"""
+        row = self._connect().execute(
+            "SELECT * FROM segments WHERE camera = ? AND start_ts <= ? ORDER BY start_ts DESC LIMIT 1",
+            (camera, ts)
+        ).fetchone()
+        if row is None or (row['end_ts'] is not None and row['end_ts'] < ts):
+            return None
+        return dict(row)
+
+    def motion_scores(self, camera, start, end):
+        rows = self._connect().execute(
+            "SELECT second, score FROM motion WHERE camera = ? AND second BETWEEN ? AND ? ORDER BY second",
+            (camera, int(start), int(end))
+        )
+        return [(row['second'], row['score']) for row in rows]
+
+    # Retention
+
+    def usage_by_camera(self):
+        """Bytes stored per camera, from the index rather than the filesystem"""
+        rows = self._connect().execute("SELECT camera, SUM(bytes) AS bytes FROM segments GROUP BY camera")
+        return {row['camera']: row['bytes'] or 0 for row in rows}
+
+    def bytes_written_since(self, since):
+        row = self._connect().execute(
+            "SELECT COALESCE(SUM(bytes), 0) AS bytes FROM segments WHERE end_ts >= ?", (since,)
+        ).fetchone()
+        return row['bytes']
+
+    def oldest_segment_time(self, camera=None):
+        if camera is None:
+            row = self._connect().execute("SELECT MIN(start_ts) AS ts FROM segments").fetchone()
+        else:
+            row = self._connect().execute("SELECT MIN(start_ts) AS ts FROM segments WHERE camera = ?",
+                                          (camera,)).fetchone()
+        return row['ts']
+
+    def expired_segments(self, motion_cutoff, detection_cutoff, limit=500):
+        """Finished segments older than their retention period"""
+        rows = self._connect().execute("""
+            SELECT * FROM segments
+            WHERE end_ts IS NOT NULL
+              AND ((has_person = 0 AND has_face = 0 AND end_ts < ?) OR end_ts < ?)
+            ORDER BY start_ts LIMIT ?
+        """, (motion_cutoff, detection_cutoff, limit))
+        return [dict(row) for row in rows]
+
+    def deletion_candidates(self, camera=None, limit=100, protect_detections_after=None):
+        """Finished segments in deletion order: motion-only before detections, oldest first.
+        Segments with detections that start after `protect_detections_after` are left out."""
+        sql = "SELECT * FROM segments WHERE end_ts IS NOT NULL"
+        params = []
+        if camera is not None:
+            sql += " AND camera = ?"
+            params.append(camera)
+        if protect_detections_after is not None:
+            sql += " AND NOT ((has_person OR has_face) AND start_ts >= ?)"
+            params.append(protect_detections_after)
+        sql += " ORDER BY (has_person OR has_face), start_ts LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def delete_segments(self, segment_ids):
+        conn = self._connect()
+        with conn:
+            conn.executemany("DELETE FROM segments WHERE id = ?", [(i,) for i in segment_ids])
+
+    def prune_events(self, before):
+        """Drop events and motion scores older than anything still kept"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM events WHERE ts < ?", (before,))
+            conn.execute("DELETE FROM motion WHERE second < ?", (int(before),))
@@ -0,0 +1,190 @@
+import os
+import time
+import shutil
+import threading
+import logging
+from pathlib import Path
+from config_loader import get_setting
+from passthrough_recorder import EVENTS_FILE, compact_events
+from recorder import camera_slug
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+DAY = 86400
+
+
+def build_retention(index, recording_dir, config):
+    """RetentionManager with the ai.recording age limits and storage budgets from config"""
+    camera_budgets = get_setting(config, 'ai.recording.storage.camera_budgets_gb', {}) or {}
+    return RetentionManager(
+        index,
+        recording_dir,
+        max_age_days=get_setting(config, 'ai.recording.retention_days', 7),
+        detection_max_age_days=get_setting(config, 'ai.recording.detection_retention_days', 30),
+        global_budget_bytes=int(get_setting(config, 'ai.recording.storage.global_budget_gb', 0) * GB),
+        camera_budget_bytes=int(get_setting(config, 'ai.recording.storage.camera_budget_gb', 0) * GB),
+        camera_budgets={camera_slug(url): int(gb * GB) for url, gb in camera_budgets.items()},
+        min_free_bytes=int(get_setting(config, 'ai.recording.storage.min_free_gb', 2) * GB),
+        interval=get_setting(config, 'ai.recording.storage.check_interval', 60),
+        detection_floor_hours=get_setting(config, 'ai.recording.storage.detection_floor_hours', 24)
+    )
+
+
+class RetentionManager:
+    """Background service that keeps the recordings directory within its budgets.
+
+    Deletions are planned from the recording index, not by walking the
+    directory. Segments are removed when they pass their maximum age, and
+    while a per-camera or global byte budget (or the minimum free disk
+    space) is exceeded. Motion-only segments are removed before segments
+    with person or face detections, and within each group the oldest go first.
+    Low disk space can be caused by anything else on the disk, so it never
+    deletes detection segments newer than `detection_floor_hours`. Passthrough
+    event sidecars are compacted to match the segments that remain.
+    """
+
+    def __init__(self, index, recording_dir, max_age_days=7, detection_max_age_days=30,
+                 global_budget_bytes=0, camera_budget_bytes=0, camera_budgets=None,
+                 min_free_bytes=2 * GB, interval=60, detection_floor_hours=24):
+        self.index = index
+        self.recording_dir = recording_dir
+        self.max_age = max_age_days * DAY
+        self.detection_max_age = max(detection_max_age_days, max_age_days) * DAY
+        self.global_budget = global_budget_bytes
+        self.camera_budget = camera_budget_bytes
+        self.camera_budgets = camera_budgets or {}
+        self.min_free = min_free_bytes
+        self.detection_floor = detection_floor_hours * 3600
+        self.interval = interval
+        self.deleted_segments = 0
+        self.deleted_bytes = 0
+        self._trimmed_cameras = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error in retention pass: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def _delete(self, segments):
+        deleted = []
+        for segment in segments:
+            try:
+                os.remove(segment['path'])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Could not delete {segment['path']}: {str(e)}")
+                continue
+            deleted.append(segment['id'])
+            self.deleted_bytes += segment['bytes']
+            self._trimmed_cameras.add(segment['camera'])
+        if deleted:
+            self.index.delete_segments(deleted)
+            self.deleted_segments += len(deleted)
+        return len(deleted)
+
+    def _trim(self, camera, excess, protect_detections_after=None):
+        """Delete lowest-priority segments until `excess` bytes are freed"""
+        freed = 0
+        while freed < excess:
+            batch = []
+            candidates = self.index.deletion_candidates(camera, protect_detections_after=protect_detections_after)
+            for segment in candidates:
+                batch.append(segment)
+                freed += segment['bytes']
+                if freed >= excess:
+                    break
+            if not batch or not self._delete(batch):
+                break
+        return freed
+
+    def run_once(self):
+        now = time.time()
+
+        # Age limits first; they apply regardless of space
+        while True:
+            expired = self.index.expired_segments(now - self.max_age, now - self.detection_max_age)
+            if not expired or not self._delete(expired):
+                break
+
+        usage = self.index.usage_by_camera()
+        for camera, used in usage.items():
+            budget = self.camera_budgets.get(camera, self.camera_budget)
+            if budget and used > budget:
+                logger.info(f"Camera {camera} over budget by {(used - budget) / GB:.2f} GB")
+                self._trim(camera, used - budget)
+
+        excess = self._global_excess()
+        if excess > 0:
+            logger.info(f"Recordings over global budget by {excess / GB:.2f} GB")
+            self._trim(None, excess)
+
+        shortfall = self._free_shortfall()
+        if shortfall > 0:
+            logger.info(f"Free disk space {shortfall / GB:.2f} GB below the minimum")
+            freed = self._trim(None, shortfall, protect_detections_after=now - self.detection_floor)
+            if freed < shortfall:
+                logger.warning(f"Disk still short of free space; detection recordings from the last "
+                               f"{self.detection_floor / 3600:.0f} h are kept")
+
+        oldest = self.index.oldest_segment_time()
+        self.index.prune_events(min(oldest or now, now - self.detection_max_age))
+        self._compact_sidecars(now)
+
+    def _compact_sidecars(self, now):
+        """Drop sidecar events from before each trimmed camera's oldest remaining segment"""
+        cameras, self._trimmed_cameras = self._trimmed_cameras, set()
+        for camera in cameras:
+            path = Path(self.recording_dir) / camera / EVENTS_FILE
+            if path.exists():
+                try:
+                    compact_events(path, self.index.oldest_segment_time(camera) or now)
+                except Exception as e:
+                    logger.error(f"Error compacting {path}: {str(e)}")
+
+    def _global_excess(self):
+        if not self.global_budget:
+            return 0
+        return sum(self.index.usage_by_camera().values()) - self.global_budget
+
+    def _free_shortfall(self):
+        return self.min_free - shutil.disk_usage(self.recording_dir).free
+
+    def usage(self, window=3600):
+        """Current usage and projected time until the budget or disk is full"""
+        cameras = self.index.usage_by_camera()
+        used = sum(cameras.values())
+        free = shutil.disk_usage(self.recording_dir).free
+        available = free - self.min_free
+        if self.global_budget:
+            available = min(available, self.global_budget - used)
+
+        rate = self.index.bytes_written_since(time.time() - window) / window
+        time_to_full = max(0, available) / rate if rate > 0 else None
+
+        return {
+            'used_bytes': used,
+            'free_bytes': free,
+            'available_bytes': max(0, available),
+            'global_budget_bytes': self.global_budget,
+            'cameras': cameras,
+            'write_rate_bytes_per_sec': rate,
+            'time_to_full_seconds': time_to_full,
+            'deleted_segments': self.deleted_segments,
+            'deleted_bytes': self.deleted_bytes
+        }
@@ -0,0 +1,86 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+HEADER_FIELDS = 5  # seq, height, width, channels, timestamp (microseconds)
+
+
+class SharedFrameRing:
+    """Fixed ring of frame slots in shared memory, written by one process and read by others.
+
+    The parent creates the ring and the camera worker attaches by name.
+    Writing costs a single copy of the decoded frame into its slot. Readers
+    get NumPy views straight onto the shared buffer, so frames are never
+    pickled or copied in transit. A slot's seq is set to -1 while it is
+    being written, so a reader can tell a finished frame from a torn one.
+    Views stay valid only until the writer wraps around to that slot again,
+    which is `slots` frames later; read with copy=True for a frame that is
+    kept or handed on beyond that.
+    """
+
+    def __init__(self, name=None, slots=32, max_shape=(1080, 1920, 3), create=False):
+        self.slots = slots
+        self.max_shape = tuple(max_shape)
+        self.slot_bytes = int(np.prod(self.max_shape))
+        header_bytes = slots * HEADER_FIELDS * 8
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                                  size=header_bytes + slots * self.slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.owner = create
+        self._header = np.ndarray((slots, HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+        self._data = np.ndarray((slots, self.slot_bytes), dtype=np.uint8, buffer=self.shm.buf,
+                                offset=header_bytes)
+        if create:
+            self._header[:, 0] = -1
+
+    def fits(self, frame):
+        return frame.size <= self.slot_bytes and frame.dtype == np.uint8
+
+    def write(self, seq, frame, timestamp):
+        """Copy a frame into its slot; the caller makes sure it fits"""
+        slot = seq % self.slots
+        header = self._header[slot]
+        header[0] = -1
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        np.copyto(self._data[slot, :frame.size].reshape(frame.shape), frame)
+        header[1:5] = (height, width, channels, int(timestamp * 1e6))
+        header[0] = seq
+        return slot
+
+    def read(self, seq, copy=False):
+        """View of the frame with the given seq, or None if it was overwritten.
+
+        With copy=True the frame is copied out and the slot's seq checked again
+        afterwards, so the result can't be torn by a concurrent write and stays
+        valid however long it is held.
+        """
+        slot = seq % self.slots
+        header = self._header[slot]
+        if header[0] != seq:
+            return None
+        height, width, channels = (int(v) for v in header[1:4])
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        view = self._data[slot, :height * width * channels].reshape(shape)
+        if copy:
+            frame = view.copy()
+            return frame if header[0] == seq else None
+        view.flags.writeable = False
+        return view
+
+    def close(self):
+        # Drop the views before unmapping, or the buffer is still exported
+        self._header = None
+        self._data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A consumer still holds a view; the mapping goes away with the process
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,142 @@
+import itertools
+from detections import Detection
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+def center(box):
+    x, y, w, h = box
+    return x + w / 2.0, y + h / 2.0
+
+
+class Track:
+    """One object followed across detector runs"""
+    __slots__ = ('track_id', 'label', 'box', 'score', 'hits', 'confirmed',
+                 'first_seen', 'last_seen', 'detected_box', 'predicted_at', 'velocity')
+
+    def __init__(self, track_id, detection, timestamp):
+        self.track_id = track_id
+        self.label = detection.label
+        self.box = detection.box
+        self.score = detection.score
+        self.hits = 1
+        self.confirmed = False
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.detected_box = detection.box
+        self.predicted_at = timestamp
+        self.velocity = (0.0, 0.0)
+
+    def event(self, event_type, timestamp):
+        return {
+            'ts': timestamp,
+            'type': event_type,
+            'label': self.label,
+            'track_id': self.track_id,
+            'score': round(self.score, 3),
+            'boxes': [list(self.box)]
+        }
+
+
+class IoUTracker:
+    """Cheap tracker that carries detections between detector runs.
+
+    Detections are matched to existing tracks of the same label by greedy
+    IoU. Between detector runs, boxes move at each track's last measured
+    velocity, so overlays stay steady instead of flickering at the
+    detection rate. A track becomes confirmed, and gets an enter event,
+    after `min_hits` matches. It is dropped, with an exit event, once it
+    has gone unmatched for `max_age` seconds.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, iou_threshold=0.3, min_hits=2, max_age=2.0, smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        self.min_hits = min_hits
+        self.max_age = max_age
+        self.smoothing = smoothing
+        self.tracks = []
+
+    @property
+    def active(self):
+        return any(track.confirmed for track in self.tracks)
+
+    def predict(self, timestamp):
+        """Move every track to `timestamp` and expire stale ones; returns exit events"""
+        events = []
+        kept = []
+        for track in self.tracks:
+            if timestamp - track.last_seen > self.max_age:
+                if track.confirmed:
+                    events.append(track.event('track_exit', timestamp))
+                continue
+            dt = timestamp - track.predicted_at
+            if dt > 0:
+                x, y, w, h = track.box
+                vx, vy = track.velocity
+                track.box = (int(round(x + vx * dt)), int(round(y + vy * dt)), w, h)
+                track.predicted_at = timestamp
+            kept.append(track)
+        self.tracks = kept
+        return events
+
+    def update(self, detections, timestamp):
+        """Fold in a fresh detector result; returns enter and exit events"""
+        events = self.predict(timestamp)
+
+        pairs = sorted(
+            ((iou(track.box, detection.box), ti, di)
+             for ti, track in enumerate(self.tracks)
+             for di, detection in enumerate(detections)
+             if track.label == detection.label),
+            reverse=True
+        )
+        matched_tracks = set()
+        matched_detections = set()
+        for overlap, ti, di in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if ti in matched_tracks or di in matched_detections:
+                continue
+            matched_tracks.add(ti)
+            matched_detections.add(di)
+            self._match(self.tracks[ti], detections[di], timestamp, events)
+
+        for di, detection in enumerate(detections):
+            if di not in matched_detections:
+                track = Track(next(self._ids), detection, timestamp)
+                self.tracks.append(track)
+                if self.min_hits <= 1:
+                    track.confirmed = True
+                    events.append(track.event('track_enter', timestamp))
+        return events
+
+    def _match(self, track, detection, timestamp, events):
+        dt = timestamp - track.last_seen
+        if dt > 0:
+            (ox, oy), (nx, ny) = center(track.detected_box), center(detection.box)
+            vx, vy = (nx - ox) / dt, (ny - oy) / dt
+            a = self.smoothing
+            track.velocity = (a * vx + (1 - a) * track.velocity[0], a * vy + (1 - a) * track.velocity[1])
+        track.box = track.detected_box = detection.box
+        track.score = detection.score
+        track.last_seen = track.predicted_at = timestamp
+        track.hits += 1
+        if not track.confirmed and track.hits >= self.min_hits:
+            track.confirmed = True
+            events.append(track.event('track_enter', timestamp))
+
+    def detections(self, camera=None, seq=None):
+        """Confirmed tracks as detections carrying their track IDs"""
+        return [Detection(track.label, track.box, track.score, camera, seq, track.track_id)
+                for track in self.tracks if track.confirmed]
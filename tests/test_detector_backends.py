@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+cv2 = pytest.importorskip('cv2')
+np = pytest.importorskip('numpy')
+
+from detector_backends import DetectorBackend, DetectorRouter, NullBackend, dnn_backend
+from dnn_fixture import write_test_model
+
+SQUARE = (24, 24, 16, 16)
+
+
+def make_frame(bright=True):
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    if bright:
+        x, y, w, h = SQUARE
+        frame[y:y + h, x:x + w] = 255
+    return frame
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return write_test_model(tmp_path)
+
+
+def test_backend_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        DetectorBackend()
+
+
+def test_dnn_backend_finds_the_bright_square(settings):
+    backend = dnn_backend(settings)
+    assert backend.load()
+
+    found, empty = backend.analyze_batch([('cam', 1, make_frame()), ('cam', 2, make_frame(bright=False))])
+
+    assert found
+    assert not empty
+    x, y, w, h = SQUARE
+    for detection in found:
+        assert detection.label == 'object'
+        assert (detection.camera, detection.seq) == ('cam', 1)
+        cx = detection.box[0] + detection.box[2] / 2
+        cy = detection.box[1] + detection.box[3] / 2
+        # Allow for the edge cells that the resize to the input size blurs
+        assert x - 4 <= cx <= x + w + 4
+        assert y - 4 <= cy <= y + h + 4
+
+
+def test_router_falls_back_when_a_backend_fails_to_load(settings, tmp_path):
+    router = DetectorRouter(
+        {'none': NullBackend()},
+        {
+            'dnn': lambda: dnn_backend(settings),
+            'broken': lambda: dnn_backend({'model_path': str(tmp_path / 'missing.weights')})
+        },
+        default='dnn',
+        fallback='none'
+    )
+
+    assert router.assign('front') == 'dnn'
+    assert router.assign('back', 'broken') == 'none'
+    assert router.assign('side', 'unknown') == 'none'
+
+    results = router.analyze_batch([('front', 1, make_frame()), ('back', 1, make_frame()), ('side', 1, make_frame())])
+
+    assert results[0]
+    assert results[1] == []
+    assert results[2] == []